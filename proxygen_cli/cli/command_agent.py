@@ -0,0 +1,38 @@
+import functools
+
+import click
+
+from proxygen_cli.lib import agent as lib_agent, transport
+
+
+@click.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    default=None,
+    help=f"Socket to listen on. Defaults to ${lib_agent.SOCKET_ENV_VAR} or ~/.proxygen/agent.sock",
+)
+@click.option(
+    "--foreground",
+    is_flag=True,
+    help="Stay in the foreground instead of forking into the background.",
+)
+def agent(socket_path, foreground):
+    """
+    Run a local token agent.
+
+    The agent keeps access tokens in memory, renews them before they
+    expire and hands them to other proxygen commands over a Unix socket,
+    so they do not each need to log in. It forks into the background and
+    prints the environment variables for finding it, e.g.
+
+        eval $(proxygen agent)
+    """
+    transport.set_deadline(None)
+    path = socket_path or lib_agent.socket_path()
+    if foreground:
+        click.echo(lib_agent.exports(path))
+        lib_agent.serve(path)
+    else:
+        daemonize = functools.partial(lib_agent.daemonize, path)
+        lib_agent.serve(path, before_serving=daemonize)
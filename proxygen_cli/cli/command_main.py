@@ -1,10 +1,13 @@
 import click
 from proxygen_cli.lib.settings import SETTINGS
-from proxygen_cli.lib import proxygen_api, output
+from proxygen_cli.lib import proxygen_api, output, trace, transport
 from proxygen_cli.cli import (
+    command_agent,
     command_credentials,
     command_settings,
     command_instance,
+    command_mock_keycloak,
+    command_mock_server,
     command_spec,
     command_secret,
     command_docker,
@@ -13,8 +16,25 @@ from proxygen_cli.cli import (
 
 @click.group()
 @click.version_option(prog_name="proxygen")  # Automatically adds version option
-def main():
+@click.option(
+    "--trace",
+    "trace_file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write timings of the command's phases and HTTP requests to this JSON file.",
+)
+@click.option(
+    "--trace-har",
+    "har_file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the command's HTTP requests to this HAR file.",
+)
+@click.pass_context
+def main(ctx, trace_file, har_file):
     """Main group"""
+    transport.set_deadline(SETTINGS.command_deadline)
+    if trace_file or har_file:
+        trace.start(ctx.invoked_subcommand)
+        ctx.call_on_close(lambda: trace.finish(trace_file, har_file))
 
 main.add_command(command_settings.settings)
 main.add_command(command_credentials.credentials)
@@ -23,6 +43,9 @@ main.add_command(command_spec.spec)
 main.add_command(command_secret.secret)
 main.add_command(command_docker.docker)
 main.add_command(command_pytest_nhsd_apim_token.pytest_nhsd_apim)
+main.add_command(command_agent.agent)
+main.add_command(command_mock_server.mock_server)
+main.add_command(command_mock_keycloak.mock_keycloak)
 
 @main.command()
 def status():
@@ -0,0 +1,87 @@
+import pathlib
+
+import click
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+
+from proxygen_cli.lib import mock_keycloak as lib_mock_keycloak, transport
+
+
+def _split_pairs(values, what):
+    pairs = {}
+    for value in values:
+        name, sep, rest = value.partition(":")
+        if not sep:
+            raise click.BadParameter(f"Expected {what}, got {value!r}")
+        pairs[name] = rest
+    return pairs
+
+
+def _load_public_key(path):
+    data = pathlib.Path(path).read_bytes()
+    if b"CERTIFICATE" in data:
+        return x509.load_pem_x509_certificate(data).public_key()
+    return serialization.load_pem_public_key(data)
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=9001, show_default=True)
+@click.option("--realm", default="api-producers", show_default=True)
+@click.option("--access-token-lifetime", default=300, show_default=True)
+@click.option("--refresh-token-lifetime", default=1800, show_default=True)
+@click.option("--latency", default=0.0, help="Seconds to delay every response by.")
+@click.option("--jitter", default=0.0, help="Extra random delay of up to this many seconds.")
+@click.option(
+    "--user",
+    "users",
+    multiple=True,
+    help="USERNAME:PASSWORD allowed to log in. Anyone can log in if none are given.",
+)
+@click.option(
+    "--client-key",
+    "client_keys",
+    multiple=True,
+    help="CLIENT_ID:PEM_FILE, a public key or certificate checking that client's assertions.",
+)
+@click.option("--seed", type=int, help="Seed for latency jitter.")
+def mock_keycloak(
+    host,
+    port,
+    realm,
+    access_token_lifetime,
+    refresh_token_lifetime,
+    latency,
+    jitter,
+    users,
+    client_keys,
+    seed,
+):
+    """
+    Run a local stand-in for the Keycloak realm the CLI logs in to.
+
+    It supports user logins, machine user client assertions and refresh
+    tokens, issuing real signed JWTs. Point the CLI at it with
+
+        proxygen credentials set base_url http://127.0.0.1:9001/realms/api-producers
+    """
+    transport.set_deadline(None)
+    config = lib_mock_keycloak.MockKeycloakConfig(
+        realm=realm,
+        access_token_lifetime=access_token_lifetime,
+        refresh_token_lifetime=refresh_token_lifetime,
+        latency=latency,
+        jitter=jitter,
+        users=_split_pairs(users, "USERNAME:PASSWORD"),
+        client_keys={
+            client_id: _load_public_key(path)
+            for client_id, path in _split_pairs(client_keys, "CLIENT_ID:PEM_FILE").items()
+        },
+        seed=seed,
+    )
+    with lib_mock_keycloak.MockKeycloakServer((host, port), config) as server:
+        click.echo(f"Mock Keycloak listening on {server.realm_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,55 @@
+import click
+
+from proxygen_cli.lib import mock_server as lib_mock_server, transport
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=9000, show_default=True)
+@click.option("--latency", default=0.0, help="Seconds to delay every response by.")
+@click.option("--jitter", default=0.0, help="Extra random delay of up to this many seconds.")
+@click.option("--error-rate", default=0.0, help="Fraction of requests that fail.")
+@click.option("--error-status", default=503, show_default=True)
+@click.option("--throttle-rps", type=float, help="Answer 429 above this many requests a second.")
+@click.option("--no-gzip-uploads", is_flag=True, help="Reject gzipped request bodies with 415.")
+@click.option("--chunked", is_flag=True, help="Send responses with chunked encoding.")
+@click.option("--seed", type=int, help="Seed for latency jitter and error injection.")
+def mock_server(
+    host,
+    port,
+    latency,
+    jitter,
+    error_rate,
+    error_status,
+    throttle_rps,
+    no_gzip_uploads,
+    chunked,
+    seed,
+):
+    """
+    Run a local stand-in for the proxygen service.
+
+    APIs, instances, secrets and specs are kept in memory. Point the CLI
+    at it with
+
+        proxygen settings set endpoint_url http://127.0.0.1:9000
+
+    Any bearer token is accepted.
+    """
+    transport.set_deadline(None)
+    config = lib_mock_server.MockServerConfig(
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        error_status=error_status,
+        throttle_rps=throttle_rps,
+        accept_gzip=not no_gzip_uploads,
+        chunked_responses=chunked,
+        seed=seed,
+    )
+    with lib_mock_server.MockProxygenServer((host, port), config) as server:
+        click.echo(f"Mock proxygen listening on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
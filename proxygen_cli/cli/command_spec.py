@@ -4,7 +4,7 @@ import click
 from yaspin import yaspin
 
 from proxygen_cli.lib import output, proxygen_api, spec as lib_spec, \
-      spec_server
+      spec_server, transport
 from proxygen_cli.lib.constants import LITERAL_ENVS
 from proxygen_cli.lib.settings import SETTINGS
 
@@ -89,6 +89,7 @@ def serve(spec_file):
     """
     Serve API spec in <spec_file> locally on port 8008.
     """
+    transport.set_deadline(None)
     print(f"""
     Serving {spec_file} on port 8008.
     To preview go to "https://editor.swagger.io".
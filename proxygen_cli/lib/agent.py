@@ -0,0 +1,248 @@
+"""
+A local token agent, in the style of ssh-agent.
+
+`proxygen agent` holds access tokens in memory for each credentials
+fingerprint (see auth.cache_key) and serves them over a Unix domain
+socket, renewing them ahead of expiry. auth.access_token asks the agent
+first, so many short-lived proxygen processes share one set of tokens
+without each of them touching Keycloak.
+
+The protocol is one JSON object per line. The client sends
+{"cache_key": ..., "min_validity": ...}. The agent replies with
+{"access_token": ..., "exp": ...}, or {"error": "unknown"} when it has
+never seen those credentials, in which case the client sends
+{"credentials": {...}} on the same connection and gets a token back. The
+agent only accepts credentials whose fingerprint is the cache_key sent,
+and never credentials with a token source (credential_process,
+token_file or token_env_var), which only mean anything to the client.
+"""
+import contextlib
+import json
+import os
+import pathlib
+import socket
+import socketserver
+import sys
+import threading
+from time import time
+from typing import Optional, Tuple
+
+from . import auth, dot_proxygen
+from .constants import DEFAULT_REFRESH_FRACTION
+from .credentials import Credentials, get_credentials
+
+SOCKET_ENV_VAR = "PROXYGEN_AGENT_SOCK"
+PID_ENV_VAR = "PROXYGEN_AGENT_PID"
+CLIENT_TIMEOUT = 5
+
+
+def socket_path() -> pathlib.Path:
+    """
+    Return the agent socket path: $PROXYGEN_AGENT_SOCK if set, otherwise
+    agent.sock in the proxygen config directory.
+    """
+    if env_path := os.environ.get(SOCKET_ENV_VAR):
+        return pathlib.Path(env_path)
+    return dot_proxygen.directory().joinpath("agent.sock")
+
+
+def _exchange(f, message):
+    f.write(json.dumps(message).encode() + b"\n")
+    f.flush()
+    line = f.readline()
+    if not line:
+        raise ConnectionError("agent closed the connection")
+    return json.loads(line)
+
+
+def request_token(cache_key: str, min_validity: int) -> Optional[Tuple[str, int]]:
+    """
+    Ask a running agent for a token. Returns (access_token, exp), or None
+    if there is no agent or it could not provide one.
+    """
+    if not hasattr(socket, "AF_UNIX"):  # pragma: no cover
+        return None
+    path = socket_path()
+    if not path.exists():
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CLIENT_TIMEOUT)
+            sock.connect(str(path))
+            with sock.makefile("rwb") as f:
+                reply = _exchange(
+                    f, {"cache_key": cache_key, "min_validity": min_validity}
+                )
+                if reply.get("error") == "unknown":
+                    credentials = json.loads(get_credentials().json())
+                    reply = _exchange(f, {"credentials": credentials})
+    except (OSError, ValueError):
+        return None  # no usable agent, fall back to getting our own token
+
+    if "access_token" not in reply:
+        return None
+    return reply["access_token"], reply["exp"]
+
+
+class TokenAgent:
+    """
+    In-memory tokens for each credentials fingerprint, renewed in a
+    background thread once `fraction` of their lifetime has elapsed.
+    """
+
+    def __init__(self, fraction: float = DEFAULT_REFRESH_FRACTION):
+        self.fraction = fraction
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def token(self, cache_key, min_validity, credentials=None):
+        """
+        Return (access_token, exp) for `cache_key`, or None if the agent
+        has no credentials for it.
+        """
+        entry = self._entries.get(cache_key)
+        if entry is not None and time() + min_validity < entry["exp"]:
+            return entry["access_token"], entry["exp"]
+        if credentials is None:
+            if entry is None:
+                return None
+            credentials = entry["credentials"]
+        return self._acquire(cache_key, int(time()) + min_validity, credentials)
+
+    def _acquire(self, cache_key, needed, credentials):
+        with self._lock:
+            token_data, exp = auth.locked_token_data(cache_key, needed, credentials)
+            issued_at = auth.token_claims(token_data["access_token"]).get(
+                "iat", int(time())
+            )
+            self._entries[cache_key] = {
+                "credentials": credentials,
+                "access_token": token_data["access_token"],
+                "exp": exp,
+                "refresh_at": issued_at + self.fraction * (exp - issued_at),
+            }
+        return token_data["access_token"], exp
+
+    def refresh_due(self):
+        """Renew every token past its refresh point."""
+        for cache_key, entry in list(self._entries.items()):
+            if time() >= entry["refresh_at"]:
+                try:
+                    self._acquire(cache_key, entry["exp"] + 1, entry["credentials"])
+                except Exception:  # retry on the next tick, clients can still log in
+                    entry["refresh_at"] = time() + 5
+
+    def run_refresher(self, interval: float = 1):
+        while not self._stop.wait(interval):
+            self.refresh_due()
+
+    def stop(self):
+        self._stop.set()
+
+
+class _AgentRequestHandler(socketserver.StreamRequestHandler):
+    def _reply(self, message):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+
+    def handle(self):
+        agent = self.server.agent
+        try:
+            request = json.loads(self.rfile.readline())
+            cache_key = request["cache_key"]
+            min_validity = request.get("min_validity", 10)
+
+            token = agent.token(cache_key, min_validity)
+            if token is None:
+                self._reply({"error": "unknown"})
+                followup = json.loads(self.rfile.readline())
+                credentials = Credentials(**followup["credentials"])
+                # The command, file or variable would be the agent's, not the client's
+                if credentials.token_source() is not None:
+                    raise ValueError(
+                        "The agent does not serve tokens from a token source"
+                    )
+                # Otherwise a client could fill the entry for other credentials
+                if auth.credentials_fingerprint(credentials) != cache_key:
+                    raise ValueError("cache_key does not match the credentials")
+                token = agent.token(cache_key, min_validity, credentials)
+            self._reply({"access_token": token[0], "exp": token[1]})
+        except Exception as e:
+            self._reply({"error": str(e)})
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: pathlib.Path, agent: TokenAgent):
+        self.agent = agent
+        path = pathlib.Path(path)
+        if path.exists():
+            if _socket_is_live(path):
+                raise RuntimeError(f"An agent is already listening on {path}")
+            path.unlink()  # stale socket from an agent that died
+        old_umask = os.umask(0o177)  # only our user may talk to the agent
+        try:
+            super().__init__(str(path), _AgentRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+
+def _socket_is_live(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+            return True
+        except OSError:
+            return False
+
+
+def exports(path, pid: Optional[int] = None) -> str:
+    """Shell commands pointing clients at the agent, for `eval`."""
+    lines = [f"{SOCKET_ENV_VAR}={path}; export {SOCKET_ENV_VAR};"]
+    if pid is not None:
+        lines.append(f"{PID_ENV_VAR}={pid}; export {PID_ENV_VAR};")
+    return "\n".join(lines)
+
+
+def daemonize(path):
+    """
+    Fork into the background, as ssh-agent does. The parent prints the
+    exports and exits; the child starts a new session and lets go of the
+    terminal, so that `eval $(proxygen agent)` sees stdout close.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid:
+        print(exports(path, pid), flush=True)
+        os._exit(0)  # leave the socket to the child
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+
+def serve(
+    path: pathlib.Path,
+    fraction: float = DEFAULT_REFRESH_FRACTION,
+    before_serving=None,
+):
+    """
+    Run the agent on `path` until interrupted. `before_serving` is called
+    once the socket is listening, e.g. to daemonize.
+    """
+    agent = TokenAgent(fraction=fraction)
+    with AgentServer(path, agent) as server:
+        if before_serving is not None:
+            before_serving()
+        refresher = threading.Thread(target=agent.run_refresher, daemon=True)
+        refresher.start()
+        try:
+            server.serve_forever()
+        finally:
+            agent.stop()
+            with contextlib.suppress(FileNotFoundError):
+                pathlib.Path(path).unlink()
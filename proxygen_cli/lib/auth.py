@@ -1,79 +1,270 @@
 """Proxygen test utility functions"""
 import hashlib
 import json
+import os
+import pathlib
+import shlex
+import subprocess
+import threading
 import uuid
+from html.parser import HTMLParser
 from time import time
 from urllib.parse import parse_qs, urlparse
 
 import jwt
-import requests
-from lxml import html
 
+from . import agent, trace
+from .constants import DEFAULT_REFRESH_FRACTION
 from .credentials import get_credentials
-from .dot_proxygen import token_cache_file
+from .dot_proxygen import credentials_file, token_cache_file, token_cache_lock_file
+from .locking import atomic_write_text, file_lock
+from .retry import RetrySession
+from .settings import SETTINGS
+
+# In-process memo of the last credentials fingerprint, keyed on where
+# the credentials were loaded from, so we only re-parse them on change.
+_CACHE_KEY_MEMO = None
+
+# In-process memo of the last bearer token: (cache_key, access_token, exp).
+_TOKEN_MEMO = None
+
+# Serialises refreshes between threads; file_lock does the same between processes.
+_REFRESH_LOCK = threading.Lock()
+
+
+def _credentials_stamp():
+    """
+    Cheap stand-in for the credentials contents: the credentials file's
+    identity and the PROXYGEN_CREDENTIALS_* environment variables.
+    """
+    _file = credentials_file()
+    stat = _file.stat()
+    env = tuple(
+        sorted(
+            (key, value)
+            for key, value in os.environ.items()
+            if key.startswith("PROXYGEN_CREDENTIALS_")
+        )
+    )
+    return (str(_file), stat.st_mtime_ns, stat.st_size, env)
+
+
+def credentials_fingerprint(credentials) -> str:
+    """The token cache key for `credentials`."""
+    return hashlib.md5(credentials.json().encode("utf-8")).hexdigest()
 
 
 def cache_key():
-    s = get_credentials().json()
-    return hashlib.md5(s.encode("utf-8")).hexdigest()
+    global _CACHE_KEY_MEMO
+    stamp = _credentials_stamp()
+    if _CACHE_KEY_MEMO is not None and _CACHE_KEY_MEMO[0] == stamp:
+        return _CACHE_KEY_MEMO[1]
+    key = credentials_fingerprint(get_credentials())
+    _CACHE_KEY_MEMO = (stamp, key)
+    return key
+
+
+def clear_token_memo():
+    """Forget any tokens and fingerprints memoized in this process."""
+    global _CACHE_KEY_MEMO, _TOKEN_MEMO
+    _CACHE_KEY_MEMO = None
+    _TOKEN_MEMO = None
+
+
+def _remember(_cache_key, token_data, exp):
+    global _TOKEN_MEMO
+    _TOKEN_MEMO = (_cache_key, token_data["access_token"], exp)
+    return token_data["access_token"]
 
 
 def _read_cache():
-    with token_cache_file().open() as f:
-        try:
+    try:
+        with token_cache_file().open() as f:
             return json.load(f)
-        except json.JSONDecodeError:
-            return {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
 
 
 def _write_cache(cache):
-    with token_cache_file().open("w") as f:
-        return json.dump(cache, f, indent=2)
+    atomic_write_text(token_cache_file(), json.dumps(cache))
 
 
-def access_token():
-    now = int(time()) + 10  # give ourselves some leeway
+def token_claims(token):
+    """Decode a JWT's claims without verifying it."""
+    return jwt.decode(token, options={"verify_signature": False})
 
-    cache = _read_cache()
-    _cache_key = cache_key()
-    token_data = cache.get(_cache_key)
 
-    jwt_decode_options = {"verify_signature": False}
-    if token_data is not None:
-        access_token_payload = jwt.decode(
-            token_data["access_token"], options=jwt_decode_options
-        )
-        if now < access_token_payload["exp"]:
-            return token_data["access_token"]
-        if "refresh_token" in token_data:
-            refresh_token_payload = jwt.decode(
-                token_data["refresh_token"], options=jwt_decode_options
+def _token_exp(token):
+    return token_claims(token)["exp"]
+
+
+def _valid_access_token_exp(token_data, now):
+    """Return the access token's exp if it is still usable at `now`, else None."""
+    if token_data is None:
+        return None
+    exp = _token_exp(token_data["access_token"])
+    return exp if now < exp else None
+
+
+def _new_token_data(token_data, now, credentials=None):
+    """Refresh `token_data` if possible, otherwise do a full login."""
+    CREDENTIALS = credentials or get_credentials()
+    if CREDENTIALS.token_source():
+        # Issuance is owned by whatever mints these tokens, so never go to Keycloak
+        return _get_token_data_from_token_source(credentials)
+
+    if token_data is not None and "refresh_token" in token_data:
+        # Offline tokens may have no expiry, they last until revoked or unused
+        refresh_token_exp = token_claims(token_data["refresh_token"]).get("exp")
+        if not refresh_token_exp or now < refresh_token_exp:
+            # can try doing a refresh
+            new_token_data = _get_token_data_from_refresh_token(
+                token_data["refresh_token"], credentials
             )
-            if now < refresh_token_payload["exp"]:
-                # can try doing a refresh
-                new_token_data = _get_token_data_from_refresh_token(
-                    token_data["refresh_token"]
-                )
-                if new_token_data is not None:
-                    cache[_cache_key] = new_token_data
-                    _write_cache(cache)
-                    return new_token_data["access_token"]
+            if new_token_data is not None:
+                new_token_data.setdefault("refresh_token", token_data["refresh_token"])
+                return new_token_data
 
     # If we get here, no cache hit, or token expired or refresh token call failed.
     # So do full login
-    CREDENTIALS = get_credentials()
     if CREDENTIALS.username and CREDENTIALS.password:
-        token_data = _get_token_data_from_user_login()
-    else:
-        token_data = _get_token_data_from_machine_user()
-    cache[_cache_key] = token_data
-    _write_cache(cache)
-    return token_data["access_token"]
+        return _get_token_data_from_user_login(credentials)
+    return _get_token_data_from_machine_user(credentials)
+
+
+def access_token(min_validity: int = 10):
+    """
+    Return a bearer token valid for at least `min_validity` more seconds,
+    refreshing it or logging in again if needed.
+    """
+    now = int(time())
+    needed = now + min_validity
+    _cache_key = cache_key()
+
+    if _TOKEN_MEMO is not None:
+        memo_key, memo_token, memo_exp = _TOKEN_MEMO
+        if memo_key == _cache_key and needed < memo_exp:
+            return memo_token
+
+    with trace.span("auth.access_token"):
+        # Token sources are resolved in the caller's environment, never the agent's
+        if get_credentials().token_source() is not None:
+            agent_token = None
+        else:
+            agent_token = agent.request_token(_cache_key, min_validity)
+        if agent_token:
+            return _remember(
+                _cache_key, {"access_token": agent_token[0]}, agent_token[1]
+            )
+
+        token_data = _read_cache().get(_cache_key)
+        if exp := _valid_access_token_exp(token_data, needed):
+            return _remember(_cache_key, token_data, exp)
+
+        token_data, exp = locked_token_data(_cache_key, needed)
+        return _remember(_cache_key, token_data, exp)
+
+
+def locked_token_data(_cache_key, needed, credentials=None):
+    """
+    Return (token_data, exp) for `_cache_key` from the token cache, with an
+    access token valid past `needed`, refreshing or logging in if required.
+    """
+    # Single flight: only one thread/process refreshes or logs in at a time.
+    # Whoever waited on the lock re-reads the cache and reuses the winner's token.
+    with _REFRESH_LOCK, file_lock(token_cache_lock_file()):
+        cache = _read_cache()
+        token_data = cache.get(_cache_key)
+        if exp := _valid_access_token_exp(token_data, needed):
+            return token_data, exp
+
+        # give ourselves some leeway
+        token_data = _new_token_data(token_data, int(time()) + 10, credentials)
+        cache[_cache_key] = token_data
+        _write_cache(cache)
+    return token_data, _token_exp(token_data["access_token"])
+
+
+class TokenRefresher:
+    """
+    Renew the access token in a background thread once `fraction` of its
+    lifetime has elapsed, so callers of access_token() never wait on a
+    refresh or login after the first token has been acquired.
+
+        with TokenRefresher():
+            ...  # long running work using proxygen_api
+    """
 
+    def __init__(self, fraction: float = DEFAULT_REFRESH_FRACTION, retry_interval: float = 5):
+        if not 0 < fraction < 1:
+            raise ValueError("fraction must be between 0 and 1")
+        self.fraction = fraction
+        self.retry_interval = retry_interval
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
 
-def _get_token_data_from_refresh_token(refresh_token: str):
-    CREDENTIALS = get_credentials()
-    token_response = requests.post(
+    def start(self):
+        self._schedule(access_token())
+        # Only the issuer can renew a token from a token source, and asking
+        # it again just returns the same token
+        if get_credentials().token_source() is not None:
+            return self
+        self._thread = threading.Thread(
+            target=self._run, name="proxygen-token-refresher", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def _schedule(self, token):
+        payload = token_claims(token)
+        exp = payload["exp"]
+        issued_at = payload.get("iat", int(time()))
+        self._refresh_at = issued_at + self.fraction * (exp - issued_at)
+        self._exp = exp
+
+    def _run(self):
+        while not self._stop.wait(max(0, self._refresh_at - time())):
+            try:
+                # Ask for more validity than the current token has left,
+                # which forces a refresh unless another process already did one.
+                token = access_token(min_validity=max(10, int(self._exp - time()) + 1))
+                self.last_error = None
+                if token_claims(token)["exp"] > self._exp:
+                    self._schedule(token)
+                else:  # not renewed, so don't ask again straight away
+                    self._refresh_at = time() + self.retry_interval
+            except Exception as e:  # keep trying, requests fall back to refreshing lazily
+                self.last_error = e
+                self._refresh_at = time() + self.retry_interval
+
+
+_KEYCLOAK_SESSION = None
+
+
+def _keycloak_session():
+    """Shared session for Keycloak's token endpoint, with pooling and timeouts."""
+    global _KEYCLOAK_SESSION
+    if _KEYCLOAK_SESSION is None:
+        _KEYCLOAK_SESSION = RetrySession(settings=SETTINGS)
+    return _KEYCLOAK_SESSION
+
+
+def _get_token_data_from_refresh_token(refresh_token: str, credentials=None):
+    CREDENTIALS = credentials or get_credentials()
+    token_response = _keycloak_session().post(
         f"{CREDENTIALS.base_url}/protocol/openid-connect/token",
         data={
             "grant_type": "refresh_token",
@@ -86,9 +277,92 @@ def _get_token_data_from_refresh_token(refresh_token: str):
         return token_response.json()
 
 
-def _get_token_data_from_user_login():
-    session = requests.Session()
-    CREDENTIALS = get_credentials()
+def _get_token_data_from_token_source(credentials=None):
+    """
+    Read a pre-issued token from the configured credential_process,
+    token_file or token_env_var. Either token JSON (as returned by
+    Keycloak's token endpoint) or a bare access token is accepted.
+    """
+    CREDENTIALS = credentials or get_credentials()
+    source, value = CREDENTIALS.token_source()
+    if source == "credential_process":
+        result = subprocess.run(
+            shlex.split(value), capture_output=True, text=True, check=False
+        )
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"credential_process exited with {result.returncode}: {result.stderr.strip()}"
+            )
+        raw = result.stdout
+    elif source == "token_file":
+        raw = pathlib.Path(value).expanduser().read_text()
+    else:
+        if value not in os.environ:
+            raise RuntimeError(f"Environment variable {value} is not set")
+        raw = os.environ[value]
+
+    raw = raw.strip()
+    token_data = json.loads(raw) if raw.startswith("{") else {"access_token": raw}
+    if "access_token" not in token_data:
+        raise RuntimeError(f"No access_token in the token from {source}")
+    if _token_exp(token_data["access_token"]) <= time():
+        raise RuntimeError(f"The token from {source} has expired")
+    token_data.pop("refresh_token", None)  # refreshing is the issuer's job
+    return token_data
+
+
+LOGIN_FORM_ID = "kc-form-login"
+
+
+class _LoginFormFound(Exception):
+    pass
+
+
+class _LoginFormScanner(HTMLParser):
+    """
+    Scan HTML for the Keycloak login form's action, bailing out as soon as
+    the form's start tag has been seen rather than parsing the whole page.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.action = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "form":
+            attrs = dict(attrs)
+            if attrs.get("id") == LOGIN_FORM_ID and attrs.get("action"):
+                self.action = attrs["action"]
+                raise _LoginFormFound()
+
+
+def _login_form_action_lxml(page: str):
+    # Only pay for importing lxml when the lightweight scan comes up empty
+    from lxml import html
+
+    try:
+        return html.fromstring(page).get_element_by_id(LOGIN_FORM_ID).action
+    except KeyError:
+        return None
+
+
+def login_form_action(page: str):
+    """Return the URL the Keycloak login page's form posts credentials to."""
+    scanner = _LoginFormScanner()
+    try:
+        scanner.feed(page)
+        scanner.close()
+    except _LoginFormFound:
+        return scanner.action
+
+    if action := _login_form_action_lxml(page):
+        return action
+    raise RuntimeError(f"Could not find form {LOGIN_FORM_ID} on the Keycloak login page")
+
+
+def _get_token_data_from_user_login(credentials=None):
+    session = RetrySession(settings=SETTINGS)
+    CREDENTIALS = credentials or get_credentials()
     redirect_uri = f"{CREDENTIALS.base_url}/callback"
     login_page_resp = session.get(
         f"{CREDENTIALS.base_url}/protocol/openid-connect/auth",
@@ -97,7 +371,7 @@ def _get_token_data_from_user_login():
             "redirect_uri": redirect_uri,
             "response_type": "code",
             "state": "123",
-            "scope": "openid",
+            "scope": "openid offline_access" if CREDENTIALS.offline_access else "openid",
         },
     )
 
@@ -106,11 +380,7 @@ def _get_token_data_from_user_login():
             f"Login page get request status was {login_page_resp.status_code} expected to be 200"
         )
 
-    login_form = html.fromstring(login_page_resp.content.decode()).get_element_by_id(
-        "kc-form-login"
-    )
-
-    url = login_form.action
+    url = login_form_action(login_page_resp.content.decode())
     user_login_resp = session.post(
         url,
         headers={
@@ -150,30 +420,39 @@ def _get_token_data_from_user_login():
     return token_response.json()
 
 
-def _get_token_data_from_machine_user():
-    CREDENTIALS = get_credentials()
-    aud = CREDENTIALS.base_url
-    token_endpoint = aud + "/protocol/openid-connect/token"
-    private_key = CREDENTIALS.private_key()
-
+def client_assertion(credentials=None):
+    """
+    Build the signed JWT a machine user presents to Keycloak, using the
+    cached parsed private key rather than re-reading the PEM each time.
+    """
+    CREDENTIALS = credentials or get_credentials()
     claims = {
         "sub": CREDENTIALS.client_id,
         "iss": CREDENTIALS.client_id,
         "jti": str(uuid.uuid4()),
-        "aud": aud,
+        "aud": CREDENTIALS.base_url,
         "exp": int(time()) + 300,  # 5mins in the future
     }
 
     additional_jwt_headers = {"kid": CREDENTIALS.key_id}
-    client_assertion = jwt.encode(
-        claims, private_key, algorithm="RS512", headers=additional_jwt_headers
+    return jwt.encode(
+        claims,
+        CREDENTIALS.private_key_object(),
+        algorithm="RS512",
+        headers=additional_jwt_headers,
     )
-    token_response = requests.post(
+
+
+def _get_token_data_from_machine_user(credentials=None):
+    CREDENTIALS = credentials or get_credentials()
+    token_endpoint = CREDENTIALS.base_url + "/protocol/openid-connect/token"
+    client_assertion_jwt = client_assertion(CREDENTIALS)
+    token_response = _keycloak_session().post(
         token_endpoint,
         data={
             "grant_type": "client_credentials",
             "client_assertion_type": "urn:ietf:params:oauth:client-assertion-type:jwt-bearer",
-            "client_assertion": client_assertion,
+            "client_assertion": client_assertion_jwt,
         },
     )
     if token_response.status_code != 200:
@@ -0,0 +1,87 @@
+"""
+JSON encoding and decoding for API payloads and CLI output.
+
+Uses orjson when it is installed, and the standard library json module
+otherwise. Set PROXYGEN_JSON_BACKEND=json to force the standard library.
+
+Indented output matches json.dumps(obj, indent=2, default=str), and
+compact output has no spaces after separators, whichever backend is in
+use. Datetimes and anything else orjson cannot encode natively go through
+str(). orjson writes non-ASCII text, NaN and Infinity (as null) and floats
+that need an exponent (1e16 rather than 1e+16) differently, and cannot
+encode integers beyond 64 bits. Documents that may hold any of these,
+including any containing null, are handed to the standard library, so
+the output is the same byte for byte.
+"""
+import json
+import os
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+BACKEND_ENV_VAR = "PROXYGEN_JSON_BACKEND"
+
+JSONDecodeError = json.JSONDecodeError  # orjson.JSONDecodeError subclasses it
+
+
+def _default_backend() -> str:
+    if orjson is None or os.environ.get(BACKEND_ENV_VAR) == "json":
+        return "json"
+    return "orjson"
+
+
+BACKEND = _default_backend()
+
+
+def _json_dumps(obj: Any, indent: bool) -> str:
+    if indent:
+        return json.dumps(obj, indent=2, default=str)
+    return json.dumps(obj, separators=(",", ":"), default=str)
+
+
+# orjson writes floats that json.dumps gives an exponent, such as 1e+16
+# and 1e-05, as 1e16 and 0.00001. Searching with every digit mapped to 0
+# is much faster than a regular expression. Strings may match as well,
+# which only costs a slower encode.
+_DIGITS_TO_ZERO = bytes.maketrans(b"123456789", b"000000000")
+
+
+def _has_exponent_float(data: bytes) -> bool:
+    data = data.translate(_DIGITS_TO_ZERO)
+    return b"0e" in data or b"0.0000" in data
+
+
+def _orjson_dumps(obj: Any, indent: bool) -> str:
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    try:
+        data = orjson.dumps(obj, default=str, option=option)
+    except orjson.JSONEncodeError:
+        return _json_dumps(obj, indent)
+    # orjson writes NaN and Infinity as null. Looking for them in `obj`
+    # would take longer than encoding it with the standard library.
+    if not data.isascii() or b"null" in data or _has_exponent_float(data):
+        return _json_dumps(obj, indent)
+    return data.decode()
+
+
+def dumps(obj: Any, indent: bool = False, backend: str = None) -> str:
+    """
+    Encode `obj` as JSON, indented by two spaces if `indent` is set and
+    compact otherwise. Values JSON has no type for are encoded as their
+    str().
+    """
+    if (backend or BACKEND) == "orjson":
+        return _orjson_dumps(obj, indent)
+    return _json_dumps(obj, indent)
+
+
+def loads(data: Union[str, bytes], backend: str = None) -> Any:
+    """Decode a JSON document. Raises JSONDecodeError if it is invalid."""
+    if (backend or BACKEND) == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
@@ -19,3 +19,40 @@ LITERAL_SECRET_TYPES = Literal[
 
 PROXYGEN_CLIENT_ID = ""
 PROXYGEN_CLIENT_SECRET = ""
+
+# Point in a token's lifetime at which background refreshers renew it.
+DEFAULT_REFRESH_FRACTION = 0.75
+
+# Seconds the minimum CLI version reported by /_status is cached for.
+DEFAULT_VERSION_CHECK_TTL = 3600
+
+# Retrying idempotent requests, overridable with the retry_* settings.
+DEFAULT_RETRY_TOTAL = 3
+DEFAULT_RETRY_BACKOFF_FACTOR = 0.5  # seconds, doubled on each attempt
+DEFAULT_RETRY_MAX_BACKOFF = 30
+DEFAULT_RETRY_DEADLINE = 120  # seconds from the first attempt
+
+# HTTP connection pooling and timeouts (seconds), overridable in settings.
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300  # proxygen can take a while to deploy a large instance
+
+# With compress_uploads on, JSON bodies at least this many bytes are
+# uploaded gzip-compressed. Off until the proxygen service is known to
+# accept compressed request bodies.
+DEFAULT_COMPRESS_UPLOADS = False
+DEFAULT_COMPRESS_THRESHOLD = 64 * 1024
+
+# Opt-in cache of GET responses in ~/.proxygen/cache/http.
+DEFAULT_HTTP_CACHE = False
+DEFAULT_HTTP_CACHE_TTL = 60  # seconds, for responses without an ETag/Last-Modified
+DEFAULT_HTTP_CACHE_MAX_SIZE = 100 * 1024 * 1024  # bytes
+
+# Opt-in cache of resolved specs in ~/.proxygen/cache/spec.
+DEFAULT_SPEC_CACHE = False
+DEFAULT_SPEC_CACHE_MAX_SIZE = 100 * 1024 * 1024  # bytes
+
+# Adaptive concurrency for endpoints with rate_limits configured.
+DEFAULT_RATE_LIMIT_MAX_CONCURRENCY = 10
+DEFAULT_RATE_LIMIT_LATENCY_TOLERANCE = 3.0  # times the recent average response time
+DEFAULT_RATE_LIMIT_MIN_SAMPLES = 5  # responses seen before latency spikes count
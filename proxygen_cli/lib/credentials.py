@@ -5,6 +5,7 @@ import yaml
 import sys
 import os
 
+from cryptography.hazmat.primitives import serialization
 from pydantic import (
     BaseSettings,
     validator,
@@ -22,6 +23,27 @@ def _yaml_credentials_file_source(_):
         return credentials or {}
 
 
+# Parsed private keys by file path: {path: ((mtime_ns, size), key)}
+_PRIVATE_KEYS = {}
+
+
+def load_private_key(private_key_file: pathlib.Path):
+    """
+    Parse a PEM private key file into a cryptography key object.
+    The parsed key is reused for as long as the file is unchanged.
+    """
+    stat = private_key_file.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _PRIVATE_KEYS.get(str(private_key_file))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    key = serialization.load_pem_private_key(
+        private_key_file.read_bytes(), password=None
+    )
+    _PRIVATE_KEYS[str(private_key_file)] = (stamp, key)
+    return key
+
+
 def create_yaml_credentials_file():
     file_path = os.path.expanduser("~/.proxygen/credentials.yaml")
 
@@ -30,33 +52,70 @@ def create_yaml_credentials_file():
             pass
 
 
+TOKEN_SOURCE_FIELDS = ("credential_process", "token_file", "token_env_var")
+
+
 class Credentials(BaseSettings):
     base_url: AnyHttpUrl = (
         "https://identity.prod.api.platform.nhs.uk/realms/api-producers"
     )
     private_key_path: Optional[str] = None
     key_id: Optional[str] = None
+    # Pre-issued tokens: a command printing token JSON, a file or an env var holding it
+    credential_process: Optional[str] = None
+    token_file: Optional[str] = None
+    token_env_var: Optional[str] = None
     client_id: str = constants.PROXYGEN_CLIENT_ID
     client_secret: Optional[str] = constants.PROXYGEN_CLIENT_SECRET
     username: Optional[str] = None
     password: Optional[str] = None
+    # Ask Keycloak for an offline refresh token, which outlives the SSO session
+    offline_access: Optional[bool] = None
 
     @validator("username", "password", "client_secret", "client_id")
     def validate_humans_users(cls, value, values):
-        if values.get("private_key_path") is None and value is None:
+        if (
+            values.get("private_key_path") is None
+            and not any(values.get(field) for field in TOKEN_SOURCE_FIELDS)
+            and value is None
+        ):
             raise ValueError("field required")
         return value
 
-    def private_key(self):
-        """read the private key file and self.private_key_file_path."""
+    @validator("token_env_var")
+    def validate_single_token_source(cls, token_env_var, values):
+        """Pre-issued tokens must come from exactly one place."""
+        sources = [field for field in TOKEN_SOURCE_FIELDS if values.get(field)]
+        if token_env_var:
+            sources.append("token_env_var")
+        if len(sources) > 1:
+            raise ValueError(f"Only one of {', '.join(sources)} may be set")
+        return token_env_var
+
+    def token_source(self):
+        """The (field, value) of the configured pre-issued token source, if any."""
+        for field in TOKEN_SOURCE_FIELDS:
+            if value := getattr(self, field):
+                return field, value
+        return None
+
+    def _private_key_file(self):
         private_key_file = dot_proxygen.directory().joinpath(self.private_key_path)
         if not private_key_file.exists():
             raise ValueError(
-                f"Could not open private key file {private_key_file} for machine user {self.name}"
+                f"Could not open private key file {private_key_file} for machine user {self.client_id}"
             )
-        with private_key_file.open() as f:
+        return private_key_file
+
+    def private_key(self):
+        """read the private key file and self.private_key_file_path."""
+        with self._private_key_file().open() as f:
             return f.read()
 
+    def private_key_object(self):
+        """The parsed private key, cached while the key file is unchanged."""
+        return load_private_key(self._private_key_file())
+
     @validator("key_id")
     def validate_kid(cls, kid, values):
         """
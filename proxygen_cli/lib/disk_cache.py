@@ -0,0 +1,70 @@
+"""
+A size-bounded, least-recently-used cache of files in ~/.proxygen/cache.
+
+Each entry is one file, written atomically, so concurrent proxygen
+processes can share a cache without locking: at worst two of them both
+fill the same entry. Entries can be tagged (by API name, for example) so
+that everything cached for a tag can be invalidated at once.
+"""
+import contextlib
+import hashlib
+import os
+import pathlib
+from typing import Optional
+
+from .locking import atomic_write_bytes
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, directory: pathlib.Path, max_bytes: int):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str, tag: str) -> pathlib.Path:
+        return self.directory.joinpath(f"{_digest(tag)[:16]}-{_digest(key)}")
+
+    def get(self, key: str, tag: str = "") -> Optional[bytes]:
+        """The data stored under `key`, or None. Marks the entry as used."""
+        path = self._path(key, tag)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, key: str, data: bytes, tag: str = ""):
+        """Store `data` under `key`, then evict to stay within max_bytes."""
+        atomic_write_bytes(self._path(key, tag), data)
+        self.evict()
+
+    def delete(self, key: str, tag: str = ""):
+        with contextlib.suppress(FileNotFoundError):
+            self._path(key, tag).unlink()
+
+    def invalidate(self, tag: str):
+        """Delete every entry stored with `tag`."""
+        for path in self.directory.glob(f"{_digest(tag)[:16]}-*"):
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+
+    def evict(self):
+        """Delete least recently used entries until within max_bytes."""
+        entries = []
+        for path in self.directory.iterdir():
+            if path.name.startswith("."):
+                continue  # another process is part way through writing it
+            with contextlib.suppress(FileNotFoundError):
+                stat = path.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+            total -= size
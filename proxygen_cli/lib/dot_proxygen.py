@@ -41,3 +41,29 @@ def credentials_file() -> pathlib.Path:
 
 def token_cache_file() -> pathlib.Path:
     return _get_create_file("token_cache.json")
+
+
+def token_cache_lock_file() -> pathlib.Path:
+    """
+    Return the lock file guarding refreshes of the token cache.
+    Creates it if it does not exist.
+    """
+    return _get_create_file("token_cache.lock")
+
+
+def version_cache_file() -> pathlib.Path:
+    """
+    Return the file caching the minimum CLI version proxygen requires.
+    Creates it if it does not exist.
+    """
+    return _get_create_file("version_check.json")
+
+
+def cache_directory(name) -> pathlib.Path:
+    """
+    Return the directory `name` under ~/.proxygen/cache as a pathlib.Path
+    object. Creates it if it does not exist.
+    """
+    _dir = directory().joinpath("cache", name)
+    _dir.mkdir(parents=True, exist_ok=True)
+    return _dir
@@ -0,0 +1,111 @@
+"""
+An on-disk cache of proxygen GET responses for read commands.
+
+Responses carrying an ETag or Last-Modified are revalidated with
+If-None-Match / If-Modified-Since on every use, so a 304 saves the
+download but never serves stale data. Responses without validators are
+reused for `http_cache_ttl` seconds. Entries are keyed by endpoint, path,
+query and credentials fingerprint, and tagged with the API name so that
+changing an API drops everything cached for it.
+"""
+import json
+from time import time
+from typing import Optional
+
+import requests
+
+from . import constants
+from .disk_cache import DiskCache
+from .dot_proxygen import cache_directory
+from .transport import setting_or_default
+
+
+def enabled(settings) -> bool:
+    return setting_or_default(settings, "http_cache", constants.DEFAULT_HTTP_CACHE)
+
+
+def _cache(settings) -> DiskCache:
+    return DiskCache(
+        cache_directory("http"),
+        setting_or_default(
+            settings, "http_cache_max_size", constants.DEFAULT_HTTP_CACHE_MAX_SIZE
+        ),
+    )
+
+
+def cache_key(endpoint_url, path, params, credentials_key) -> str:
+    return json.dumps(
+        [str(endpoint_url), path, sorted((params or {}).items()), credentials_key]
+    )
+
+
+def _cacheable(resp) -> bool:
+    headers = getattr(resp, "headers", None) or {}
+    return resp.status_code == 200 and "no-store" not in headers.get(
+        "Cache-Control", ""
+    )
+
+
+class HttpCache:
+    def __init__(self, settings):
+        self.cache = _cache(settings)
+        self.ttl = setting_or_default(
+            settings, "http_cache_ttl", constants.DEFAULT_HTTP_CACHE_TTL
+        )
+
+    def lookup(self, key: str, api: str) -> Optional[dict]:
+        data = self.cache.get(key, api)
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def is_fresh(self, entry: dict) -> bool:
+        """Whether `entry` can be used without asking the server."""
+        has_validators = entry.get("etag") or entry.get("last_modified")
+        return not has_validators and time() - entry["stored_at"] < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, key: str, api: str, resp):
+        if not _cacheable(resp):
+            return
+        headers = getattr(resp, "headers", None) or {}
+        entry = {
+            "stored_at": time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "body": resp.text,
+        }
+        self.cache.set(key, json.dumps(entry).encode(), api)
+
+    def refreshed(self, key: str, api: str, entry: dict) -> dict:
+        """Record that the server confirmed `entry` is still current."""
+        entry = {**entry, "stored_at": time()}
+        self.cache.set(key, json.dumps(entry).encode(), api)
+        return entry
+
+    def invalidate(self, api: str):
+        self.cache.invalidate(api)
+
+
+def cached_response(entry: dict, resp=None) -> requests.Response:
+    """
+    A 200 response carrying the cached body, reusing the 304 `resp` for
+    its request and headers when there is one.
+    """
+    if resp is None:
+        resp = requests.Response()
+    resp.status_code = 200
+    resp.encoding = "utf-8"
+    resp._content = entry["body"].encode()
+    return resp
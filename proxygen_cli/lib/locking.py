@@ -0,0 +1,67 @@
+"""
+Cross-process file locking and atomic file replacement.
+
+Used to share files in ~/.proxygen between concurrently running
+proxygen processes without corrupting them.
+"""
+import contextlib
+import os
+import pathlib
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def file_lock(lock_file: pathlib.Path):
+    """
+    Hold an exclusive lock on `lock_file` for the duration of the block.
+    Blocks until any other holder releases it.
+    """
+    with open(lock_file, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:  # pragma: no cover
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10s, keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write_bytes(path: pathlib.Path, data: bytes):
+    """
+    Replace the contents of `path` with `data` so that readers only ever
+    see the old or the new contents, never a partially written file.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_name)
+        raise
+
+
+def atomic_write_text(path: pathlib.Path, text: str):
+    """Text version of atomic_write_bytes."""
+    atomic_write_bytes(path, text.encode())
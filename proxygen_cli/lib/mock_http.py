@@ -0,0 +1,112 @@
+"""
+HTTP plumbing shared by the local stand-ins for proxygen and Keycloak.
+"""
+import collections
+import gzip
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GZIP_MIN_SIZE = 1024
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed
+    # ACKs add ~40ms to every keep-alive response and swamp the timings.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *_):
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while size := int(self.rfile.readline().split(b";")[0], 16):
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                pass  # trailers
+            return bytes(body)
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status, body=b"", headers=None):
+        headers = dict(headers or {})
+        if (
+            self.server.gzip_responses
+            and len(body) >= GZIP_MIN_SIZE
+            and "gzip" in self.headers.get("Accept-Encoding", "")
+        ):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        chunked = self.server.chunked_responses and body
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if chunked:
+            for i in range(0, len(body), 16 * 1024):
+                chunk = body[i : i + 16 * 1024]
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        elif body:
+            self.wfile.write(body)
+        self.server.count(f"responses:{status}")
+
+    def _send_json(self, status, content, headers=None):
+        body = json.dumps(content).encode()
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        if self.command == "GET" and status == 200:
+            etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers={"ETag": etag})
+        return self._send(status, body, headers)
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    """
+    A threaded server counting requests and responses in `stats`, which
+    can run in the foreground or from a background thread.
+    """
+
+    daemon_threads = True
+    gzip_responses = False
+    chunked_responses = False
+
+    def __init__(self, address, handler_class):
+        self.stats = collections.Counter()
+        self.stats_lock = threading.Lock()
+        self._thread = None
+        super().__init__(address, handler_class)
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def stats_snapshot(self) -> dict:
+        with self.stats_lock:
+            return dict(self.stats)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """Serve from a background thread, e.g. in tests and benchmarks."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def __exit__(self, *args):
+        if self._thread is not None:
+            self.shutdown()
+        super().__exit__(*args)
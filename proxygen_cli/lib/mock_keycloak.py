@@ -0,0 +1,297 @@
+"""
+A local stand-in for the Keycloak realm the CLI logs in to, for offline
+load testing and benchmarking of lib/auth.py.
+
+It serves just enough of Keycloak for the three token flows:
+
+- the authorization code login: an auth page carrying the kc-form-login
+  form, a login action which redirects to the redirect_uri with a code,
+  and the authorization_code grant;
+- the client_credentials grant with a signed client assertion, checked
+  against a client's registered public key where one is given;
+- the refresh_token grant, including offline tokens when the login asked
+  for the offline_access scope.
+
+Access and refresh tokens are real RS256 JWTs signed with a key generated
+at startup and published at /protocol/openid-connect/certs. Their
+lifetimes and the response latency are configurable.
+"""
+import html
+import json
+import random
+import secrets
+import time
+import uuid
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from .mock_http import MockHTTPServer, MockRequestHandler
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Sign in to {realm}</title></head>
+<body>
+  <div id="kc-form">
+    <form id="kc-form-login" action="{action}" method="post">
+      <input id="username" name="username" type="text">
+      <input id="password" name="password" type="password">
+      <input type="hidden" id="id-hidden-input" name="credentialId">
+      <input name="login" id="kc-login" type="submit" value="Sign In">
+    </form>
+  </div>
+  {error}
+</body>
+</html>
+"""
+
+LOGIN_ERROR = '<span id="input-error">Invalid username or password.</span>'
+
+
+class MockKeycloakConfig:
+    def __init__(
+        self,
+        realm: str = "api-producers",
+        access_token_lifetime: int = 300,
+        refresh_token_lifetime: int = 1800,
+        latency: float = 0,
+        jitter: float = 0,
+        users: Optional[Dict[str, str]] = None,
+        client_keys: Optional[Dict[str, object]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.realm = realm
+        self.access_token_lifetime = access_token_lifetime
+        self.refresh_token_lifetime = refresh_token_lifetime
+        self.latency = latency
+        self.jitter = jitter
+        # username -> password. Any username and password logs in if empty.
+        self.users = users or {}
+        # client_id -> public key checking its client assertions. Other
+        # clients' assertions have their claims checked but not signatures.
+        self.client_keys = client_keys or {}
+        self.seed = seed
+
+
+class MockKeycloakHandler(MockRequestHandler):
+    def _form(self) -> dict:
+        return {k: v[0] for k, v in parse_qs(self._read_body().decode()).items()}
+
+    def _send_html(self, status, page):
+        self._send(status, page.encode(), {"Content-Type": "text/html"})
+
+    def _oauth_error(self, status, error, description):
+        return self._send_json(
+            status, {"error": error, "error_description": description}
+        )
+
+    def _dispatch(self):
+        server = self.server
+        server.count("requests")
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        delay = server.config.latency + server.random.uniform(0, server.config.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if url.path == "/_mock/stats":
+            return self._send_json(200, server.stats_snapshot())
+        if not url.path.startswith(server.realm_path):
+            return self._oauth_error(404, "not_found", f"No route for {url.path}")
+        route = (self.command, url.path[len(server.realm_path) :])
+        handler = {
+            ("GET", "/protocol/openid-connect/auth"): self._auth_page,
+            ("POST", "/login-actions/authenticate"): self._authenticate,
+            ("GET", "/callback"): self._callback,
+            ("POST", "/protocol/openid-connect/token"): self._token,
+            ("GET", "/protocol/openid-connect/certs"): self._certs,
+            ("GET", "/.well-known/openid-configuration"): self._configuration,
+        }.get(route)
+        if handler is None:
+            return self._oauth_error(404, "not_found", f"No route for {url.path}")
+        return handler(query)
+
+    do_GET = do_POST = _dispatch
+
+    def _auth_page(self, query):
+        session_code = secrets.token_urlsafe(16)
+        self.server.login_sessions[session_code] = {
+            "client_id": query.get("client_id"),
+            "redirect_uri": query.get("redirect_uri"),
+            "state": query.get("state"),
+            "scope": query.get("scope", "openid"),
+        }
+        action = f"{self.server.realm_url}/login-actions/authenticate?" + urlencode(
+            {
+                "session_code": session_code,
+                "execution": str(uuid.uuid4()),
+                "client_id": query.get("client_id"),
+                "tab_id": secrets.token_urlsafe(6),
+            }
+        )
+        page = LOGIN_PAGE.format(
+            realm=self.server.config.realm, action=html.escape(action), error=""
+        )
+        return self._send_html(200, page)
+
+    def _authenticate(self, query):
+        form = self._form()
+        session = self.server.login_sessions.pop(query.get("session_code"), None)
+        if session is None:
+            return self._send_html(400, "<p>Your login attempt timed out.</p>")
+        users = self.server.config.users
+        if users and users.get(form.get("username")) != form.get("password"):
+            self.server.count("logins:failed")
+            page = LOGIN_PAGE.format(
+                realm=self.server.config.realm, action="", error=LOGIN_ERROR
+            )
+            return self._send_html(200, page)
+
+        code = secrets.token_urlsafe(24)
+        self.server.codes[code] = {**session, "sub": form.get("username")}
+        location = f"{session['redirect_uri']}?" + urlencode(
+            {"state": session["state"], "code": code}
+        )
+        self._send(302, headers={"Location": location})
+        return None
+
+    def _callback(self, _):
+        return self._send_html(200, "<p>You are signed in.</p>")
+
+    def _token(self, _):
+        form = self._form()
+        grant_type = form.get("grant_type")
+        if grant_type == "authorization_code":
+            grant = self.server.codes.pop(form.get("code"), None)
+            if grant is None or grant["redirect_uri"] != form.get("redirect_uri"):
+                return self._oauth_error(400, "invalid_grant", "Code not valid")
+            return self._issue(
+                grant_type, grant["client_id"], grant["sub"], grant["scope"]
+            )
+        if grant_type == "refresh_token":
+            return self._refresh(form)
+        if grant_type == "client_credentials":
+            return self._client_credentials(form)
+        return self._oauth_error(400, "unsupported_grant_type", str(grant_type))
+
+    def _refresh(self, form):
+        try:
+            claims = jwt.decode(
+                form.get("refresh_token", ""),
+                self.server.public_key,
+                algorithms=["RS256"],
+                audience=self.server.realm_url,
+            )
+        except jwt.InvalidTokenError as e:
+            return self._oauth_error(400, "invalid_grant", str(e))
+        if claims.get("typ") not in ("Refresh", "Offline"):
+            return self._oauth_error(400, "invalid_grant", "Not a refresh token")
+        return self._issue(
+            "refresh_token", claims["azp"], claims["sub"], claims["scope"]
+        )
+
+    def _client_credentials(self, form):
+        assertion = form.get("client_assertion", "")
+        try:
+            unverified = jwt.decode(assertion, options={"verify_signature": False})
+            client_id = unverified["sub"]
+            key = self.server.config.client_keys.get(client_id)
+            jwt.decode(
+                assertion,
+                key,
+                algorithms=["RS256", "RS384", "RS512"],
+                audience=self.server.realm_url,
+                options={"verify_signature": key is not None},
+            )
+        except (jwt.InvalidTokenError, KeyError) as e:
+            return self._oauth_error(401, "invalid_client", str(e))
+        return self._issue(
+            "client_credentials", client_id, f"service-account-{client_id}", "openid"
+        )
+
+    def _issue(self, grant_type, client_id, sub, scope):
+        server, config = self.server, self.server.config
+        now = int(time.time())
+        claims = {
+            "iss": server.realm_url,
+            "sub": sub,
+            "azp": client_id,
+            "scope": scope,
+            "iat": now,
+            "jti": str(uuid.uuid4()),
+        }
+        access_token = server.sign(
+            {**claims, "typ": "Bearer", "aud": "account"},
+            now + config.access_token_lifetime,
+        )
+        token_data = {
+            "access_token": access_token,
+            "expires_in": config.access_token_lifetime,
+            "token_type": "Bearer",
+            "scope": scope,
+        }
+        if not sub.startswith("service-account-"):
+            offline = "offline_access" in scope.split()
+            refresh_claims = {
+                **claims,
+                "jti": str(uuid.uuid4()),
+                "aud": server.realm_url,
+                "typ": "Offline" if offline else "Refresh",
+            }
+            # Offline tokens outlive the SSO session, so carry no expiry.
+            exp = None if offline else now + config.refresh_token_lifetime
+            token_data["refresh_token"] = server.sign(refresh_claims, exp)
+            token_data["refresh_expires_in"] = (
+                0 if offline else config.refresh_token_lifetime
+            )
+        server.count(f"tokens:{grant_type}")
+        return self._send_json(200, token_data)
+
+    def _certs(self, _):
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.server.public_key))
+        jwk.update({"kid": self.server.kid, "alg": "RS256", "use": "sig"})
+        return self._send_json(200, {"keys": [jwk]})
+
+    def _configuration(self, _):
+        realm_url = self.server.realm_url
+        return self._send_json(
+            200,
+            {
+                "issuer": realm_url,
+                "authorization_endpoint": f"{realm_url}/protocol/openid-connect/auth",
+                "token_endpoint": f"{realm_url}/protocol/openid-connect/token",
+                "jwks_uri": f"{realm_url}/protocol/openid-connect/certs",
+            },
+        )
+
+
+class MockKeycloakServer(MockHTTPServer):
+    def __init__(self, address=("127.0.0.1", 0), config: MockKeycloakConfig = None):
+        self.config = config or MockKeycloakConfig()
+        self.random = random.Random(self.config.seed)
+        self.private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+        self.public_key = self.private_key.public_key()
+        self.kid = str(uuid.uuid4())
+        self.login_sessions = {}
+        self.codes = {}
+        super().__init__(address, MockKeycloakHandler)
+
+    @property
+    def realm_path(self) -> str:
+        return f"/realms/{self.config.realm}"
+
+    @property
+    def realm_url(self) -> str:
+        """What the CLI's base_url credential should be set to."""
+        return f"{self.url}{self.realm_path}"
+
+    def sign(self, claims: dict, exp: Optional[int]) -> str:
+        if exp is not None:
+            claims = {**claims, "exp": exp}
+        return jwt.encode(
+            claims, self.private_key, algorithm="RS256", headers={"kid": self.kid}
+        )
@@ -0,0 +1,337 @@
+"""
+A local stand-in for the proxygen service, for offline benchmarking and
+load testing of the CLI's HTTP layer.
+
+It implements the /apis/{api}/... routes proxygen_api uses, plus /_status,
+on top of an in-memory store. Request bodies may be gzipped and/or
+chunked, large responses are gzipped for clients that accept it, and GET
+responses carry ETags and honour If-None-Match. Any bearer token is
+accepted.
+
+MockServerConfig adds the misbehaviour real services show under load:
+fixed and random latency, a fraction of requests failing with a 5xx, and
+throttling with 429 and Retry-After above a request rate. Counts of
+requests and responses are served from /_mock/stats.
+"""
+import email.parser
+import email.policy
+import gzip
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, get_args
+from urllib.parse import parse_qs, unquote, urlparse
+
+from proxygen_cli import __version__ as proxygen_cli_version
+
+from .constants import LITERAL_ENVS
+from .mock_http import MockHTTPServer, MockRequestHandler
+from .rate_limit import TokenBucket
+
+MOCK_REGISTRY = "000000000000.dkr.ecr.eu-west-2.amazonaws.com"
+
+
+class MockServerConfig:
+    def __init__(
+        self,
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        error_status: int = 503,
+        throttle_rps: Optional[float] = None,
+        accept_gzip: bool = True,
+        gzip_responses: bool = True,
+        chunked_responses: bool = False,
+        min_cli_version: str = proxygen_cli_version,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.throttle_rps = throttle_rps
+        self.accept_gzip = accept_gzip
+        self.gzip_responses = gzip_responses
+        self.chunked_responses = chunked_responses
+        self.min_cli_version = min_cli_version
+        self.seed = seed
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class MockProxygenStore:
+    """In-memory APIs, instances, secrets and specs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.instances = {}  # (api, env, name) -> {"spec", "last_modified", ...}
+        self.secrets = {}  # (api, env, secret_type, name) -> {"value", ...}
+        self.specs = {}  # (api, uat) -> spec
+
+    def resources(self, api, env=None, _type=None):
+        with self.lock:
+            instances = [
+                {
+                    "environment": e,
+                    "type": "instance",
+                    "name": name,
+                    "last_modified": item["last_modified"],
+                    "spec_hash": item["spec_hash"],
+                }
+                for (a, e, name), item in self.instances.items()
+                if a == api and env in (None, e)
+            ]
+            secrets = [
+                {
+                    "environment": e,
+                    "type": "secret",
+                    "secret_type": secret_type,
+                    "name": name,
+                    "last_modified": item["last_modified"],
+                }
+                for (a, e, secret_type, name), item in self.secrets.items()
+                if a == api and env in (None, e)
+            ]
+        if _type == "instance":
+            return instances
+        if _type == "secret":
+            return secrets
+        return instances + secrets
+
+
+def _routes():
+    envs = "|".join(re.escape(env) for env in get_args(LITERAL_ENVS))
+    api = r"/apis/(?P<api>[^/]+)"
+    env = rf"{api}/environments/(?P<env>{envs})"
+    return [
+        (re.compile(r"/_status"), "status"),
+        (re.compile(r"/_mock/stats"), "stats"),
+        (re.compile(api), "api"),
+        (re.compile(rf"{api}/environments"), "resources"),
+        (re.compile(rf"{env}/instances"), "instances"),
+        (re.compile(rf"{env}/instances/(?P<name>[^/]+)"), "instance"),
+        (re.compile(rf"{env}/secrets"), "secrets"),
+        (
+            re.compile(rf"{env}/secrets/(?P<secret_type>apikey|mtls)/(?P<name>[^/]+)"),
+            "secret",
+        ),
+        (re.compile(rf"{api}/spec(?P<uat>/uat)?"), "spec"),
+        (re.compile(rf"{api}/docker-token"), "docker_token"),
+        (re.compile(rf"{api}/pytest-nhsd-apim-token"), "pytest_token"),
+    ]
+
+
+ROUTES = _routes()
+
+
+class _NotFound(Exception):
+    pass
+
+
+class MockProxygenHandler(MockRequestHandler):
+    def _injected_failure(self) -> bool:
+        """Apply configured latency, errors and throttling."""
+        config, server = self.server.config, self.server
+        delay = config.latency + server.random.uniform(0, config.jitter)
+        if delay:
+            time.sleep(delay)
+        if server.bucket is not None and (wait := server.bucket.try_acquire()):
+            self._send_json(
+                429,
+                {"error": "Too many requests"},
+                {"Retry-After": str(math.ceil(wait))},
+            )
+            return True
+        if config.error_rate and server.random.random() < config.error_rate:
+            self._send_json(config.error_status, {"error": "Injected failure"})
+            return True
+        return False
+
+    def _dispatch(self):
+        self.server.count("requests")
+        self.server.count(f"requests:{self.command}")
+        url = urlparse(self.path)
+        body = self._read_body() if self.command == "PUT" else b""
+
+        for pattern, name in ROUTES:
+            if match := pattern.fullmatch(url.path):
+                break
+        else:
+            return self._send_json(404, {"error": f"No route for {url.path}"})
+
+        if name not in ("status", "stats"):
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return self._send_json(401, {"error": "Missing bearer token"})
+            if self._injected_failure():
+                return None
+
+        if self.headers.get("Content-Encoding") == "gzip":
+            if not self.server.config.accept_gzip:
+                return self._send_json(415, {"error": "Unsupported Content-Encoding"})
+            body = gzip.decompress(body)
+
+        params = {
+            key: unquote(value)
+            for key, value in match.groupdict().items()
+            if value is not None
+        }
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        handler = getattr(self, f"_{self.command.lower()}_{name}", None)
+        if handler is None:
+            return self._send_json(405, {"error": "Method not allowed"})
+        try:
+            return handler(body=body, query=query, **params)
+        except _NotFound:
+            return self._send_json(404, {"error": "Not found"})
+
+    do_GET = do_PUT = do_DELETE = _dispatch
+
+    @property
+    def store(self) -> MockProxygenStore:
+        return self.server.store
+
+    def _get_status(self, **_):
+        min_version = self.server.config.min_cli_version
+        return self._send_json(
+            200, {"status": "pass", "proxygen_cli": {"min_version": min_version}}
+        )
+
+    def _get_stats(self, **_):
+        return self._send_json(200, self.server.stats_snapshot())
+
+    def _get_api(self, api, **_):
+        return self._send_json(200, {"name": api})
+
+    def _get_resources(self, api, query, **_):
+        resources = self.store.resources(api, _type=query.get("type"))
+        return self._send_json(200, resources)
+
+    def _get_instances(self, api, env, **_):
+        return self._send_json(200, self.store.resources(api, env, "instance"))
+
+    def _get_secrets(self, api, env, **_):
+        return self._send_json(200, self.store.resources(api, env, "secret"))
+
+    def _get_instance(self, api, env, name, **_):
+        with self.store.lock:
+            item = self.store.instances.get((api, env, name))
+        if item is None:
+            raise _NotFound()
+        return self._send_json(200, item["spec"])
+
+    def _put_instance(self, api, env, name, body, **_):
+        spec = json.loads(body)
+        with self.store.lock:
+            self.store.instances[(api, env, name)] = {
+                "spec": spec,
+                "last_modified": _now(),
+                "spec_hash": hashlib.md5(body).hexdigest(),
+            }
+        return self._send_json(200, {"name": name, "environment": env})
+
+    def _delete_instance(self, api, env, name, **_):
+        with self.store.lock:
+            if self.store.instances.pop((api, env, name), None) is None:
+                raise _NotFound()
+        return self._send_json(200, {})
+
+    def _get_secret(self, api, env, secret_type, name, **_):
+        with self.store.lock:
+            item = self.store.secrets.get((api, env, secret_type, name))
+        if item is None:
+            raise _NotFound()
+        return self._send_json(
+            200,
+            {
+                "name": name,
+                "type": secret_type,
+                "last_modified": item["last_modified"],
+            },
+        )
+
+    def _put_secret(self, api, env, secret_type, name, body, **_):
+        if secret_type == "mtls":
+            item = self._mtls_parts(body)
+            if set(item) != {"cert", "key"}:
+                return self._send_json(400, {"error": "Expected cert and key parts"})
+        else:
+            item = {"value": body.decode()}
+        item["last_modified"] = _now()
+        with self.store.lock:
+            self.store.secrets[(api, env, secret_type, name)] = item
+        return self._send_json(200, {"name": name, "type": secret_type})
+
+    def _mtls_parts(self, body):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode() + body
+        )
+        return {
+            part.get_param("name", header="content-disposition"): part.get_content()
+            for part in message.iter_parts()
+        }
+
+    def _delete_secret(self, api, env, secret_type, name, **_):
+        with self.store.lock:
+            if self.store.secrets.pop((api, env, secret_type, name), None) is None:
+                raise _NotFound()
+        return self._send_json(200, {})
+
+    def _get_spec(self, api, uat=None, **_):
+        with self.store.lock:
+            spec = self.store.specs.get((api, bool(uat)))
+        if spec is None:
+            raise _NotFound()
+        return self._send_json(200, spec)
+
+    def _put_spec(self, api, body, uat=None, **_):
+        with self.store.lock:
+            self.store.specs[(api, bool(uat))] = json.loads(body)
+        return self._send_json(200, {"name": api})
+
+    def _delete_spec(self, api, uat=None, **_):
+        with self.store.lock:
+            if self.store.specs.pop((api, bool(uat)), None) is None:
+                raise _NotFound()
+        return self._send_json(200, {})
+
+    def _get_docker_token(self, api, **_):
+        return self._send_json(
+            200,
+            {
+                "user": "AWS",
+                "password": "mock-docker-password",
+                "registry": f"https://{MOCK_REGISTRY}/{api}",
+            },
+        )
+
+    def _get_pytest_token(self, api, **_):
+        return self._send_json(
+            200,
+            {
+                "access_token": "mock-pytest-nhsd-apim-token",
+                "expires_in": 600,
+                "token_type": "Bearer",
+            },
+        )
+
+
+class MockProxygenServer(MockHTTPServer):
+    def __init__(self, address=("127.0.0.1", 0), config: MockServerConfig = None):
+        self.config = config or MockServerConfig()
+        self.gzip_responses = self.config.gzip_responses
+        self.chunked_responses = self.config.chunked_responses
+        self.store = MockProxygenStore()
+        self.random = random.Random(self.config.seed)
+        self.bucket = None
+        if self.config.throttle_rps:
+            self.bucket = TokenBucket(
+                self.config.throttle_rps, max(1, self.config.throttle_rps)
+            )
+        super().__init__(address, MockProxygenHandler)
@@ -1,11 +1,11 @@
 from typing import List, Dict
-import json
 import yaml
 from datetime import datetime
 
 import click
 from tabulate import tabulate
 
+from proxygen_cli.lib import codec
 from proxygen_cli.lib.settings import SETTINGS
 
 def _format_time(obj: Dict[str, str], keys: List[str] = None):
@@ -28,7 +28,44 @@ def yaml_multiline_string_pipe(dumper, data):
         return dumper.represent_scalar('tag:yaml.org,2002:str', fixed_data, style="|")
     return dumper.represent_scalar('tag:yaml.org,2002:str', fixed_data)
 
-yaml.add_representer(str, yaml_multiline_string_pipe)
+class SpecDumper(getattr(yaml, "CSafeDumper", yaml.SafeDumper)):
+    """libyaml's emitter where PyYAML was built with it, which is much faster."""
+
+
+class _PythonSpecDumper(yaml.Dumper):
+    """The pure Python emitter, for text libyaml would write differently."""
+
+
+SpecDumper.add_representer(str, yaml_multiline_string_pipe)
+_PythonSpecDumper.add_representer(str, yaml_multiline_string_pipe)
+
+
+def _emits_alike(node) -> bool:
+    """
+    True if libyaml writes `node` exactly as the pure Python emitter does.
+    They differ in how they escape non-ASCII and control characters, when
+    they write long or blank keys as `? key`, and libyaml ends the document
+    with `...` after any literal scalar ending in a blank line.
+    """
+    if isinstance(node, dict):
+        return all(
+            (not isinstance(key, str) or _plain_key(key)) and _emits_alike(value)
+            for key, value in node.items()
+        )
+    if isinstance(node, list):
+        return all(_emits_alike(value) for value in node)
+    if isinstance(node, str):
+        text = "\n".join(line.rstrip() for line in node.splitlines())
+        return _printable_ascii(node) and not text.endswith("\n")
+    return True
+
+
+def _plain_key(key: str) -> bool:
+    return key.isascii() and key.isprintable() and bool(key.strip()) and len(key) < 100
+
+
+def _printable_ascii(text: str) -> bool:
+    return text.isascii() and text.replace("\n", "").isprintable()
 
 def to_spec(spec):
     if SETTINGS.spec_output_format == "yaml":
@@ -40,13 +77,14 @@ def print_spec(spec):
     return click.echo(to_spec(spec))
 
 def to_json(obj):
-    return json.dumps(obj, indent=2, default=str)
+    return codec.dumps(obj, indent=True)
 
 def print_json(obj):
     return click.echo(to_json(obj))
 
 def to_yaml(obj):
-    return yaml.dump(obj)
+    dumper = SpecDumper if _emits_alike(obj) else _PythonSpecDumper
+    return yaml.dump(obj, Dumper=dumper)
 
 def print_yaml(obj):
     return click.echo(to_yaml(obj))
@@ -1,20 +1,26 @@
+import contextvars
 import json
 import platform
 from typing import Any, Dict, Literal, Optional
 from urllib.parse import urljoin, urlparse
 
 import click
-import requests
 
 from proxygen_cli import __version__ as proxygen_cli_version
 from proxygen_cli import _package_name as proxygen_package_name
-from proxygen_cli.lib.auth import access_token
+from proxygen_cli.lib import codec, constants, http_cache, rate_limit
+from proxygen_cli.lib.auth import access_token, cache_key
 from proxygen_cli.lib.constants import LITERAL_ENVS, LITERAL_SECRET_TYPES
+from proxygen_cli.lib.retry import RetrySession
 from proxygen_cli.lib.settings import SETTINGS
+from proxygen_cli.lib.streaming import JsonBody
+from proxygen_cli.lib.transport import setting_or_default
 
 
-class ProxygenSession(requests.Session):
+class ProxygenSession(RetrySession):
     def __init__(self, **kwargs):
+        kwargs.setdefault("settings", SETTINGS)
+        kwargs.setdefault("limiter", rate_limit.limiter_for(kwargs["settings"]))
         super().__init__(**kwargs)
 
     def request(self, method, path, **kwargs):
@@ -33,26 +39,99 @@ class ProxygenSession(requests.Session):
 
 _PROXYGEN_SESSION = None
 
+# Lets callers such as the async client route calls through their own session.
+SESSION_OVERRIDE = contextvars.ContextVar("proxygen_session", default=None)
+
 
 def _session():
+    if (session := SESSION_OVERRIDE.get()) is not None:
+        return session
     global _PROXYGEN_SESSION
     if _PROXYGEN_SESSION is None:
         _PROXYGEN_SESSION = ProxygenSession()
     return _PROXYGEN_SESSION
 
 
+# Set once the server turns down a gzip upload, so we stop trying.
+_GZIP_REJECTED = False
+
+
+def _put_json(path: str, content: Dict[str, Any]):
+    """
+    PUT `content` as JSON. Bodies under compress_threshold bytes are sent
+    as they are, with a Content-Length. Larger ones are encoded while they
+    are sent, and gzipped too with compress_uploads on, so the whole JSON
+    is never held in memory.
+
+    A server that cannot take compressed bodies replies 415, in which case
+    the body is sent again uncompressed and later uploads skip gzip. A 400
+    is taken to be about the content, as when proxygen rejects an invalid
+    spec, so the body is not uploaded twice.
+    """
+    global _GZIP_REJECTED
+    headers = {"Content-Type": "application/json"}
+    threshold = setting_or_default(
+        SETTINGS, "compress_threshold", constants.DEFAULT_COMPRESS_THRESHOLD
+    )
+    body = JsonBody(content)
+    if not body.at_least(threshold):
+        return _session().put(path, data=b"".join(body), headers=headers)
+
+    compress = not _GZIP_REJECTED and setting_or_default(
+        SETTINGS, "compress_uploads", constants.DEFAULT_COMPRESS_UPLOADS
+    )
+    if compress:
+        resp = _session().put(
+            path,
+            data=JsonBody(content, compress=True),
+            headers={**headers, "Content-Encoding": "gzip"},
+        )
+        if resp.status_code != 415:
+            return resp
+        _GZIP_REJECTED = True
+    return _session().put(path, data=body, headers=headers)
+
+
+def _cached_get(api: str, path: str, params=None):
+    """
+    GET `path`, through the on-disk response cache when http_cache is on.
+    """
+    if not http_cache.enabled(SETTINGS):
+        return _session().get(path, params=params)
+
+    cache = http_cache.HttpCache(SETTINGS)
+    key = http_cache.cache_key(SETTINGS.endpoint_url, path, params, cache_key())
+    entry = cache.lookup(key, api)
+    if entry is not None and cache.is_fresh(entry):
+        return http_cache.cached_response(entry)
+
+    headers = cache.conditional_headers(entry) if entry is not None else {}
+    resp = _session().get(path, params=params, headers=headers)
+    if resp.status_code == 304 and entry is not None:
+        return http_cache.cached_response(cache.refreshed(key, api, entry), resp)
+    cache.store(key, api, resp)
+    return resp
+
+
+def _invalidate(api: str, resp):
+    """Drop cached responses for `api` after changing it."""
+    if http_cache.enabled(SETTINGS):
+        http_cache.HttpCache(SETTINGS).invalidate(api)
+    return resp
+
+
 def _resp_json(resp, none_on_404=True):
     if resp.status_code in [200, 201]:
-        if resp.text:
-            return resp.json()
+        if resp.content:
+            return codec.loads(resp.content)
         return ""
     elif none_on_404 and resp.status_code == 404:
         return None
     else:
         body = resp.text
         try:
-            body = json.loads(resp.text)
-        except json.JSONDecodeError:
+            body = codec.loads(resp.text)
+        except codec.JSONDecodeError:
             pass
         error_dict = {
             "error": "Unexpected response from proxygen server",
@@ -75,7 +154,7 @@ def status():
 
 
 def get_api(api):
-    resp = _session().get(f"/apis/{api}")
+    resp = _cached_get(api, f"/apis/{api}")
     return _resp_json(resp)
 
 
@@ -100,24 +179,24 @@ def get_resources(
     params = {}
     if _type:
         params["type"] = _type
-    resp = _session().get(f"/apis/{api}/environments", params=params)
+    resp = _cached_get(api, f"/apis/{api}/environments", params=params)
     return _resp_json(resp)
 
 
 def get_instances(api: str, environment: LITERAL_ENVS):
-    resp = _session().get(f"/apis/{api}/environments/{environment}/instances")
+    resp = _cached_get(api, f"/apis/{api}/environments/{environment}/instances")
     return _resp_json(resp)
 
 
 def get_secrets(api: str, environment: LITERAL_ENVS):
-    resp = _session().get(f"/apis/{api}/environments/{environment}/secrets")
+    resp = _cached_get(api, f"/apis/{api}/environments/{environment}/secrets")
     return _resp_json(resp)
 
 
 # INSTANCE methods
 def get_instance(api: str, environment: LITERAL_ENVS, instance_name: str):
-    resp = _session().get(
-        f"/apis/{api}/environments/{environment}/instances/{instance_name}"
+    resp = _cached_get(
+        api, f"/apis/{api}/environments/{environment}/instances/{instance_name}"
     )
     return _resp_json(resp)
 
@@ -126,38 +205,32 @@ def delete_instance(api: str, environment: LITERAL_ENVS, instance_name: str):
     resp = _session().delete(
         f"/apis/{api}/environments/{environment}/instances/{instance_name}"
     )
-    return _resp_json(resp)
+    return _resp_json(_invalidate(api, resp))
 
 
 def put_instance(
     api: str, environment: LITERAL_ENVS, instance: str, paas_open_api: Dict[str, Any]
 ):
-    resp = _session().put(
-        f"/apis/{api}/environments/{environment}/instances/{instance}",
-        data=json.dumps(paas_open_api, default=str),
-        headers={"Content-Type": "application/json"},
+    resp = _put_json(
+        f"/apis/{api}/environments/{environment}/instances/{instance}", paas_open_api
     )
-    return _resp_json(resp)
+    return _resp_json(_invalidate(api, resp))
 
 
 # SPEC methods
 def get_spec(api: str, uat: bool = False):
-    resp = _session().get(f"/apis/{api}/spec{'/uat' if uat else ''}")
+    resp = _cached_get(api, f"/apis/{api}/spec{'/uat' if uat else ''}")
     return _resp_json(resp)
 
 
 def delete_spec(api: str, uat: bool = False):
     resp = _session().delete(f"/apis/{api}/spec{'/uat' if uat else ''}")
-    return _resp_json(resp)
+    return _resp_json(_invalidate(api, resp))
 
 
 def put_spec(api: str, paas_open_api: Dict[str, Any], uat: bool = False):
-    resp = _session().put(
-        f"/apis/{api}/spec{'/uat' if uat else ''}",
-        data=json.dumps(paas_open_api, default=str),
-        headers={"Content-Type": "application/json"},
-    )
-    return _resp_json(resp)
+    resp = _put_json(f"/apis/{api}/spec{'/uat' if uat else ''}", paas_open_api)
+    return _resp_json(_invalidate(api, resp))
 
 
 # SECRET methods
@@ -184,7 +257,7 @@ def put_secret(
         f"/apis/{api}/environments/{environment}/secrets/{secret_type}/{secret_name}",
         data=secret_value,
     )
-    return _resp_json(resp)
+    return _resp_json(_invalidate(api, resp))
 
 
 def put_mtls_secret(
@@ -199,7 +272,7 @@ def put_mtls_secret(
         files={"cert": ("cert.pem", mtls_cert), "key": ("key.pem", mtls_key)},
         params={"type": "mtls"},
     )
-    return _resp_json(resp)
+    return _resp_json(_invalidate(api, resp))
 
 
 def delete_secret(
@@ -211,4 +284,4 @@ def delete_secret(
     resp = _session().delete(
         f"/apis/{api}/environments/{environment}/secrets/{secret_type}/{secret_name}"
     )
-    return _resp_json(resp)
+    return _resp_json(_invalidate(api, resp))
@@ -0,0 +1,82 @@
+"""
+asyncio interface to the proxygen API.
+
+Every method runs the proxygen_api function of the same name on a
+bounded thread pool with the client's own session. Auth, URLs and error
+handling (`_resp_json`) are therefore identical to the synchronous API,
+while many requests can be in flight at once:
+
+    async with AsyncProxygenClient(max_connections=20) as client:
+        results = await asyncio.gather(
+            *(client.get_instances(api, env) for env in envs)
+        )
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from proxygen_cli.lib import proxygen_api, transport
+
+
+def _async_method(func):
+    @functools.wraps(func)
+    async def method(self, *args, **kwargs):
+        return await self._call(func, *args, **kwargs)
+
+    return method
+
+
+class AsyncProxygenClient:
+    def __init__(self, max_connections: int = 10):
+        self._session = proxygen_api.ProxygenSession()
+        # pool_block makes extra requests wait for a free connection rather
+        # than opening throwaway ones beyond the pool size.
+        adapter = transport.http_adapter(pool_maxsize=max_connections, pool_block=True)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_connections, thread_name_prefix="proxygen-async"
+        )
+
+    async def _call(self, func, *args, **kwargs):
+        ctx = contextvars.copy_context()
+        ctx.run(proxygen_api.SESSION_OVERRIDE.set, self._session)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(ctx.run, func, *args, **kwargs)
+        )
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+        self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    status = _async_method(proxygen_api.status)
+    get_api = _async_method(proxygen_api.get_api)
+    get_docker_login = _async_method(proxygen_api.get_docker_login)
+    get_pytest_nhsd_apim_token = _async_method(proxygen_api.get_pytest_nhsd_apim_token)
+    get_resources = _async_method(proxygen_api.get_resources)
+    get_instances = _async_method(proxygen_api.get_instances)
+    get_secrets = _async_method(proxygen_api.get_secrets)
+
+    # INSTANCE methods
+    get_instance = _async_method(proxygen_api.get_instance)
+    delete_instance = _async_method(proxygen_api.delete_instance)
+    put_instance = _async_method(proxygen_api.put_instance)
+
+    # SPEC methods
+    get_spec = _async_method(proxygen_api.get_spec)
+    delete_spec = _async_method(proxygen_api.delete_spec)
+    put_spec = _async_method(proxygen_api.put_spec)
+
+    # SECRET methods
+    get_secret = _async_method(proxygen_api.get_secret)
+    put_secret = _async_method(proxygen_api.put_secret)
+    put_mtls_secret = _async_method(proxygen_api.put_mtls_secret)
+    delete_secret = _async_method(proxygen_api.delete_secret)
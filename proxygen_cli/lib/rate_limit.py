@@ -0,0 +1,223 @@
+"""
+Client-side rate limiting and adaptive concurrency for proxygen requests.
+
+Each endpoint configured under `rate_limits` in Settings gets one
+EndpointLimiter, shared by every session in the process (including the
+async client's). It combines:
+
+- a token bucket capping the request rate at `requests_per_second`,
+  allowing bursts of `burst`;
+- an AIMD concurrency limit between `min_concurrency` and
+  `max_concurrency`, which halves on 429s, timeouts and latency spikes
+  (responses slower than `latency_tolerance` times the recent average)
+  and grows by about one for each limit's worth of healthy responses.
+
+A 429 with Retry-After also holds back every request to the endpoint for
+that long, not just the one being retried.
+"""
+import collections
+import contextlib
+import threading
+from time import monotonic, sleep
+from typing import Dict, Optional
+
+from . import constants, transport
+from .retry import retry_after
+
+
+def _wait_allowed(seconds: float):
+    """Raise if waiting `seconds` would overrun the command deadline."""
+    left = transport.remaining()
+    if left is not None and seconds > left:
+        raise transport.CommandDeadlineExceeded(
+            "Command deadline exceeded waiting for the rate limiter"
+        )
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = monotonic()
+        self._not_before = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if there is one and return 0, otherwise return how long
+        to wait before trying again.
+        """
+        with self._lock:
+            now = monotonic()
+            if now < self._not_before:
+                return self._not_before - now
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while (wait := self.try_acquire()) > 0:
+            _wait_allowed(wait)
+            sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next `seconds`."""
+        with self._lock:
+            self._not_before = max(self._not_before, monotonic() + seconds)
+
+
+class AdaptiveConcurrency:
+    """An AIMD limit on the number of requests in flight."""
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = constants.DEFAULT_RATE_LIMIT_LATENCY_TOLERANCE,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._latency = None  # moving average of healthy response times
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                left = transport.remaining()
+                if left is not None and left <= 0:
+                    raise transport.CommandDeadlineExceeded(
+                        "Command deadline exceeded waiting for a free request slot"
+                    )
+                self._cond.wait(timeout=left)
+            self.in_flight += 1
+
+    def _decrease(self, now, latency):
+        # Requests already in flight when we backed off report the same
+        # congestion; only back off once per typical round trip.
+        if now - self._last_decrease < (self._latency or latency):
+            return False
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self._last_decrease = now
+        return True
+
+    def release(self, latency: float, congested: bool) -> Optional[str]:
+        """
+        Record a finished request. Returns why the limit was lowered, if
+        it was.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = monotonic()
+            reason = None
+            if congested:
+                reason = "throttled"
+            elif (
+                self._samples >= constants.DEFAULT_RATE_LIMIT_MIN_SAMPLES
+                and latency > self.latency_tolerance * self._latency
+            ):
+                reason = "slow"
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if not congested:
+                # Slow responses count too, so a lasting slowdown becomes
+                # the new normal rather than pinning the limit at its minimum.
+                self._samples += 1
+                self._latency = (
+                    latency
+                    if self._latency is None
+                    else 0.9 * self._latency + 0.1 * latency
+                )
+            if reason is not None and not self._decrease(now, latency):
+                reason = None
+            self._cond.notify_all()
+            return reason
+
+
+class EndpointLimiter:
+    def __init__(
+        self, bucket: Optional[TokenBucket], concurrency: AdaptiveConcurrency
+    ):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.stats = collections.Counter()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Wait for a token and a concurrency slot, then yield a callback to
+        report the response with.
+        """
+        if self.bucket is not None:
+            self.bucket.acquire()
+        self.concurrency.acquire()
+        self.stats["requests"] += 1
+        started = monotonic()
+        outcome = {"congested": True}  # unless a response says otherwise
+
+        def record(resp):
+            outcome["congested"] = resp.status_code == 429
+            if resp.status_code == 429:
+                self.stats["throttled"] += 1
+                delay = retry_after(resp)
+                if delay and self.bucket is not None:
+                    self.bucket.pause(delay)
+
+        try:
+            yield record
+        finally:
+            reason = self.concurrency.release(
+                monotonic() - started, outcome["congested"]
+            )
+            if reason is not None:
+                self.stats[f"backoffs:{reason}"] += 1
+
+
+_LIMITERS: Dict[str, EndpointLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def _limits_for(settings, endpoint: str):
+    limits = getattr(settings, "rate_limits", None) or {}
+    limits = {url.rstrip("/"): config for url, config in limits.items()}
+    return limits.get(endpoint, limits.get("default"))
+
+
+def limiter_for(settings) -> Optional[EndpointLimiter]:
+    """
+    The shared limiter for the settings' endpoint_url, or None if no rate
+    limit is configured for it.
+    """
+    endpoint = str(settings.endpoint_url).rstrip("/")
+    config = _limits_for(settings, endpoint)
+    if config is None:
+        return None
+    with _LIMITERS_LOCK:
+        if endpoint not in _LIMITERS:
+            bucket = None
+            if config.requests_per_second:
+                bucket = TokenBucket(
+                    config.requests_per_second,
+                    config.burst or max(1, config.requests_per_second),
+                )
+            concurrency = AdaptiveConcurrency(
+                max_limit=config.max_concurrency
+                or constants.DEFAULT_RATE_LIMIT_MAX_CONCURRENCY,
+                min_limit=config.min_concurrency or 1,
+                latency_tolerance=config.latency_tolerance
+                or constants.DEFAULT_RATE_LIMIT_LATENCY_TOLERANCE,
+            )
+            _LIMITERS[endpoint] = EndpointLimiter(bucket, concurrency)
+        return _LIMITERS[endpoint]
@@ -0,0 +1,122 @@
+"""
+Retrying transient failures: throttling, gateway errors and dropped
+connections. Only idempotent methods are retried, with exponential
+backoff and full jitter, honouring Retry-After, within a total deadline.
+"""
+import collections
+import email.utils
+import random
+from time import monotonic, sleep, time
+from typing import Optional
+
+import requests
+
+from . import constants, transport
+from .transport import TimeoutSession, setting_or_default
+
+RETRY_METHODS = frozenset(["GET", "PUT", "DELETE"])
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        total: int = constants.DEFAULT_RETRY_TOTAL,
+        backoff_factor: float = constants.DEFAULT_RETRY_BACKOFF_FACTOR,
+        max_backoff: float = constants.DEFAULT_RETRY_MAX_BACKOFF,
+        deadline: float = constants.DEFAULT_RETRY_DEADLINE,
+    ):
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build a policy from the retry_* fields of Settings, where set."""
+        return cls(
+            total=setting_or_default(settings, "retry_total", constants.DEFAULT_RETRY_TOTAL),
+            backoff_factor=setting_or_default(
+                settings, "retry_backoff_factor", constants.DEFAULT_RETRY_BACKOFF_FACTOR
+            ),
+            max_backoff=setting_or_default(
+                settings, "retry_max_backoff", constants.DEFAULT_RETRY_MAX_BACKOFF
+            ),
+            deadline=setting_or_default(
+                settings, "retry_deadline", constants.DEFAULT_RETRY_DEADLINE
+            ),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: anywhere up to the exponentially growing cap."""
+        cap = min(self.max_backoff, self.backoff_factor * (2**attempt))
+        return random.uniform(0, cap)
+
+
+def retry_after(resp) -> Optional[float]:
+    """Seconds the server asked us to wait, from a Retry-After header."""
+    value = resp.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetrySession(TimeoutSession):
+    """
+    A TimeoutSession which retries idempotent requests according to
+    `retry_policy`. `retry_stats` counts attempts and retries (overall and
+    by cause) for instrumentation.
+    """
+
+    def __init__(self, retry_policy: RetryPolicy = None, settings=None, **kwargs):
+        super().__init__(settings=settings, **kwargs)
+        self.retry_policy = retry_policy or RetryPolicy.from_settings(settings)
+        self.retry_stats = collections.Counter()
+
+    def request(self, method, url, **kwargs):
+        policy = self.retry_policy
+        retryable = method.upper() in RETRY_METHODS
+        give_up_at = monotonic() + policy.deadline
+        if (left := transport.remaining()) is not None:
+            give_up_at = min(give_up_at, monotonic() + left)
+        attempt = 0
+
+        while True:
+            self.retry_stats["attempts"] += 1
+            try:
+                resp = super().request(method, url, **kwargs)
+            except RETRY_EXCEPTIONS as e:
+                if not retryable or attempt >= policy.total:
+                    raise
+                delay, cause = policy.backoff(attempt), type(e).__name__
+                if monotonic() + delay > give_up_at:
+                    self.retry_stats["deadline_exceeded"] += 1
+                    raise
+            else:
+                if (
+                    not retryable
+                    or resp.status_code not in RETRY_STATUSES
+                    or attempt >= policy.total
+                ):
+                    return resp
+                delay = retry_after(resp)
+                if delay is None:
+                    delay = policy.backoff(attempt)
+                cause = str(resp.status_code)
+                if monotonic() + delay > give_up_at:
+                    self.retry_stats["deadline_exceeded"] += 1
+                    return resp
+                resp.close()
+
+            self.retry_stats["retries"] += 1
+            self.retry_stats[f"retries:{cause}"] += 1
+            attempt += 1
+            sleep(delay)
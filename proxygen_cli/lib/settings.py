@@ -1,5 +1,5 @@
-from typing import Literal
-from pydantic import BaseSettings, AnyUrl
+from typing import Dict, Literal, Optional
+from pydantic import BaseModel, BaseSettings, AnyUrl
 
 import yaml
 
@@ -12,10 +12,44 @@ def _yaml_settings_file_source(_):
         return settings or {}
 
 
+class RateLimit(BaseModel):
+    requests_per_second: Optional[float] = None
+    burst: Optional[int] = None
+    max_concurrency: Optional[int] = None
+    min_concurrency: Optional[int] = None
+    latency_tolerance: Optional[float] = None
+
+
 class Settings(BaseSettings):
     endpoint_url: AnyUrl = "https://proxygen.prod.api.platform.nhs.uk"
     spec_output_format: Literal["json", "yaml"] = "yaml"
     api: str = None
+    # Seconds to trust the cached minimum CLI version (see constants for defaults)
+    version_check_ttl: Optional[int] = None
+    # "blocking" checks before a command runs, "concurrent" alongside its requests
+    version_check_mode: Optional[Literal["blocking", "concurrent"]] = None
+    # Retries of GET/PUT/DELETE on 429/502/503/504 and dropped connections
+    retry_total: Optional[int] = None
+    retry_backoff_factor: Optional[float] = None
+    retry_max_backoff: Optional[float] = None
+    retry_deadline: Optional[float] = None
+    # Connection pool size, timeouts and an overall limit on each command, in seconds
+    http_pool_size: Optional[int] = None
+    connect_timeout: Optional[float] = None
+    read_timeout: Optional[float] = None
+    command_deadline: Optional[float] = None
+    # Opt in to gzipping spec and instance uploads of at least compress_threshold bytes
+    compress_uploads: Optional[bool] = None
+    compress_threshold: Optional[int] = None
+    # Cache GET responses on disk, revalidating them with ETags where possible
+    http_cache: Optional[bool] = None
+    http_cache_ttl: Optional[int] = None
+    http_cache_max_size: Optional[int] = None
+    # Cache resolved specs on disk, checking the files they came from on every use
+    spec_cache: Optional[bool] = None
+    spec_cache_max_size: Optional[int] = None
+    # Client-side limits by endpoint_url (or "default"), see lib/rate_limit.py
+    rate_limits: Optional[Dict[str, RateLimit]] = None
 
     class Config:
         env_prefix: Literal["PROXYGEN_CREDENTIALS_"]
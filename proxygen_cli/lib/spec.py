@@ -2,52 +2,205 @@
 Proxygen resolves internal file refs and remote refs.
 We only need to resolve external file refs.
 """
+import collections
+import contextlib
+import copy
 import os
 from typing import Dict, List, Union
 import pathlib
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 
 import yaml
 import click
 
+from . import codec, spec_cache, trace
+from .settings import SETTINGS
 
-def _find_file_refs(obj, obj_loc: List[Union[str, int]] = None):
-    if obj_loc is None:
-        obj_loc = []
-
-    if isinstance(obj, dict):
-        refs = []
-        for key, value in obj.items():
-            refs = refs + _find_file_refs(value, obj_loc + [key])
-        return refs
-    elif isinstance(obj, list):
-        refs = []
-        for index, item in enumerate(obj):
-            refs = refs + _find_file_refs(item, obj_loc + [index])
-        return refs
-    elif isinstance(obj, str) and obj_loc and obj_loc[-1] == "$ref":
-        internal_ref = len(obj) > 0 and obj[0] == "#"
-        url_parsed = urlparse(obj)
-        remote_ref = True if url_parsed.scheme else False
-        if not remote_ref and not internal_ref:
-            # Then it's a file ref, which is what we're looking for!
-            return [(obj_loc, obj)]
-        return []
-    return []
-
-
-def _update_obj(obj, keys, sub_obj):
-
-    if len(keys) > 1:
-        obj[keys[0]] = _update_obj(obj[keys[0]], keys[1:], sub_obj)
-        return obj
-    elif len(keys) == 1:
-        return sub_obj
-    else:
-        raise ValueError("Cannot update obj with no keys.")
-
-
-def resolve(file_name, pop_keys=None):
+
+# libyaml's parser where PyYAML was built with it, which is much faster
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def load_yaml(data):
+    """yaml.safe_load, using libyaml where available."""
+    try:
+        return yaml.load(data, Loader=YAML_LOADER)
+    except yaml.YAMLError:
+        if YAML_LOADER is yaml.SafeLoader:
+            raise
+        # For the pure Python parser's more detailed error message
+        return yaml.load(data, Loader=yaml.SafeLoader)
+
+
+def _is_file_ref(ref) -> bool:
+    """True for a $ref to another file, rather than within this one or remote."""
+    if not isinstance(ref, str):
+        return False
+    internal_ref = len(ref) > 0 and ref[0] == "#"
+    remote_ref = True if urlparse(ref).scheme else False
+    return not remote_ref and not internal_ref
+
+
+def _location(loc) -> List[Union[str, int]]:
+    """Expand a (parent, key) chain into the list of keys from the root."""
+    keys = []
+    while loc is not None:
+        loc, key = loc
+        keys.append(key)
+    return keys[::-1]
+
+
+def _parse_pointer(fragment: str) -> tuple:
+    """The reference tokens of a JSON pointer (RFC 6901) URI fragment."""
+    if not fragment:
+        return ()
+    if not fragment.startswith("/"):
+        raise ValueError(f"Not a JSON pointer: #{fragment}")
+    return tuple(
+        token.replace("~1", "/").replace("~0", "~")
+        for token in unquote(fragment).split("/")[1:]
+    )
+
+
+def _pointer_target(document, pointer: tuple):
+    """The node `pointer` points to in `document`. Raises LookupError if none."""
+    node = document
+    for token in pointer:
+        if isinstance(node, list):
+            if not token.isdigit():
+                raise LookupError(token)
+            node = node[int(token)]
+        elif isinstance(node, dict):
+            if token not in node and token.isdigit() and int(token) in node:
+                # YAML reads unquoted keys such as response codes as ints
+                token = int(token)
+            node = node[token]
+        else:
+            raise LookupError(token)
+    return node
+
+
+def _ref_name(file_key, fragment: str) -> str:
+    return f"{file_key}#{fragment}" if fragment else str(file_key)
+
+
+def _inline_file_refs(spec, locate, load, stats=None):
+    """
+    Replace every object holding a file $ref with the node it refers to,
+    in a single depth-first walk which also resolves the refs inside each
+    inlined node.
+
+    A ref is a file, optionally followed by a JSON pointer into it, as in
+    `schemas.yaml#/components/schemas/Patient`. `locate(file_ref, keys)`
+    returns a key identifying the referenced file and `load(file_key)`
+    parses it. Each file is parsed once and kept unmodified, so that any
+    number of refs can point into it; later refs to the same file and
+    pointer get a copy of the node already resolved for it. `stats`
+    counts files_read and cache_hits.
+
+    A ref is circular if the node it points to contains a ref that is
+    already being inlined, which allows files whose parts refer to each
+    other. Each node is visited once, so this is linear in the size of
+    the resolved spec. Locations are kept as (parent, key) chains and only
+    expanded into key lists for error messages and at refs.
+    """
+    if stats is None:
+        stats = collections.Counter()
+    seen = set()
+    documents = {}  # file key -> its document, as parsed
+    resolved = {}  # (file key, pointer) -> the resolved node it points to
+
+    def walk(container, key, loc, origin, ancestry):
+        # `origin` is the (file key, pointer, depth) that the node at depth
+        # `depth` of `loc` was inlined from, and `ancestry` the locations in
+        # their files of the refs being inlined around this one.
+        value = container[key]
+        loaded = []
+        while (
+            isinstance(value, dict)
+            and "$ref" in value
+            and _is_file_ref(value["$ref"])
+        ):
+            keys = _location((loc, "$ref"))
+            file_ref, _, fragment = value["$ref"].partition("#")
+            file_key = locate(file_ref, keys)
+            try:
+                pointer = _parse_pointer(fragment)
+            except ValueError as e:
+                raise click.ClickException(f"{e} in $ref {file_ref} at {keys}")
+            if (file_key, pointer) in resolved:
+                # Copied so that the spec never shares nodes between refs
+                stats["cache_hits"] += 1
+                container[key] = copy.deepcopy(resolved[file_key, pointer])
+                resolved.update(dict.fromkeys(loaded, container[key]))
+                return
+
+            # Resolved nodes hold no refs, so only new ones can be circular
+            source_key, source_pointer, depth = origin
+            here = source_pointer + tuple(str(k) for k in keys[depth:-1])
+            ancestry = ancestry + ((source_key, here),)
+            if any(
+                ref_key == file_key and ref_pointer[: len(pointer)] == pointer
+                for ref_key, ref_pointer in ancestry
+            ):
+                raise click.ClickException(
+                    f"Circular $ref {_ref_name(file_key, fragment)} at {keys}"
+                )
+            if file_key in documents:
+                stats["cache_hits"] += 1
+            else:
+                stats["files_read"] += 1
+                documents[file_key] = load(file_key)
+            try:
+                target = _pointer_target(documents[file_key], pointer)
+            except LookupError:
+                raise click.ClickException(
+                    f"Unable to resolve $ref {_ref_name(file_key, fragment)} "
+                    f"at {keys}"
+                )
+            loaded.append((file_key, pointer))
+            origin = (file_key, pointer, len(keys) - 1)
+            value = container[key] = copy.deepcopy(target)
+
+        # YAML anchors can share a node between several places
+        if isinstance(value, (dict, list)) and id(value) not in seen:
+            seen.add(id(value))
+            items = value.items() if isinstance(value, dict) else enumerate(value)
+            for child_key, child in items:
+                if isinstance(child, (dict, list)):
+                    walk(value, child_key, (loc, child_key), origin, ancestry)
+        resolved.update(dict.fromkeys(loaded, value))
+
+    root = [spec]
+    walk(root, 0, None, (None, (), 0), ())
+    return root[0]
+
+
+def resolve(file_name, pop_keys=None, stats=None):
+    """
+    Load the spec in `file_name`, inlining the files it $refs. If given,
+    the `stats` Counter is updated with the number of files_read and
+    cache_hits (refs to files already read), and spec_cache_hits or
+    spec_cache_misses when the spec_cache setting is on.
+    """
+    if stats is None:
+        stats = collections.Counter()
+    with trace.span("spec.resolve", file=str(file_name)) as attributes:
+        if spec_cache.enabled(SETTINGS):
+            spec = spec_cache.lookup_or_resolve(
+                SETTINGS,
+                file_name,
+                pop_keys,
+                lambda manifest: _resolve(file_name, pop_keys, stats, manifest),
+                stats,
+            )
+        else:
+            spec = _resolve(file_name, pop_keys, stats)
+        attributes.update(stats)
+        return spec
+
+
+def _resolve(file_name, pop_keys, stats, manifest=None):
 
     if pop_keys is None:
         pop_keys = []
@@ -56,37 +209,46 @@ def resolve(file_name, pop_keys=None):
     if not root_file.exists() or root_file.is_dir():
         raise click.ClickException(f"No such file {root_file}")
 
-    def load_templated_yaml(yml_str: str) -> Dict:
+    def load_templated_yaml(yml_str: str, path=None) -> Dict:
+        if str(path).lower().endswith(".json"):
+            # Much faster than YAML, which is a superset of JSON anyway
+            with contextlib.suppress(codec.JSONDecodeError):
+                return codec.loads(yml_str)
         try:
-            return yaml.safe_load(yml_str)
+            return load_yaml(yml_str)
 
         except yaml.YAMLError as exc:
             raise click.ClickException(
                 f"{exc}\nHint: Spec file is most likely not valid YAML"
             )
 
-    with root_file.open() as f:
-        spec = load_templated_yaml(f.read())
+    def read(path):
+        if manifest is not None:
+            return spec_cache.read_recorded(path, manifest)
+        with path.open() as f:
+            return f.read()
+
+    spec = load_templated_yaml(read(root_file), file_name)
 
     for key in pop_keys:
         spec.pop(key, None)
 
-    # We need this while loop to handle the case where a file a $ref has a $ref inside it.
-    # The first loop replaces the outer ref, but also adds a ref.
-    # This Very Hacky Method can almost certainly be replaced with something more elegant.
-    # but... tomorrow is my last day, so it won't be me doing it.
-    while file_refs := _find_file_refs(spec):
-        spec_dir = root_file.parent.absolute().resolve()
-
-        for keys, file_ref in file_refs:
-            file_path = spec_dir.joinpath(file_ref)
-            if not file_path.exists() or file_path.is_dir():
-                raise click.ClickException(f"Unable to resolve $ref {file_path} at {keys}")
-            with file_path.open() as f:
-                sub_spec = load_templated_yaml(f.read())
-
-            spec = _update_obj(spec, keys, sub_spec)
-    return spec
+    spec_dir = None
+
+    def locate(file_ref, keys):
+        nonlocal spec_dir
+        if spec_dir is None:
+            spec_dir = root_file.parent.absolute().resolve()
+        # Refs are relative to the root spec, even within referenced files
+        file_path = spec_dir.joinpath(file_ref)
+        if not file_path.exists() or file_path.is_dir():
+            raise click.ClickException(f"Unable to resolve $ref {file_path} at {keys}")
+        return file_path.resolve()
+
+    def load(file_path):
+        return load_templated_yaml(read(file_path), file_path)
+
+    return _inline_file_refs(spec, locate, load, stats)
 
 
 
@@ -0,0 +1,136 @@
+"""
+An on-disk cache of resolved specs, so that resolving an unchanged spec
+tree skips reading, parsing and inlining its files.
+
+Entries are keyed by the root file's absolute path and the keys popped
+from it. Each holds the resolved spec and a manifest of every file read
+to build it: path, size, mtime and SHA-256. An entry is only used while
+every file still matches. Files with the same size and mtime are trusted
+unless they were modified within a second of the entry being stored,
+when a rewrite could leave the mtime unchanged; any others are hashed.
+
+Specs are pickled, since YAML can produce dates and other values JSON
+cannot hold, and unpickled allowing only the classes YAML produces.
+"""
+import hashlib
+import io
+import json
+import os
+import pickle
+import time
+
+from proxygen_cli import __version__ as proxygen_cli_version
+
+from . import constants
+from .disk_cache import DiskCache
+from .dot_proxygen import cache_directory
+from .transport import setting_or_default
+
+# Trust a file's mtime only if it is this much older than the entry
+RACY_MTIME_NS = 1_000_000_000
+
+ALLOWED_CLASSES = frozenset(
+    [
+        ("datetime", "date"),
+        ("datetime", "datetime"),
+        ("datetime", "timedelta"),
+        ("datetime", "timezone"),
+    ]
+)
+
+
+def enabled(settings) -> bool:
+    return setting_or_default(settings, "spec_cache", constants.DEFAULT_SPEC_CACHE)
+
+
+def cache_key(root_file, pop_keys) -> str:
+    return json.dumps(
+        [proxygen_cli_version, os.path.abspath(root_file), sorted(pop_keys or [])]
+    )
+
+
+def read_recorded(path, manifest: list) -> bytes:
+    """Read the file at `path`, adding its manifest record to `manifest`."""
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    manifest.append(
+        (
+            os.path.abspath(path),
+            stat.st_size,
+            stat.st_mtime_ns,
+            hashlib.sha256(data).hexdigest(),
+        )
+    )
+    return data
+
+
+def _unchanged(record, trusted_before_ns: int) -> bool:
+    path, size, mtime_ns, digest = record
+    try:
+        stat = os.stat(path)
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime_ns == mtime_ns and mtime_ns < trusted_before_ns:
+            return True
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest() == digest
+    except OSError:
+        return False
+
+
+class _SpecUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in ALLOWED_CLASSES:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed")
+        return super().find_class(module, name)
+
+
+class SpecCache:
+    def __init__(self, settings):
+        self.cache = DiskCache(
+            cache_directory("spec"),
+            setting_or_default(
+                settings, "spec_cache_max_size", constants.DEFAULT_SPEC_CACHE_MAX_SIZE
+            ),
+        )
+
+    def lookup(self, key: str):
+        """The cached spec for `key` if none of its files changed, else None."""
+        data = self.cache.get(key)
+        if data is None:
+            return None
+        try:
+            buffer = io.BytesIO(data)
+            # The manifest is pickled first, so a stale spec is never unpickled
+            stored_at_ns, manifest = _SpecUnpickler(buffer).load()
+            trusted_before_ns = stored_at_ns - RACY_MTIME_NS
+            if not all(_unchanged(record, trusted_before_ns) for record in manifest):
+                return None
+            return _SpecUnpickler(buffer).load()
+        except Exception:  # a corrupt or incompatible entry is just a miss
+            return None
+
+    def store(self, key: str, spec, manifest: list):
+        buffer = io.BytesIO()
+        pickle.dump((time.time_ns(), manifest), buffer, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(spec, buffer, pickle.HIGHEST_PROTOCOL)
+        self.cache.set(key, buffer.getvalue())
+
+
+def lookup_or_resolve(settings, root_file, pop_keys, resolve, stats):
+    """
+    The resolved spec from the cache, or from `resolve(manifest)`, which
+    must record every file it reads in `manifest` with read_recorded().
+    """
+    cache = SpecCache(settings)
+    key = cache_key(root_file, pop_keys)
+    spec = cache.lookup(key)
+    if spec is not None:
+        stats["spec_cache_hits"] += 1
+        return spec
+    stats["spec_cache_misses"] += 1
+    manifest = []
+    spec = resolve(manifest)
+    cache.store(key, spec, manifest)
+    return spec
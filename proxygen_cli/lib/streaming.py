@@ -0,0 +1,86 @@
+"""
+Request bodies that are encoded and gzip-compressed as they are sent,
+rather than holding the whole document in memory up front.
+"""
+import zlib
+from typing import Any, Iterator
+
+from proxygen_cli.lib import codec
+
+CHUNK_SIZE = 64 * 1024
+
+# Levels of objects whose members are encoded one at a time. A spec's
+# paths hold almost all of it, so this encodes it a path item at a time.
+SPLIT_DEPTH = 2
+
+
+def _json_pieces(content: Any, depth: int = SPLIT_DEPTH) -> Iterator[str]:
+    """
+    Encode `content` as codec.dumps(content) would, in pieces. Objects down
+    to `depth` levels are written member by member, and everything below
+    them in one go by codec.dumps, which is several times faster than
+    encoding piece by piece with iterencode.
+    """
+    if not (
+        depth
+        and isinstance(content, dict)
+        and all(isinstance(key, str) for key in content)
+    ):
+        yield codec.dumps(content)
+        return
+    separator = "{"
+    for key, value in content.items():
+        yield f"{separator}{codec.dumps(key)}:"
+        yield from _json_pieces(value, depth - 1)
+        separator = ","
+    yield "}" if content else "{}"
+
+
+class JsonBody:
+    """
+    A request body holding `content` as JSON. Iterating it yields the JSON
+    in chunks of at least `chunk_size` bytes, gzip-compressed on the fly
+    when `compress` is set, so that encoding and compression overlap with
+    sending and only a chunk or so of the JSON is held in memory at once.
+
+    requests sends iterables with chunked transfer encoding. Each iteration
+    starts afresh, so the same body can be sent again on a retry.
+    """
+
+    def __init__(self, content: Any, compress: bool = False, chunk_size=CHUNK_SIZE):
+        self.content = content
+        self.compress = compress
+        self.chunk_size = chunk_size
+
+    def _json_chunks(self) -> Iterator[bytes]:
+        pending, size = [], 0
+        for piece in _json_pieces(self.content):
+            pending.append(piece)
+            size += len(piece)
+            if size >= self.chunk_size:
+                yield "".join(pending).encode()
+                pending, size = [], 0
+        if pending:
+            yield "".join(pending).encode()
+
+    def at_least(self, limit: int) -> bool:
+        """
+        True if the uncompressed JSON is `limit` bytes or more, encoding no
+        more of it than it takes to tell.
+        """
+        size = 0
+        for chunk in self._json_chunks():
+            size += len(chunk)
+            if size >= limit:
+                return True
+        return False
+
+    def __iter__(self) -> Iterator[bytes]:
+        if not self.compress:
+            yield from self._json_chunks()
+            return
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in self._json_chunks():
+            if compressed := compressor.compress(chunk):
+                yield compressed
+        yield compressor.flush()
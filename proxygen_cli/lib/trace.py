@@ -0,0 +1,413 @@
+"""
+Per-command tracing: timed spans around the phases of a command (spec
+resolution, token acquisition, the version check) and a record of every
+HTTP request made by the proxygen and Keycloak sessions, with DNS,
+connect, TLS, send and time-to-first-byte timings.
+
+Tracing is off unless `start()` is called, which `proxygen --trace FILE`
+does. The trace is written as JSON by `finish()`, and optionally as a HAR
+file for browser devtools and HAR viewers. Authorization headers, cookies
+and secret-bearing query parameters are redacted; request and response
+bodies are never recorded, only their sizes.
+"""
+import contextlib
+import itertools
+import json
+import socket
+import threading
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+from proxygen_cli import __version__ as proxygen_cli_version
+
+REDACTED = "REDACTED"
+REDACT_HEADERS = frozenset(
+    ["authorization", "proxy-authorization", "cookie", "set-cookie"]
+)
+REDACT_PARAMS = frozenset(
+    [
+        "access_token",
+        "client_assertion",
+        "client_secret",
+        "code",
+        "password",
+        "refresh_token",
+        "session_code",
+        "token",
+    ]
+)
+PHASES = ("dns", "connect", "tls", "send", "wait")
+
+# The trace being recorded, if any.
+_TRACE = None
+
+# Per thread: the open spans, and the timings of the request in progress.
+_LOCAL = threading.local()
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def redact_url(url: str) -> str:
+    """`url` with any password and secret query parameters replaced."""
+    parts = urlsplit(url)
+    netloc = parts.netloc
+    if parts.password is not None:
+        netloc = netloc.replace(f":{parts.password}@", f":{REDACTED}@", 1)
+    query = urlencode(
+        [
+            (key, REDACTED if key.lower() in REDACT_PARAMS else value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        ]
+    )
+    return urlunsplit(parts._replace(netloc=netloc, query=query))
+
+
+def redact_headers(headers) -> dict:
+    redacted = {}
+    for key, value in (headers or {}).items():
+        if key.lower() in REDACT_HEADERS:
+            value = REDACTED
+        elif key.lower() == "location":
+            value = redact_url(value)
+        redacted[key] = value
+    return redacted
+
+
+class Trace:
+    def __init__(self, command: Optional[str] = None):
+        self.command = command
+        self.started_at = datetime.now(timezone.utc)
+        self._started = perf_counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.spans = []
+        self.requests = []
+
+    def offset(self, when: float) -> float:
+        """Milliseconds from the start of the trace to perf_counter() `when`."""
+        return _ms(when - self._started)
+
+    def add_span(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+
+    def add_request(self, entry: dict):
+        with self._lock:
+            self.requests.append(entry)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "command": self.command,
+                "started": self.started_at.isoformat(),
+                "duration_ms": self.offset(perf_counter()),
+                "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+                "requests": sorted(self.requests, key=lambda req: req["start_ms"]),
+            }
+
+    def to_har(self) -> dict:
+        entries = []
+        for req in self.to_dict()["requests"]:
+            timings = req["timings"]
+            started = self.started_at.timestamp() + req["start_ms"] / 1000
+            entries.append(
+                {
+                    "startedDateTime": datetime.fromtimestamp(
+                        started, timezone.utc
+                    ).isoformat(),
+                    "time": timings["total"],
+                    "request": {
+                        "method": req["method"],
+                        "url": req["url"],
+                        "httpVersion": "HTTP/1.1",
+                        "cookies": [],
+                        "headers": _har_pairs(req["request_headers"]),
+                        "queryString": _har_pairs(
+                            dict(parse_qsl(urlsplit(req["url"]).query))
+                        ),
+                        "headersSize": -1,
+                        "bodySize": req["bytes_sent"],
+                    },
+                    "response": {
+                        "status": req["status"] or 0,
+                        "statusText": req["reason"] or req["error"] or "",
+                        "httpVersion": "HTTP/1.1",
+                        "cookies": [],
+                        "headers": _har_pairs(req["response_headers"]),
+                        "content": {
+                            "size": req["bytes_received"],
+                            "mimeType": req["response_headers"].get(
+                                "Content-Type", ""
+                            ),
+                        },
+                        "redirectURL": req["response_headers"].get("Location", ""),
+                        "headersSize": -1,
+                        "bodySize": req["bytes_received"],
+                    },
+                    "cache": {},
+                    "timings": {
+                        "blocked": -1,
+                        "dns": timings["dns"] if req["new_connection"] else -1,
+                        # HAR counts the TLS handshake in connect as well as ssl
+                        "connect": timings["connect"] + timings["tls"]
+                        if req["new_connection"]
+                        else -1,
+                        "ssl": timings["tls"] if req["new_connection"] else -1,
+                        "send": timings["send"],
+                        "wait": timings["wait"],
+                        "receive": timings["receive"],
+                    },
+                }
+            )
+        return {
+            "log": {
+                "version": "1.2",
+                "creator": {"name": "proxygen-cli", "version": proxygen_cli_version},
+                "entries": entries,
+            }
+        }
+
+
+def _har_pairs(mapping: dict) -> list:
+    return [{"name": key, "value": value} for key, value in mapping.items()]
+
+
+def start(command: Optional[str] = None) -> Trace:
+    """Start recording a trace for this process."""
+    global _TRACE
+    _TRACE = Trace(command)
+    return _TRACE
+
+
+def active() -> bool:
+    return _TRACE is not None
+
+
+def finish(trace_file=None, har_file=None) -> Optional[Trace]:
+    """Stop recording, writing the trace to `trace_file` and/or `har_file`."""
+    global _TRACE
+    trace, _TRACE = _TRACE, None
+    if trace is None:
+        return None
+    if trace_file:
+        with open(trace_file, "w") as f:
+            json.dump(trace.to_dict(), f, indent=2, default=str)
+    if har_file:
+        with open(har_file, "w") as f:
+            json.dump(trace.to_har(), f, indent=2)
+    return trace
+
+
+def _open_spans() -> list:
+    if not hasattr(_LOCAL, "spans"):
+        _LOCAL.spans = []
+    return _LOCAL.spans
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """
+    Time the enclosed block as a span of the current trace, if any. Yields
+    the span's attributes, for the block to add its results to.
+    """
+    trace = _TRACE
+    if trace is None:
+        yield {}
+        return
+    open_spans = _open_spans()
+    record = {
+        "id": next(trace._ids),
+        "parent": open_spans[-1]["id"] if open_spans else None,
+        "name": name,
+        "thread": threading.current_thread().name,
+        "attributes": attributes,
+        "error": None,
+    }
+    open_spans.append(record)
+    started = perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        open_spans.pop()
+        record["start_ms"] = trace.offset(started)
+        record["duration_ms"] = _ms(perf_counter() - started)
+        trace.add_span(record)
+
+
+def _current_timings() -> Optional[dict]:
+    return getattr(_LOCAL, "timings", None)
+
+
+@contextlib.contextmanager
+def request(method: str, url: str, headers=None):
+    """
+    Record the enclosed request. Yields a callback taking the response;
+    the traced connection classes below fill in the phase timings.
+    """
+    trace = _TRACE
+    if trace is None:
+        yield lambda resp: None
+        return
+    timings = dict.fromkeys(PHASES, 0.0)
+    timings.update(bytes_sent=0, new_connection=False)
+    open_spans = _open_spans()
+    entry = {
+        "span": open_spans[-1]["id"] if open_spans else None,
+        "method": method.upper(),
+        "url": redact_url(url),
+        "status": None,
+        "reason": None,
+        "error": None,
+        "request_headers": redact_headers(headers),
+        "response_headers": {},
+        "bytes_received": -1,
+    }
+
+    def record(resp):
+        entry["url"] = redact_url(resp.url or url)
+        entry["status"] = resp.status_code
+        entry["reason"] = resp.reason
+        entry["request_headers"] = redact_headers(resp.request.headers)
+        entry["response_headers"] = redact_headers(resp.headers)
+        with contextlib.suppress(AttributeError, TypeError):
+            entry["bytes_received"] = resp.raw.tell()
+
+    _LOCAL.timings = timings
+    started = perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        entry["error"] = type(e).__name__
+        raise
+    finally:
+        _LOCAL.timings = None
+        total = _ms(perf_counter() - started)
+        phases = {phase: round(timings[phase], 3) for phase in PHASES}
+        phases["receive"] = round(max(0.0, total - sum(phases.values())), 3)
+        phases["total"] = total
+        entry.update(
+            start_ms=trace.offset(started),
+            timings=phases,
+            new_connection=timings["new_connection"],
+            bytes_sent=timings["bytes_sent"],
+        )
+        trace.add_request(entry)
+
+
+class _TracedConnection:
+    """
+    Mixin for urllib3 connections which adds each phase's duration to the
+    timings of the request in progress on this thread.
+    """
+
+    def _new_conn(self):
+        timings = _current_timings()
+        if timings is None:
+            return super()._new_conn()
+        timings["new_connection"] = True
+        started = perf_counter()
+        try:
+            addresses = socket.getaddrinfo(
+                self._dns_host, self.port, 0, socket.SOCK_STREAM
+            )
+        except OSError:
+            # Let urllib3 report the failure as it normally would
+            return super()._new_conn()
+        resolved = perf_counter()
+        timings["dns"] += _ms(resolved - started)
+
+        host, error = self._dns_host, None
+        try:
+            # Connect to the addresses just resolved, in order, as
+            # create_connection would, rather than resolving them again.
+            for *_, sockaddr in addresses:
+                self._dns_host = sockaddr[0]
+                try:
+                    return super()._new_conn()
+                except NewConnectionError as e:
+                    error = e
+            raise error
+        finally:
+            self._dns_host = host
+            timings["connect"] += _ms(perf_counter() - resolved)
+
+    def request(self, *args, **kwargs):
+        timings = _current_timings()
+        if timings is None:
+            return super().request(*args, **kwargs)
+        # Plain HTTP connects lazily while sending; don't count that as send
+        before = timings["dns"] + timings["connect"] + timings["tls"]
+        started = perf_counter()
+        try:
+            return super().request(*args, **kwargs)
+        finally:
+            setup = timings["dns"] + timings["connect"] + timings["tls"] - before
+            timings["send"] += max(0.0, _ms(perf_counter() - started) - setup)
+
+    def getresponse(self, *args, **kwargs):
+        timings = _current_timings()
+        if timings is None:
+            return super().getresponse(*args, **kwargs)
+        started = perf_counter()
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            timings["wait"] += _ms(perf_counter() - started)
+
+    def send(self, data):
+        timings = _current_timings()
+        if timings is not None and not hasattr(data, "read"):
+            timings["bytes_sent"] += len(data)
+        return super().send(data)
+
+
+class TracedHTTPConnection(_TracedConnection, HTTPConnection):
+    pass
+
+
+class TracedHTTPSConnection(_TracedConnection, HTTPSConnection):
+    def connect(self):
+        timings = _current_timings()
+        if timings is None:
+            return super().connect()
+        before = timings["dns"] + timings["connect"]
+        started = perf_counter()
+        try:
+            return super().connect()
+        finally:
+            # Whatever connect() spent beyond the TCP connection is the TLS handshake
+            elapsed = _ms(perf_counter() - started)
+            timings["tls"] += max(
+                0.0, elapsed - (timings["dns"] + timings["connect"] - before)
+            )
+
+
+class _TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+
+class _TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+
+class TracingAdapter(HTTPAdapter):
+    """An HTTPAdapter whose connections report their phase timings."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TracedHTTPConnectionPool,
+            "https": _TracedHTTPSConnectionPool,
+        }
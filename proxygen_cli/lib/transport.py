@@ -0,0 +1,111 @@
+"""
+Connection pooling, timeouts and the per-command deadline shared by the
+proxygen and Keycloak sessions.
+"""
+from time import monotonic
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import constants, trace
+
+# monotonic() time by which the current command must finish, if any.
+_DEADLINE = None
+
+
+class CommandDeadlineExceeded(RuntimeError):
+    pass
+
+
+def set_deadline(seconds: Optional[float]):
+    """
+    Require all further requests to complete within `seconds` from now.
+    Long-running commands such as `proxygen agent` and the local servers
+    call this with None, as the command_deadline setting is meant for
+    one-shot commands.
+    """
+    global _DEADLINE
+    _DEADLINE = None if seconds is None else monotonic() + seconds
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the command deadline, or None if there is none."""
+    if _DEADLINE is None:
+        return None
+    return _DEADLINE - monotonic()
+
+
+def setting_or_default(settings, key, default):
+    """`settings.key`, or `default` when there are no settings or it is unset."""
+    value = getattr(settings, key, None) if settings is not None else None
+    return default if value is None else value
+
+
+def request_timeout(settings) -> tuple:
+    """
+    (connect, read) timeouts from Settings, each capped by whatever is
+    left of the command deadline.
+    """
+    connect = setting_or_default(
+        settings, "connect_timeout", constants.DEFAULT_CONNECT_TIMEOUT
+    )
+    read = setting_or_default(settings, "read_timeout", constants.DEFAULT_READ_TIMEOUT)
+    left = remaining()
+    if left is not None:
+        if left <= 0:
+            raise CommandDeadlineExceeded("Command deadline exceeded")
+        connect, read = min(connect, left), min(read, left)
+    return connect, read
+
+
+def http_adapter(**kwargs) -> HTTPAdapter:
+    """An HTTPAdapter, which reports connection timings if tracing is on."""
+    if trace.active():
+        return trace.TracingAdapter(**kwargs)
+    return HTTPAdapter(**kwargs)
+
+
+def mount_pool(session: requests.Session, settings) -> requests.Session:
+    """Size the session's connection pools from Settings."""
+    pool_size = setting_or_default(
+        settings, "http_pool_size", constants.DEFAULT_HTTP_POOL_SIZE
+    )
+    adapter = http_adapter(pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class TimeoutSession(requests.Session):
+    """
+    A requests.Session that never waits forever: every request gets the
+    configured connect/read timeouts, bounded by the command deadline.
+    If `limiter` is given (see rate_limit.py), each request first waits
+    for it and then reports its response to it. Requests are recorded in
+    the command's trace when tracing is on (see trace.py).
+    """
+
+    def __init__(self, settings=None, limiter=None, **kwargs):
+        super().__init__(**kwargs)
+        self.settings = settings
+        self.limiter = limiter
+        mount_pool(self, settings)
+
+    def _send(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = request_timeout(self.settings)
+        if not trace.active():
+            return super().request(method, url, **kwargs)
+        with trace.request(method, url, kwargs.get("headers")) as record:
+            resp = super().request(method, url, **kwargs)
+            record(resp)
+        return resp
+
+    def request(self, method, url, **kwargs):
+        if self.limiter is None:
+            return self._send(method, url, **kwargs)
+        with self.limiter.slot() as record:
+            resp = self._send(method, url, **kwargs)
+            record(resp)
+        return resp
@@ -1,12 +1,92 @@
+import json
+import os
+import threading
+from time import time
+
+import click
 from packaging.version import parse
 
-from proxygen_cli.lib import proxygen_api
+from proxygen_cli.lib import proxygen_api, trace
+from proxygen_cli.lib.constants import DEFAULT_VERSION_CHECK_TTL
+from proxygen_cli.lib.dot_proxygen import version_cache_file
+from proxygen_cli.lib.locking import atomic_write_text
+from proxygen_cli.lib.settings import SETTINGS
 from proxygen_cli import __version__ as proxygen_cli_version
 
+# Set to any non-empty value to always ask /_status for the minimum version.
+NO_VERSION_CACHE_ENV_VAR = "PROXYGEN_NO_VERSION_CACHE"
 
-def validate_cli_version():
-    status = proxygen_api.status()
-    required_cli_version = parse(status["proxygen_cli"]["min_version"])
+
+def _read_version_cache():
+    try:
+        with version_cache_file().open() as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def required_cli_version():
+    """
+    The minimum proxygen-cli version the proxygen service accepts.
+    Cached in ~/.proxygen for `version_check_ttl` seconds per endpoint.
+    """
+    use_cache = not os.environ.get(NO_VERSION_CACHE_ENV_VAR)
+    ttl = SETTINGS.version_check_ttl
+    if ttl is None:
+        ttl = DEFAULT_VERSION_CHECK_TTL
+    endpoint = str(SETTINGS.endpoint_url)
+
+    if use_cache:
+        cached = _read_version_cache().get(endpoint)
+        if cached is not None and time() - cached["checked_at"] < ttl:
+            return cached["min_version"]
+
+    with trace.span("version.check", endpoint=endpoint):
+        status = proxygen_api.status()
+    min_version = status["proxygen_cli"]["min_version"]
+
+    if use_cache:
+        cache = _read_version_cache()
+        cache[endpoint] = {"min_version": min_version, "checked_at": time()}
+        atomic_write_text(version_cache_file(), json.dumps(cache))
+    return min_version
+
+
+def _check_cli_version(min_version):
+    required_cli_version = parse(min_version)
     current_cli_version = parse(proxygen_cli_version)
     if current_cli_version < required_cli_version:
         raise RuntimeError(f"This version proxygen-cli is out-of-date. Please update to {required_cli_version}")
+
+
+def _validate_cli_version_concurrently(ctx):
+    """
+    Look up the required version in the background and only enforce it
+    once the command finishes, keeping the lookup off the critical path.
+    """
+    result = {}
+
+    def lookup():
+        try:
+            result["min_version"] = required_cli_version()
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=lookup, daemon=True)
+    thread.start()
+
+    def check():
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+        _check_cli_version(result["min_version"])
+
+    ctx.call_on_close(check)
+
+
+def validate_cli_version():
+    ctx = click.get_current_context(silent=True)
+    if SETTINGS.version_check_mode == "concurrent" and ctx is not None:
+        _validate_cli_version_concurrently(ctx)
+    else:
+        _check_cli_version(required_cli_version())
@@ -0,0 +1,148 @@
+"""
+Tests around the local token agent.
+"""
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from time import time
+from unittest.mock import patch
+
+import pytest
+
+from proxygen_cli.lib import agent, auth
+from proxygen_cli.lib.credentials import get_credentials
+from proxygen_cli.test.auth_test import _token_source_credentials, make_token
+
+
+@pytest.fixture(name="running_agent")
+def running_agent_fixture(user_credentials, monkeypatch):
+    # AF_UNIX paths are length limited, so avoid pytest's deep tmp_path
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "agent.sock"
+        monkeypatch.setenv(agent.SOCKET_ENV_VAR, str(path))
+        token_agent = agent.TokenAgent()
+        server = agent.AgentServer(path, token_agent)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield token_agent
+        server.shutdown()
+        server.server_close()
+
+
+def test_access_token_served_by_agent(running_agent):
+    token = make_token()
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        return_value={"access_token": token},
+    ) as login:
+        assert auth.access_token() == token
+
+    # A fresh process: nothing memoized, and the agent answers without disk access
+    auth.clear_token_memo()
+    with patch("proxygen_cli.lib.auth._read_cache") as read_cache:
+        assert auth.access_token() == token
+
+    login.assert_called_once()
+    read_cache.assert_not_called()
+
+
+def test_agent_refreshes_tokens_ahead_of_expiry(running_agent):
+    # 75% of the way through its 40s lifetime, so due for renewal straight away
+    first = make_token(lifetime=10, iat=int(time()) - 30)
+    second = make_token(lifetime=400)
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        side_effect=[{"access_token": first}, {"access_token": second}],
+    ):
+        assert auth.access_token() == first
+        running_agent.refresh_due()
+        auth.clear_token_memo()
+        assert auth.access_token() == second
+
+
+def test_no_agent_falls_back(user_credentials, monkeypatch, tmp_path):
+    monkeypatch.setenv(agent.SOCKET_ENV_VAR, str(tmp_path / "missing.sock"))
+    assert agent.request_token("any-key", 10) is None
+
+
+def _ask_agent(cache_key, credentials):
+    """Send the agent a request and credentials for `cache_key`, returning its reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(agent.CLIENT_TIMEOUT)
+        sock.connect(os.environ[agent.SOCKET_ENV_VAR])
+        with sock.makefile("rwb") as f:
+            reply = agent._exchange(f, {"cache_key": cache_key, "min_validity": 10})
+            assert reply == {"error": "unknown"}
+            return agent._exchange(f, {"credentials": credentials})
+
+
+def test_agent_rejects_cache_key_of_other_credentials(running_agent):
+    credentials = json.loads(get_credentials().json())
+    other = get_credentials().copy(update={"username": "other"})
+    other_key = auth.credentials_fingerprint(other)
+
+    with patch("proxygen_cli.lib.auth._get_token_data_from_user_login") as login:
+        reply = _ask_agent(other_key, credentials)
+
+    assert reply == {"error": "cache_key does not match the credentials"}
+    login.assert_not_called()
+    assert running_agent.token(other_key, 10) is None
+
+
+def test_token_source_bypasses_agent(running_agent, update_config, monkeypatch):
+    token = make_token()
+    monkeypatch.setenv("UPSTREAM_TOKEN", token)
+    update_config(credentials=_token_source_credentials(token_env_var="UPSTREAM_TOKEN"))
+    auth.clear_token_memo()
+
+    with patch("proxygen_cli.lib.agent.request_token") as request_token:
+        assert auth.access_token() == token
+
+    request_token.assert_not_called()
+
+
+def test_agent_rejects_token_source_credentials(
+    running_agent, update_config, monkeypatch
+):
+    monkeypatch.setenv("UPSTREAM_TOKEN", make_token())
+    update_config(credentials=_token_source_credentials(token_env_var="UPSTREAM_TOKEN"))
+    credentials = get_credentials()
+
+    reply = _ask_agent(
+        auth.credentials_fingerprint(credentials), json.loads(credentials.json())
+    )
+
+    assert reply == {"error": "The agent does not serve tokens from a token source"}
+    assert running_agent.token(auth.credentials_fingerprint(credentials), 10) is None
+
+
+def test_agent_command_forks_and_closes_stdout(tmp_path):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "agent.sock"
+        process = subprocess.Popen(
+            [sys.executable, "-m", "proxygen_cli.cli.command_main", "agent"],
+            stdout=subprocess.PIPE,
+            env={**os.environ, "HOME": str(tmp_path), agent.SOCKET_ENV_VAR: str(path)},
+        )
+        # As in eval $(proxygen agent): read stdout until it is closed
+        stdout, _ = process.communicate(timeout=30)
+        assert process.returncode == 0
+
+        exports = dict(
+            line.split(";")[0].split("=", 1) for line in stdout.decode().splitlines()
+        )
+        pid = int(exports[agent.PID_ENV_VAR])
+        try:
+            assert exports[agent.SOCKET_ENV_VAR] == str(path)
+            # The socket is listening before the parent exits
+            assert agent._socket_is_live(path)
+        finally:
+            os.kill(pid, signal.SIGTERM)
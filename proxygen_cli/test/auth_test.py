@@ -0,0 +1,451 @@
+"""
+Tests around access token acquisition and caching.
+"""
+import json
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from time import sleep, time
+from unittest.mock import patch
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from pydantic.error_wrappers import ValidationError
+
+from proxygen_cli.lib import auth
+from proxygen_cli.lib.credentials import Credentials
+from proxygen_cli.lib.dot_proxygen import token_cache_file
+from proxygen_cli.test.command_credentials_test import get_test_credentials
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def make_token(lifetime=300, **claims):
+    return jwt.encode({"exp": int(time()) + lifetime, **claims}, "not-a-real-secret-only-for-testing")
+
+
+def test_access_token_logs_in_and_writes_cache(user_credentials):
+    token = make_token()
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        return_value={"access_token": token},
+    ) as login:
+        assert auth.access_token() == token
+
+    login.assert_called_once()
+    cache = json.loads(token_cache_file().read_text())
+    assert cache[auth.cache_key()] == {"access_token": token}
+
+
+def test_access_token_memoized_in_process(user_credentials):
+    token = make_token()
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        return_value={"access_token": token},
+    ):
+        auth.access_token()
+
+    with patch("proxygen_cli.lib.auth._read_cache") as read_cache, patch(
+        "proxygen_cli.lib.auth.jwt.decode"
+    ) as decode, patch("proxygen_cli.lib.auth.get_credentials") as get_credentials:
+        for _ in range(5):
+            assert auth.access_token() == token
+
+    read_cache.assert_not_called()
+    decode.assert_not_called()
+    get_credentials.assert_not_called()
+
+
+def test_access_token_memo_respects_expiry(user_credentials):
+    expired = make_token(lifetime=5)
+    fresh = make_token()
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        side_effect=[{"access_token": expired}, {"access_token": fresh}],
+    ) as login:
+        assert auth.access_token() == expired
+        assert auth.access_token() == fresh
+
+    assert login.call_count == 2
+
+
+def test_access_token_memo_invalidated_by_credentials_change(
+    user_credentials, update_config
+):
+    first, second = make_token(sub="first"), make_token(sub="second")
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        side_effect=[{"access_token": first}, {"access_token": second}],
+    ):
+        assert auth.access_token() == first
+        update_config(credentials=get_test_credentials(username="another-user"))
+        assert auth.access_token() == second
+
+
+def test_concurrent_threads_login_once(user_credentials):
+    token = make_token()
+    results = []
+
+    def slow_login(credentials=None):
+        sleep(0.1)
+        return {"access_token": token}
+
+    def worker():
+        results.append(auth.access_token())
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        side_effect=slow_login,
+    ) as login:
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert results == [token] * 10
+    login.assert_called_once()
+
+
+def test_reuses_token_written_while_waiting_for_lock(user_credentials):
+    """
+    Simulate another process winning the race: by the time we hold the
+    lock the cache already contains a fresh token, so we must not log in.
+    """
+    token = make_token()
+    real_file_lock = auth.file_lock
+
+    @contextmanager
+    def other_process_refreshes_first(lock_file):
+        with real_file_lock(lock_file):
+            token_cache_file().write_text(
+                json.dumps({auth.cache_key(): {"access_token": token}})
+            )
+            yield
+
+    with patch(
+        "proxygen_cli.lib.auth.file_lock", other_process_refreshes_first
+    ), patch("proxygen_cli.lib.auth._get_token_data_from_user_login") as login:
+        assert auth.access_token() == token
+
+    login.assert_not_called()
+
+
+def test_truncated_cache_is_replaced_atomically(user_credentials):
+    token = make_token()
+    token_cache_file().write_text('{"truncated": ')
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        return_value={"access_token": token},
+    ):
+        assert auth.access_token() == token
+
+    cache_dir = token_cache_file().parent
+    assert json.loads(token_cache_file().read_text()) == {
+        auth.cache_key(): {"access_token": token}
+    }
+    assert not [p for p in cache_dir.iterdir() if p.name.startswith(".token_cache")]
+
+
+def test_token_refresher_renews_in_background(user_credentials):
+    now = int(time())
+    # 75% of the way through its 40s lifetime, so due for renewal straight away
+    ageing = make_token(lifetime=10, iat=now - 30)
+    renewed = make_token(lifetime=40, iat=now)
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        side_effect=[
+            {"access_token": ageing, "refresh_token": make_token(lifetime=600)},
+        ],
+    ) as login, patch(
+        "proxygen_cli.lib.auth._get_token_data_from_refresh_token",
+        return_value={"access_token": renewed},
+    ) as refresh:
+        with auth.TokenRefresher(fraction=0.75) as refresher:
+            for _ in range(100):
+                if refresher._exp == now + 40:
+                    break
+                sleep(0.01)
+            assert refresher._exp == now + 40
+
+        assert auth.access_token() == renewed
+
+    login.assert_called_once()
+    refresh.assert_called_once()
+
+
+def test_token_refresher_waits_when_token_not_renewed(user_credentials):
+    now = int(time())
+    ageing = make_token(lifetime=10, iat=now - 30)
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login",
+        return_value={
+            "access_token": ageing,
+            "refresh_token": make_token(lifetime=600),
+        },
+    ), patch(
+        "proxygen_cli.lib.auth._get_token_data_from_refresh_token",
+        return_value={"access_token": ageing},
+    ) as refresh:
+        with auth.TokenRefresher(fraction=0.75, retry_interval=60) as refresher:
+            sleep(0.2)
+            assert refresher._refresh_at > time() + 50
+
+    refresh.assert_called_once()
+
+
+def test_token_refresher_rejects_bad_fraction():
+    with pytest.raises(ValueError):
+        auth.TokenRefresher(fraction=1.5)
+
+
+@pytest.fixture(name="machine_credentials")
+def machine_credentials_fixture(update_config, tmp_path):
+    key_file = tmp_path / "client.key"
+    key_file.write_text((FIXTURES / "client.key").read_text())
+    update_config(
+        credentials="\n".join(
+            [
+                "base_url: https://mock-keycloak-url.nhs.uk",
+                "client_id: mock-api-client",
+                f"private_key_path: {key_file}",
+                "key_id: mock-kid",
+            ]
+        )
+    )
+    yield key_file
+
+
+def test_client_assertion_signed_with_private_key(machine_credentials):
+    assertion = auth.client_assertion()
+
+    public_key = serialization.load_pem_private_key(
+        machine_credentials.read_bytes(), password=None
+    ).public_key()
+    claims = jwt.decode(
+        assertion,
+        public_key,
+        algorithms=["RS512"],
+        audience="https://mock-keycloak-url.nhs.uk",
+    )
+    assert claims["iss"] == claims["sub"] == "mock-api-client"
+    assert jwt.get_unverified_header(assertion)["kid"] == "mock-kid"
+
+
+def test_private_key_parsed_once_while_unchanged(machine_credentials):
+    with patch(
+        "proxygen_cli.lib.credentials.serialization.load_pem_private_key",
+        wraps=serialization.load_pem_private_key,
+    ) as load_key:
+        first = auth.client_assertion()
+        second = auth.client_assertion()
+        assert load_key.call_count == 1
+
+        machine_credentials.write_text(machine_credentials.read_text() + "\n")
+        auth.client_assertion()
+        assert load_key.call_count == 2
+
+    assert first != second  # fresh jti each time
+
+
+@pytest.mark.parametrize(
+    "page, expected_action",
+    [
+        (
+            "login.html",
+            "https://identity.prod.api.platform.nhs.uk/realms/api-producers/login-actions/authenticate"
+            "?session_code=8dIAn6Zk1D1ZqsQdPq1JW6a2Y0pRT0W1gT2xHXKLk9U"
+            "&execution=3f6d2b2c-1c49-4c83-a7a3-7b0a7a7f5c41"
+            "&client_id=proxygen-cli-user-client&tab_id=Qw3rTy",
+        ),
+        (
+            "login_legacy_theme.html",
+            "https://identity.ptl.api.platform.nhs.uk/realms/api-producers/login-actions/authenticate"
+            "?session_code=x_Y-z&execution=e1&client_id=proxygen-cli-user-client&tab_id=aB9",
+        ),
+    ],
+)
+def test_login_form_action(page, expected_action):
+    html_page = (FIXTURES / "keycloak" / page).read_text()
+
+    assert auth.login_form_action(html_page) == expected_action
+    assert auth._login_form_action_lxml(html_page) == expected_action
+
+
+def test_login_form_action_falls_back_to_lxml():
+    page = (FIXTURES / "keycloak" / "login.html").read_text()
+
+    with patch(
+        "proxygen_cli.lib.auth._LoginFormScanner.handle_starttag"
+    ), patch(
+        "proxygen_cli.lib.auth._login_form_action_lxml", return_value="https://lxml"
+    ) as lxml_scan:
+        assert auth.login_form_action(page) == "https://lxml"
+    lxml_scan.assert_called_once()
+
+
+def test_login_form_action_missing():
+    with pytest.raises(RuntimeError, match="kc-form-login"):
+        auth.login_form_action("<html><body><p>Service unavailable</p></body></html>")
+
+
+def test_lxml_not_imported_on_startup():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, proxygen_cli.lib.proxygen_api; print('lxml' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
+
+
+@pytest.mark.parametrize(
+    "offline_access, expected_scope",
+    [(None, "openid"), (False, "openid"), (True, "openid offline_access")],
+)
+def test_user_login_requests_offline_access(
+    update_config, offline_access, expected_scope
+):
+    extra = {} if offline_access is None else {"offline_access": offline_access}
+    update_config(credentials=get_test_credentials(**extra))
+
+    with patch("proxygen_cli.lib.auth.RetrySession") as session:
+        session.return_value.get.return_value.status_code = 503
+        with pytest.raises(RuntimeError):
+            auth._get_token_data_from_user_login()
+
+    params = session.return_value.get.call_args.kwargs["params"]
+    assert params["scope"] == expected_scope
+
+
+def test_offline_refresh_token_preferred_over_login(user_credentials):
+    # Offline refresh tokens need not carry an exp claim
+    offline_refresh_token = jwt.encode(
+        {"typ": "Offline"}, "not-a-real-secret-only-for-testing"
+    )
+    expired = make_token(lifetime=-60)
+    renewed = make_token()
+    token_cache_file().write_text(
+        json.dumps(
+            {
+                auth.cache_key(): {
+                    "access_token": expired,
+                    "refresh_token": offline_refresh_token,
+                }
+            }
+        )
+    )
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_refresh_token",
+        return_value={"access_token": renewed},
+    ) as refresh, patch(
+        "proxygen_cli.lib.auth._get_token_data_from_user_login"
+    ) as login:
+        assert auth.access_token() == renewed
+
+    refresh.assert_called_once()
+    login.assert_not_called()
+    # The offline token is kept for next time when Keycloak doesn't rotate it
+    cached = json.loads(token_cache_file().read_text())[auth.cache_key()]
+    assert cached["refresh_token"] == offline_refresh_token
+
+
+def _token_source_credentials(**source):
+    return "\n".join(
+        ["base_url: https://mock-keycloak-url.nhs.uk"]
+        + [f"{key}: '{value}'" for key, value in source.items()]
+    )
+
+
+def test_token_from_credential_process_is_cached(update_config, tmp_path):
+    token = make_token()
+    script = tmp_path / "mint_token.py"
+    script.write_text(f"print('{{\"access_token\": \"{token}\"}}')")
+    update_config(
+        credentials=_token_source_credentials(
+            credential_process=f"{sys.executable} {script}"
+        )
+    )
+    auth.clear_token_memo()
+
+    with patch(
+        "proxygen_cli.lib.auth.subprocess.run", wraps=subprocess.run
+    ) as run, patch("proxygen_cli.lib.auth._get_token_data_from_machine_user") as login:
+        assert auth.access_token() == token
+        auth.clear_token_memo()  # as if in a new process
+        assert auth.access_token() == token
+
+    run.assert_called_once()
+    login.assert_not_called()
+
+
+def test_token_from_env_var(update_config, monkeypatch):
+    token = make_token()
+    monkeypatch.setenv("UPSTREAM_TOKEN", token)
+    update_config(credentials=_token_source_credentials(token_env_var="UPSTREAM_TOKEN"))
+    auth.clear_token_memo()
+
+    assert auth.access_token() == token
+
+
+def test_token_from_file(update_config, tmp_path):
+    token = make_token()
+    token_file = tmp_path / "token.json"
+    token_file.write_text(json.dumps({"access_token": token, "expires_in": 300}))
+    update_config(credentials=_token_source_credentials(token_file=token_file))
+    auth.clear_token_memo()
+
+    assert auth.access_token() == token
+
+
+def test_expired_token_from_source_rejected(update_config, monkeypatch):
+    monkeypatch.setenv("UPSTREAM_TOKEN", make_token(lifetime=-1))
+    update_config(credentials=_token_source_credentials(token_env_var="UPSTREAM_TOKEN"))
+    auth.clear_token_memo()
+
+    with pytest.raises(RuntimeError, match="token_env_var has expired"):
+        auth.access_token()
+
+
+def test_token_refresher_leaves_token_source_alone(update_config, monkeypatch):
+    now = int(time())
+    # Due for renewal straight away, which the token source cannot do
+    monkeypatch.setenv("UPSTREAM_TOKEN", make_token(lifetime=10, iat=now - 30))
+    update_config(credentials=_token_source_credentials(token_env_var="UPSTREAM_TOKEN"))
+    auth.clear_token_memo()
+
+    with patch(
+        "proxygen_cli.lib.auth._get_token_data_from_token_source",
+        wraps=auth._get_token_data_from_token_source,
+    ) as read_source:
+        with auth.TokenRefresher(fraction=0.75) as refresher:
+            sleep(0.2)
+            assert refresher._thread is None
+
+    read_source.assert_called_once()
+
+
+def test_only_one_token_source_allowed(update_config):
+    update_config(
+        credentials=_token_source_credentials(
+            token_file="token.json", token_env_var="UPSTREAM_TOKEN"
+        )
+    )
+
+    with pytest.raises(ValidationError, match="Only one of token_file, token_env_var"):
+        Credentials()
@@ -0,0 +1,77 @@
+import datetime
+import json
+
+import pytest
+
+from proxygen_cli.lib import codec, output
+
+BACKENDS = ["json"] + (["orjson"] if codec.orjson is not None else [])
+
+DOCUMENT = {
+    "openapi": "3.0.0",
+    "info": {"title": "Hello World", "version": datetime.date(2023, 1, 2)},
+    "x-deployed": datetime.datetime(2023, 1, 2, 3, 4, 5),
+    "paths": {"/hello": {"get": {"responses": {200: {"description": "OK"}}}}},
+    "examples": [1, 2.5, True, None, "text", [], {}],
+}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_indented_output_matches_stdlib(backend):
+    assert codec.dumps(DOCUMENT, indent=True, backend=backend) == json.dumps(
+        DOCUMENT, indent=2, default=str
+    )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_compact_output(backend):
+    assert codec.dumps(DOCUMENT, backend=backend) == json.dumps(
+        DOCUMENT, separators=(",", ":"), default=str
+    )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize(
+    "value",
+    [
+        "café ☕",
+        2**70,
+        float("nan"),
+        [None, float("inf")],
+        {"x": float("-inf")},
+        1e16,
+        -1.5e300,
+        1e-7,
+        1.234e-05,
+        5e-324,
+    ],
+)
+def test_stdlib_fallbacks(backend, value):
+    assert codec.dumps({"a": value}, indent=True, backend=backend) == json.dumps(
+        {"a": value}, indent=2
+    )
+    assert codec.dumps({"a": value}, backend=backend) == json.dumps(
+        {"a": value}, separators=(",", ":")
+    )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("value", [0.0001, 1e15, 123.456, -0.0, None])
+def test_floats_without_exponent(backend, value):
+    assert codec.dumps({"a": value}, backend=backend) == json.dumps(
+        {"a": value}, separators=(",", ":")
+    )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_loads(backend):
+    text = json.dumps(DOCUMENT, default=str)
+
+    assert codec.loads(text, backend=backend) == json.loads(text)
+    assert codec.loads(text.encode(), backend=backend) == json.loads(text)
+    with pytest.raises(codec.JSONDecodeError):
+        codec.loads("{not json", backend=backend)
+
+
+def test_output_to_json():
+    assert output.to_json(DOCUMENT) == json.dumps(DOCUMENT, indent=2, default=str)
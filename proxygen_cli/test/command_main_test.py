@@ -1,6 +1,11 @@
 import json
 from unittest.mock import patch
+
+import pytest
 from click.testing import CliRunner
+
+from proxygen_cli.cli import command_spec
+from proxygen_cli.lib import transport
 from proxygen_cli.cli.command_main import status, main  # Import `main` for the version test
 from proxygen_cli.lib.settings import Settings
 from proxygen_cli.test.command_settings_test import get_test_settings
@@ -34,3 +39,55 @@ def test_main_version():
 
     # Assert that the output contains the version information automatically provided by Click
     assert "proxygen, version" in version_output  # This works as Click handles versioning
+
+
+@pytest.fixture(name="deadline_setting")
+def deadline_setting_fixture():
+    with patch(
+        "proxygen_cli.cli.command_main.SETTINGS", Settings(command_deadline=5)
+    ):
+        yield
+    transport.set_deadline(None)
+
+
+def test_one_shot_command_has_deadline(deadline_setting):
+    deadlines = []
+    with patch(
+        "proxygen_cli.lib.proxygen_api.status",
+        side_effect=lambda: deadlines.append(transport.remaining()) or {},
+    ):
+        result = CliRunner().invoke(main, ["status"])
+
+    assert result.exit_code == 0, result.output
+    assert 4 < deadlines[0] <= 5
+
+
+@pytest.mark.parametrize(
+    "args, serve",
+    [
+        (["agent", "--foreground"], "proxygen_cli.lib.agent.serve"),
+        (
+            ["mock-server", "--port", "0"],
+            "proxygen_cli.lib.mock_server.MockProxygenServer.serve_forever",
+        ),
+        (
+            ["mock-keycloak", "--port", "0"],
+            "proxygen_cli.lib.mock_keycloak.MockKeycloakServer.serve_forever",
+        ),
+        # Not registered under `spec`, so invoked directly
+        ([], "proxygen_cli.lib.spec_server.serve"),
+    ],
+)
+def test_long_running_commands_have_no_deadline(deadline_setting, args, serve):
+    deadlines = []
+    with patch(
+        serve, side_effect=lambda *_, **__: deadlines.append(transport.remaining())
+    ):
+        if args:
+            result = CliRunner().invoke(main, args)
+        else:
+            transport.set_deadline(5)
+            result = CliRunner().invoke(command_spec.serve, ["spec.yaml"])
+
+    assert result.exit_code == 0, result.output
+    assert deadlines == [None]
@@ -1,13 +1,24 @@
+import json
 from contextlib import contextmanager
 from unittest.mock import Mock, patch
 
 import pytest
 
+from proxygen_cli.lib import auth
 from proxygen_cli.lib.credentials import Credentials
 from proxygen_cli.lib.settings import Settings
 from proxygen_cli.test.mock_private_key import MOCK_PRIVATE_KEY
 
 
+@pytest.fixture(autouse=True)
+def isolated_home_fixture(tmp_path, monkeypatch):
+    """
+    Point ~ at the test's temp directory, so caches the CLI keeps in
+    ~/.proxygen never leak between tests or into the real home directory.
+    """
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+
 @pytest.fixture(name="default_config")
 def default_config_files_fixture(tmp_path):
     # tmp_path fixture creates a new directory in tmp/
@@ -105,6 +116,10 @@ def mock_response_fixture():
             self.status_code = status_code
             self.text = text
 
+        @property
+        def content(self):
+            return json.dumps(self.json_data).encode() if self.text else b""
+
         def json(self):
             return self.json_data
 
@@ -153,7 +168,7 @@ def patch_request_fixture(mock_response):
 
     def patched_request_func(status, response, _type="text"):
         response = Mock(return_value=mock_response(_type, response, status))
-        return patch("proxygen_cli.lib.proxygen_api.requests.Session.request", response)
+        return patch("requests.Session.request", response)
 
     yield patched_request_func
 
@@ -210,3 +225,25 @@ def patch_config_fixture(default_config):
             return patch("proxygen_cli.lib.credentials._CREDENTIALS", Credentials())
 
     yield patched_settings_func
+
+
+@pytest.fixture(name="user_credentials")
+def user_credentials_fixture(update_config):
+    """
+    Write valid username/password credentials and start from an empty
+    in-process token memo.
+    """
+    update_config(
+        credentials="\n".join(
+            [
+                "base_url: https://mock-keycloak-url.nhs.uk",
+                "client_id: mock-api-client",
+                "client_secret: 1a2f4g5",
+                "password: mock-password",
+                "username: mock-user",
+            ]
+        )
+    )
+    auth.clear_token_memo()
+    yield
+    auth.clear_token_memo()
@@ -0,0 +1,43 @@
+import os
+
+from proxygen_cli.lib.disk_cache import DiskCache
+
+
+def test_get_set(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=1000)
+
+    assert cache.get("key") is None
+    cache.set("key", b"value")
+    assert cache.get("key") == b"value"
+    cache.delete("key")
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_evicted(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=300)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.set(key, b"x" * 100)
+        os.utime(cache._path(key, ""), ns=(i * 10**9, i * 10**9))
+
+    cache.get("a")  # now the most recently used
+    cache.set("d", b"x" * 100)
+
+    assert [cache.get(key) is not None for key in "abcd"] == [
+        True,
+        False,
+        True,
+        True,
+    ]
+
+
+def test_invalidate_by_tag(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=1000)
+    cache.set("one", b"1", tag="api-a")
+    cache.set("two", b"2", tag="api-a")
+    cache.set("three", b"3", tag="api-b")
+
+    cache.invalidate("api-a")
+
+    assert cache.get("one", "api-a") is None
+    assert cache.get("two", "api-a") is None
+    assert cache.get("three", "api-b") == b"3"
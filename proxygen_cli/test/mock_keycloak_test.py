@@ -0,0 +1,136 @@
+"""
+Exercise the auth token flows against the mock Keycloak server.
+"""
+import pathlib
+
+import jwt
+import pytest
+from cryptography import x509
+
+from proxygen_cli.lib import auth
+from proxygen_cli.lib.mock_keycloak import MockKeycloakConfig, MockKeycloakServer
+
+FIXTURES = pathlib.Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture(name="keycloak")
+def keycloak_fixture(update_config, tmp_path):
+    servers = []
+
+    def start(credentials, **config):
+        client_cert = (FIXTURES / "client.pem").read_bytes()
+        config.setdefault("users", {"mock-user": "mock-password"})
+        config.setdefault(
+            "client_keys",
+            {"mock-machine-client": x509.load_pem_x509_certificate(client_cert).public_key()},
+        )
+        server = MockKeycloakServer(config=MockKeycloakConfig(**config))
+        server.start()
+        servers.append(server)
+        update_config(
+            credentials="\n".join([f"base_url: {server.realm_url}", *credentials])
+        )
+        auth.clear_token_memo()
+        return server
+
+    yield start
+    auth.clear_token_memo()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+USER = [
+    "client_id: mock-api-client",
+    "client_secret: 1a2f4g5",
+    "username: mock-user",
+    "password: mock-password",
+]
+
+
+def _claims(server, token, audience="account"):
+    return jwt.decode(token, server.public_key, algorithms=["RS256"], audience=audience)
+
+
+def test_user_login(keycloak):
+    server = keycloak(USER, access_token_lifetime=120)
+
+    token_data = auth._get_token_data_from_user_login()
+
+    claims = _claims(server, token_data["access_token"])
+    assert claims["sub"] == "mock-user"
+    assert claims["azp"] == "mock-api-client"
+    assert claims["exp"] - claims["iat"] == 120
+    refresh = _claims(server, token_data["refresh_token"], server.realm_url)
+    assert refresh["typ"] == "Refresh"
+
+
+def test_user_login_wrong_password(keycloak):
+    keycloak([*USER[:3], "password: not-the-password"])
+
+    with pytest.raises(ValueError, match="Invalid username or password"):
+        auth._get_token_data_from_user_login()
+
+
+def test_refresh(keycloak):
+    server = keycloak(USER)
+    refresh_token = auth._get_token_data_from_user_login()["refresh_token"]
+
+    token_data = auth._get_token_data_from_refresh_token(refresh_token)
+
+    assert _claims(server, token_data["access_token"])["sub"] == "mock-user"
+    assert auth._get_token_data_from_refresh_token("not-a-token") is None
+
+
+def test_offline_access(keycloak):
+    server = keycloak([*USER, "offline_access: true"])
+
+    token_data = auth._get_token_data_from_user_login()
+
+    refresh = _claims(server, token_data["refresh_token"], server.realm_url)
+    assert refresh["typ"] == "Offline"
+    assert "exp" not in refresh
+
+
+def test_machine_user_login(keycloak, tmp_path):
+    key_file = tmp_path / "client.key"
+    key_file.write_text((FIXTURES / "client.key").read_text())
+    server = keycloak(
+        [
+            "client_id: mock-machine-client",
+            f"private_key_path: {key_file}",
+            "key_id: mock-kid",
+        ]
+    )
+
+    token_data = auth._get_token_data_from_machine_user()
+
+    claims = _claims(server, token_data["access_token"])
+    assert claims["sub"] == "service-account-mock-machine-client"
+    assert "refresh_token" not in token_data
+
+
+def test_machine_user_wrong_key(keycloak, tmp_path):
+    key_file = tmp_path / "client.key"
+    key_file.write_text((FIXTURES / "client.key").read_text())
+    keycloak(
+        [
+            "client_id: mock-machine-client",
+            f"private_key_path: {key_file}",
+            "key_id: mock-kid",
+        ],
+        client_keys={"mock-machine-client": MockKeycloakServer().public_key},
+    )
+
+    with pytest.raises(RuntimeError, match="401"):
+        auth._get_token_data_from_machine_user()
+
+
+def test_access_token_logs_in_once(keycloak):
+    server = keycloak(USER)
+
+    first = auth.access_token()
+    auth.clear_token_memo()  # forces a read of the on-disk token cache
+    assert auth.access_token() == first
+
+    assert server.stats["tokens:authorization_code"] == 1
@@ -0,0 +1,143 @@
+"""
+Drive proxygen_api end to end against the mock proxygen server.
+"""
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from proxygen_cli.lib import proxygen_api
+from proxygen_cli.lib.mock_server import MockProxygenServer, MockServerConfig
+from proxygen_cli.lib.settings import Settings
+
+API = "mock-api"
+ENV = "internal-dev"
+SPEC = {"openapi": "3.0.0", "paths": {f"/p{i}": {"get": {}} for i in range(500)}}
+
+
+@pytest.fixture(name="start_server")
+def start_server_fixture(patch_access_token):
+    servers = []
+
+    def start(config=None, **settings):
+        server = MockProxygenServer(config=config)
+        server.start()
+        servers.append(server)
+        patcher = patch.multiple(
+            proxygen_api,
+            SETTINGS=Settings(endpoint_url=server.url, **settings),
+            _PROXYGEN_SESSION=None,
+            _GZIP_REJECTED=False,
+        )
+        patcher.start()
+        servers.append(patcher)
+        return server
+
+    with patch_access_token(), patch("proxygen_cli.lib.retry.sleep"):
+        yield start
+    for item in reversed(servers):
+        if isinstance(item, MockProxygenServer):
+            item.shutdown()
+            item.server_close()
+        else:
+            item.stop()
+
+
+def test_status(start_server):
+    start_server()
+    assert "min_version" in proxygen_api.status()["proxygen_cli"]
+
+
+def test_instance_lifecycle(start_server):
+    server = start_server(compress_threshold=1024)
+
+    assert proxygen_api.get_instance(API, ENV, "my-instance") is None
+    proxygen_api.put_instance(API, ENV, "my-instance", SPEC)
+    assert proxygen_api.get_instance(API, ENV, "my-instance") == SPEC
+
+    [listed] = proxygen_api.get_instances(API, ENV)
+    assert listed["name"] == "my-instance"
+    assert proxygen_api.get_resources(API, "instance") == [listed]
+
+    assert proxygen_api.delete_instance(API, ENV, "my-instance") == {}
+    assert proxygen_api.get_instances(API, ENV) == []
+    assert server.stats["requests:PUT"] == 1
+
+
+def test_specs(start_server):
+    start_server()
+
+    proxygen_api.put_spec(API, SPEC)
+    proxygen_api.put_spec(API, {"openapi": "3.0.0"}, uat=True)
+
+    assert proxygen_api.get_spec(API) == SPEC
+    assert proxygen_api.get_spec(API, uat=True) == {"openapi": "3.0.0"}
+    proxygen_api.delete_spec(API, uat=True)
+    assert proxygen_api.get_spec(API, uat=True) is None
+
+
+def test_secrets(start_server):
+    server = start_server()
+
+    proxygen_api.put_secret(API, ENV, "my-key", "apikey", "s3cret")
+    proxygen_api.put_mtls_secret(API, ENV, "my-cert", "CERT PEM", "KEY PEM")
+
+    assert server.store.secrets[(API, ENV, "apikey", "my-key")]["value"] == "s3cret"
+    mtls = server.store.secrets[(API, ENV, "mtls", "my-cert")]
+    assert (mtls["cert"], mtls["key"]) == ("CERT PEM", "KEY PEM")
+    assert {s["name"] for s in proxygen_api.get_secrets(API, ENV)} == {
+        "my-key",
+        "my-cert",
+    }
+    assert proxygen_api.delete_secret(API, ENV, "apikey", "my-key") == {}
+
+
+def test_tokens(start_server):
+    start_server()
+
+    assert proxygen_api.get_docker_login(API)["user"] == "AWS"
+    assert "access_token" in proxygen_api.get_pytest_nhsd_apim_token(API)
+
+
+def test_requires_bearer_token(start_server):
+    server = start_server()
+
+    assert requests.get(f"{server.url}/apis/{API}").status_code == 401
+
+
+def test_etag_revalidation(start_server, user_credentials):
+    server = start_server(http_cache=True)
+    proxygen_api.put_spec(API, SPEC)
+
+    assert proxygen_api.get_spec(API) == SPEC
+    assert proxygen_api.get_spec(API) == SPEC
+
+    assert server.stats["responses:304"] == 1
+
+
+def test_gzip_negotiation(start_server):
+    server = start_server(
+        MockServerConfig(accept_gzip=False, chunked_responses=True),
+        compress_uploads=True,
+        compress_threshold=1024,
+    )
+
+    proxygen_api.put_spec(API, SPEC)
+
+    assert server.stats["responses:415"] == 1
+    assert proxygen_api.get_spec(API) == SPEC
+
+
+def test_throttling_and_errors_are_retried(start_server):
+    server = start_server(
+        MockServerConfig(throttle_rps=10, error_rate=0.3, seed=1), retry_total=10
+    )
+
+    with patch("proxygen_cli.lib.retry.sleep", lambda delay: time.sleep(0.05)):
+        for _ in range(20):
+            assert proxygen_api.get_api(API) == {"name": API}
+
+    assert server.stats["responses:429"] >= 1
+    assert server.stats["responses:503"] >= 1
+    assert server.stats["responses:200"] == 20
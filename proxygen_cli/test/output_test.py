@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+import yaml
+
+from proxygen_cli.lib import output
+
+
+def test_to_yaml_multiline_strings():
+    spec = {
+        "description": "First line  \nSecond line\n",
+        "summary": "One line",
+        "x-list": [1, "two", None],
+    }
+
+    text = output.to_yaml(spec)
+
+    assert text == (
+        "description: |-\n"
+        "  First line\n"
+        "  Second line\n"
+        "summary: One line\n"
+        "x-list:\n"
+        "- 1\n"
+        "- two\n"
+        "- null\n"
+    )
+    assert yaml.safe_load(text)["description"] == "First line\nSecond line"
+
+
+@pytest.mark.parametrize(
+    "description, path",
+    [
+        ("Première ligne  \nZweite Zeile – ünïcødé\n\n日本語 " * 20, "/p"),
+        ("Ends in a blank line\n\n  ", "/p"),
+        ("Plain ASCII,  \nwith trailing spaces  \n\nand blank lines " * 20, "/p"),
+        ("Plain ASCII", "/a-rather-long-path" * 8),
+    ],
+)
+def test_to_yaml_matches_baseline_dumper(description, path):
+    # to_yaml used to be yaml.dump with the representer registered globally
+    class BaselineDumper(yaml.Dumper):
+        pass
+
+    BaselineDumper.add_representer(str, output.yaml_multiline_string_pipe)
+    spec = {
+        "info": {
+            "title": "Example API",
+            "description": description,
+            "version": "1.0",
+        },
+        "paths": {
+            f"{path}{i}": {
+                "get": {
+                    "operationId": f"op{i}",
+                    "summary": "x" * 100 + " y" * 20,
+                    "x-flags": [True, None, 1.5, "yes", "on", "null", ": colon"],
+                    "x-date": datetime.date(2024, 1, 2),
+                }
+            }
+            for i in range(20)
+        },
+    }
+
+    assert output.to_yaml(spec) == yaml.dump(spec, Dumper=BaselineDumper)
@@ -0,0 +1,66 @@
+"""
+Tests around the asyncio proxygen client.
+"""
+import asyncio
+import threading
+from time import sleep
+from unittest.mock import patch
+
+import click
+import pytest
+import requests
+
+from proxygen_cli.lib.proxygen_api_async import AsyncProxygenClient
+
+ENVS = ["internal-dev", "internal-qa", "ref", "int", "prod"]
+
+
+@pytest.fixture(name="slow_request")
+def slow_request_fixture(mock_response):
+    """Patch requests so each one takes a while, recording peak concurrency."""
+    state = {"in_flight": 0, "peak": 0, "urls": []}
+    lock = threading.Lock()
+
+    def request(method, url, **kwargs):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+            state["urls"].append(url)
+        sleep(0.05)
+        with lock:
+            state["in_flight"] -= 1
+        if url.endswith("/prod/instances"):
+            resp = requests.Response()
+            resp.status_code = 500
+            resp._content = b'{"error": "nope"}'
+            resp.request = requests.Request(method, url).prepare()
+            return resp
+        return mock_response("text", [{"url": url}], 200)
+
+    with patch("requests.Session.request", side_effect=request):
+        yield state
+
+
+def test_requests_run_concurrently(slow_request, patch_access_token):
+    async def main():
+        async with AsyncProxygenClient(max_connections=3) as client:
+            return await asyncio.gather(
+                *(client.get_instances("mock-api", env) for env in ENVS[:-1])
+            )
+
+    with patch_access_token():
+        results = asyncio.run(main())
+
+    assert [result[0]["url"].split("/")[-2] for result in results] == ENVS[:-1]
+    assert slow_request["peak"] == 3
+
+
+def test_errors_match_sync_api(slow_request, patch_access_token):
+    async def main():
+        async with AsyncProxygenClient() as client:
+            await client.get_instances("mock-api", "prod")
+
+    with patch_access_token(), pytest.raises(click.ClickException) as e:
+        asyncio.run(main())
+
+    assert "Unexpected response from proxygen server" in str(e.value)
@@ -0,0 +1,309 @@
+"""
+Tests for proxygen_api against a local stand-in for the proxygen server.
+"""
+import datetime
+import gzip
+import json
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import click
+import pytest
+
+from proxygen_cli.lib import codec, proxygen_api
+from proxygen_cli.lib.settings import Settings
+from proxygen_cli.lib.streaming import JsonBody
+
+BACKENDS = ["json"] + (["orjson"] if codec.orjson is not None else [])
+
+LARGE_SPEC = {
+    "paths": {f"/path-{i}": {"get": {"summary": "x" * 100}} for i in range(1000)}
+}
+
+
+class _UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding") != "chunked":
+            return self.rfile.read(int(self.headers["Content-Length"])), False
+        body = b""
+        while size := int(self.rfile.readline().split(b";")[0], 16):
+            body += self.rfile.read(size)
+            self.rfile.readline()
+        self.rfile.readline()
+        return body, True
+
+    def do_PUT(self):
+        body, chunked = self._read_body()
+        encoding = self.headers.get("Content-Encoding")
+        self.server.uploads.append(
+            {
+                "path": self.path,
+                "encoding": encoding,
+                "size": len(body),
+                "chunked": chunked,
+            }
+        )
+        if encoding == "gzip":
+            if not self.server.accept_gzip:
+                self.send_response(self.server.gzip_status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = gzip.decompress(body)
+        if "invalid" in json.loads(body):
+            self.send_response(400)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.server.bodies.append(json.loads(body))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "16")
+        self.end_headers()
+        self.wfile.write(b'{"status": "ok"}')
+
+    def do_GET(self):
+        self.server.gets.append(dict(self.headers))
+        etag, body = self.server.documents[self.path]
+        if etag is not None and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture(name="upload_server")
+def upload_server_fixture(patch_access_token):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _UploadHandler)
+    server.uploads, server.bodies, server.accept_gzip = [], [], True
+    server.gzip_status = 415
+    server.gets, server.documents = [], {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def use(**settings):
+        settings = Settings(
+            endpoint_url=f"http://127.0.0.1:{server.server_port}", **settings
+        )
+        return patch.multiple(
+            proxygen_api,
+            SETTINGS=settings,
+            _PROXYGEN_SESSION=None,
+            _GZIP_REJECTED=False,
+        )
+
+    with patch_access_token():
+        yield server, use
+    server.shutdown()
+    server.server_close()
+
+
+def test_large_upload_is_gzipped(upload_server):
+    server, use = upload_server
+    with use(compress_uploads=True):
+        assert proxygen_api.put_spec("my-api", LARGE_SPEC) == {"status": "ok"}
+
+    assert server.bodies == [LARGE_SPEC]
+    [upload] = server.uploads
+    assert upload["path"] == "/apis/my-api/spec"
+    assert upload["encoding"] == "gzip"
+    assert upload["size"] < len(json.dumps(LARGE_SPEC)) / 10
+    assert upload["chunked"]
+
+
+def test_small_upload_is_not_gzipped(upload_server):
+    server, use = upload_server
+    with use(compress_uploads=True):
+        proxygen_api.put_instance("my-api", "internal-dev", "my-instance", {"a": 1})
+
+    assert server.bodies == [{"a": 1}]
+    assert server.uploads[0]["encoding"] is None
+    assert not server.uploads[0]["chunked"]
+
+
+def test_compression_off_by_default(upload_server):
+    server, use = upload_server
+    with use():
+        proxygen_api.put_spec("my-api", LARGE_SPEC)
+
+    assert server.bodies == [LARGE_SPEC]
+    assert server.uploads[0]["encoding"] is None
+
+
+def test_compression_can_be_disabled(upload_server):
+    server, use = upload_server
+    with use(compress_uploads=False):
+        proxygen_api.put_spec("my-api", LARGE_SPEC)
+
+    assert server.bodies == [LARGE_SPEC]
+    assert server.uploads[0]["encoding"] is None
+    # Still encoded while it is sent
+    assert server.uploads[0]["chunked"]
+
+
+def test_compress_threshold(upload_server):
+    server, use = upload_server
+    with use(compress_uploads=True, compress_threshold=1):
+        proxygen_api.put_instance("my-api", "internal-dev", "my-instance", {"a": 1})
+
+    assert server.uploads[0]["encoding"] == "gzip"
+    assert server.bodies == [{"a": 1}]
+
+
+def test_falls_back_when_server_rejects_gzip(upload_server):
+    server, use = upload_server
+    server.accept_gzip = False
+    with use(compress_uploads=True):
+        proxygen_api.put_spec("my-api", LARGE_SPEC)
+        proxygen_api.put_spec("my-api", LARGE_SPEC, uat=True)
+
+    assert [u["encoding"] for u in server.uploads] == ["gzip", None, None]
+    assert server.bodies == [LARGE_SPEC, LARGE_SPEC]
+
+
+def test_invalid_content_does_not_turn_off_gzip(upload_server):
+    server, use = upload_server
+    invalid = {"invalid": True, **LARGE_SPEC}
+    with use(compress_uploads=True):
+        with pytest.raises(click.ClickException):
+            proxygen_api.put_spec("my-api", invalid)
+        proxygen_api.put_spec("my-api", LARGE_SPEC)
+
+    # Neither uploaded twice nor put off gzip
+    assert [u["encoding"] for u in server.uploads] == ["gzip", "gzip"]
+    assert server.bodies == [LARGE_SPEC]
+
+
+def test_bad_request_is_not_retried_uncompressed(upload_server):
+    server, use = upload_server
+    server.accept_gzip, server.gzip_status = False, 400
+    with use(compress_uploads=True):
+        with pytest.raises(click.ClickException):
+            proxygen_api.put_spec("my-api", LARGE_SPEC)
+
+    assert [u["encoding"] for u in server.uploads] == ["gzip"]
+
+
+@pytest.fixture(name="cached_api")
+def cached_api_fixture(upload_server, user_credentials):
+    server, use = upload_server
+    with use(http_cache=True):
+        yield server
+
+
+def test_http_cache_revalidates_with_etag(cached_api):
+    spec_path = "/apis/my-api/spec"
+    cached_api.documents[spec_path] = ('"v1"', {"openapi": "3.0.0"})
+
+    assert proxygen_api.get_spec("my-api") == {"openapi": "3.0.0"}
+    assert proxygen_api.get_spec("my-api") == {"openapi": "3.0.0"}
+
+    first, second = cached_api.gets
+    assert "If-None-Match" not in first
+    assert second["If-None-Match"] == '"v1"'
+
+    cached_api.documents[spec_path] = ('"v2"', {"openapi": "3.1.0"})
+    assert proxygen_api.get_spec("my-api") == {"openapi": "3.1.0"}
+
+
+def test_http_cache_ttl_without_validators(cached_api):
+    cached_api.documents["/apis/my-api/environments"] = (None, {"instances": []})
+
+    proxygen_api.get_resources("my-api")
+    proxygen_api.get_resources("my-api")
+    assert len(cached_api.gets) == 1
+
+    with patch("proxygen_cli.lib.http_cache.time", return_value=time.time() + 61):
+        proxygen_api.get_resources("my-api")
+    assert len(cached_api.gets) == 2
+
+
+def test_http_cache_invalidated_by_changes(cached_api):
+    cached_api.documents["/apis/my-api/environments"] = (None, {"instances": []})
+
+    proxygen_api.get_resources("my-api")
+    proxygen_api.put_instance("my-api", "internal-dev", "my-instance", {"a": 1})
+    proxygen_api.get_resources("my-api")
+
+    assert len(cached_api.gets) == 2
+
+
+def test_http_cache_off_by_default(upload_server, user_credentials):
+    server, use = upload_server
+    server.documents["/apis/my-api/spec"] = ('"v1"', {"openapi": "3.0.0"})
+    with use():
+        proxygen_api.get_spec("my-api")
+        proxygen_api.get_spec("my-api")
+
+    assert all("If-None-Match" not in headers for headers in server.gets)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_json_body_matches_codec_dumps(backend):
+    content = {
+        "spec": LARGE_SPEC,
+        "when": datetime.date(2023, 1, 2),
+        "n": [1.5, None],
+        "empty": {},
+        "codes": {200: {"description": "OK"}},
+        "café": "☕",
+    }
+    body = JsonBody(content, chunk_size=1024)
+
+    with patch.object(codec, "BACKEND", backend):
+        chunks = list(body)
+        assert len(chunks) > 1
+        assert b"".join(chunks) == codec.dumps(content).encode()
+        assert list(body) == chunks  # can be sent again on a retry
+    assert json.loads(b"".join(chunks)) == json.loads(json.dumps(content, default=str))
+
+
+def test_json_body_gzip():
+    body = JsonBody(LARGE_SPEC, compress=True, chunk_size=1024)
+
+    assert json.loads(gzip.decompress(b"".join(body))) == LARGE_SPEC
+
+
+def test_json_body_at_least():
+    assert JsonBody({"a": 1}).at_least(7)
+    assert not JsonBody({"a": 1}).at_least(8)
+    assert JsonBody(LARGE_SPEC).at_least(100)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_json_body_peak_memory(compress):
+    # About 5MB of JSON, mostly in paths as in a real spec
+    spec = {
+        "openapi": "3.0.0",
+        "paths": {
+            f"/path-{i}": {"get": {"summary": f"{i:05}" * 500, "tags": ["a"] * 50}}
+            for i in range(2000)
+        },
+    }
+    body = JsonBody(spec, compress=compress)
+
+    tracemalloc.start()
+    try:
+        size = sum(len(chunk) for chunk in body)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert compress or size > 5_000_000
+    assert peak < 1_000_000
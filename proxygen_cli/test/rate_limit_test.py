@@ -0,0 +1,182 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from proxygen_cli.lib import rate_limit, transport
+from proxygen_cli.lib.proxygen_api import ProxygenSession
+from proxygen_cli.lib.settings import Settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture(name="clock")
+def clock_fixture():
+    clock = FakeClock()
+    with patch.object(rate_limit, "monotonic", clock.monotonic), patch.object(
+        rate_limit, "sleep", clock.sleep
+    ):
+        yield clock
+
+
+@pytest.fixture(autouse=True)
+def reset_limiters():
+    rate_limit._LIMITERS.clear()
+    yield
+    rate_limit._LIMITERS.clear()
+    transport.set_deadline(None)
+
+
+def response(status_code, headers=None):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers.update(headers or {})
+    return resp
+
+
+def test_token_bucket_allows_burst_then_rate(clock):
+    bucket = rate_limit.TokenBucket(rate=2, burst=3)
+    start = clock.now
+
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == start
+
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.now == pytest.approx(start + 2)
+
+
+def test_token_bucket_pause(clock):
+    bucket = rate_limit.TokenBucket(rate=100, burst=100)
+    start = clock.now
+
+    bucket.pause(5)
+    bucket.acquire()
+
+    assert clock.now == pytest.approx(start + 5)
+
+
+def test_token_bucket_respects_deadline(clock):
+    bucket = rate_limit.TokenBucket(rate=0.1, burst=1)
+    bucket.acquire()
+    transport.set_deadline(1)
+
+    with pytest.raises(transport.CommandDeadlineExceeded):
+        bucket.acquire()
+
+
+def test_concurrency_backs_off_on_throttling_and_recovers(clock):
+    concurrency = rate_limit.AdaptiveConcurrency(max_limit=8, min_limit=2)
+
+    concurrency.acquire()
+    assert concurrency.release(0.1, congested=True) == "throttled"
+    assert concurrency.limit == 4
+
+    # a burst of 429s from requests already in flight only backs off once
+    concurrency.acquire()
+    clock.sleep(0.01)
+    assert concurrency.release(0.1, congested=True) is None
+    assert concurrency.limit == 4
+
+    for _ in range(3):
+        clock.sleep(1)
+        concurrency.acquire()
+        concurrency.release(0.1, congested=True)
+    assert concurrency.limit == 2  # never below min_concurrency
+
+    for _ in range(20):
+        concurrency.acquire()
+        concurrency.release(0.1, congested=False)
+    assert 5 < concurrency.limit <= 8
+
+
+def test_concurrency_backs_off_on_latency_spike(clock):
+    concurrency = rate_limit.AdaptiveConcurrency(max_limit=8, latency_tolerance=3)
+    for _ in range(10):
+        concurrency.acquire()
+        concurrency.release(0.1, congested=False)
+
+    concurrency.acquire()
+    assert concurrency.release(0.2, congested=False) is None
+    concurrency.acquire()
+    assert concurrency.release(1.0, congested=False) == "slow"
+    assert concurrency.limit == 4
+
+
+def test_limiter_per_endpoint():
+    settings = Settings(
+        endpoint_url="https://proxygen.example",
+        rate_limits={"https://proxygen.example/": {"requests_per_second": 5}},
+    )
+
+    limiter = rate_limit.limiter_for(settings)
+    assert limiter is rate_limit.limiter_for(settings)
+    assert limiter.bucket.rate == 5
+    assert limiter.concurrency.max_limit == 10
+
+    other = Settings(endpoint_url="https://other.example")
+    assert rate_limit.limiter_for(other) is None
+    default = Settings(
+        endpoint_url="https://other.example",
+        rate_limits={"default": {"max_concurrency": 3}},
+    )
+    assert rate_limit.limiter_for(default).bucket is None
+    assert rate_limit.limiter_for(default).concurrency.max_limit == 3
+
+
+def test_session_limits_requests_in_flight():
+    settings = Settings(
+        endpoint_url="https://proxygen.example",
+        rate_limits={"default": {"max_concurrency": 3}},
+    )
+    session = ProxygenSession(settings=settings)
+    lock = threading.Lock()
+    in_flight = {"now": 0, "max": 0}
+
+    def request(*_, **__):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        time.sleep(0.02)
+        with lock:
+            in_flight["now"] -= 1
+        return response(200)
+
+    with patch("requests.Session.request", side_effect=request):
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            list(pool.map(lambda _: session.get("/_status"), range(30)))
+
+    assert in_flight["max"] == 3
+    assert session.limiter.stats["requests"] == 30
+
+
+def test_session_throttled_response_pauses_endpoint():
+    settings = Settings(
+        endpoint_url="https://proxygen.example",
+        rate_limits={"default": {"requests_per_second": 100}},
+        retry_total=0,
+    )
+    session = ProxygenSession(settings=settings)
+
+    with patch(
+        "requests.Session.request",
+        return_value=response(429, {"Retry-After": "30"}),
+    ):
+        assert session.get("/_status").status_code == 429
+
+    assert session.limiter.stats["throttled"] == 1
+    assert session.limiter.stats["backoffs:throttled"] == 1
+    assert session.limiter.bucket.try_acquire() == pytest.approx(30, abs=1)
@@ -0,0 +1,109 @@
+"""
+Tests around retrying transient failures.
+"""
+import io
+from email.utils import formatdate
+from time import time
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from proxygen_cli.lib.retry import RetryPolicy, RetrySession, retry_after
+from proxygen_cli.lib.settings import Settings
+
+URL = "https://mock-proxygen.nhs.uk/apis/mock-api"
+
+
+def make_response(status_code, headers=None):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers.update(headers or {})
+    resp._content = b""
+    resp.raw = io.BytesIO()
+    return resp
+
+
+@pytest.fixture(name="send")
+def send_fixture():
+    """Patch the underlying request with a sequence of outcomes, and sleep."""
+
+    def patched(*outcomes):
+        request = patch("requests.Session.request", side_effect=list(outcomes))
+        sleep = patch("proxygen_cli.lib.retry.sleep")
+        return request, sleep
+
+    yield patched
+
+
+def test_retries_gateway_errors(send):
+    request, sleep = send(make_response(503), make_response(502), make_response(200))
+    session = RetrySession(RetryPolicy(backoff_factor=0.1))
+
+    with request as _request, sleep as _sleep:
+        resp = session.get(URL)
+
+    assert resp.status_code == 200
+    assert _request.call_count == 3
+    assert all(0 <= call.args[0] <= 0.2 for call in _sleep.call_args_list)
+    assert session.retry_stats == {
+        "attempts": 3,
+        "retries": 2,
+        "retries:503": 1,
+        "retries:502": 1,
+    }
+
+
+def test_honours_retry_after(send):
+    request, sleep = send(make_response(429, {"Retry-After": "7"}), make_response(200))
+
+    with request, sleep as _sleep:
+        RetrySession().put(URL, data="{}")
+
+    _sleep.assert_called_once_with(7.0)
+
+
+def test_retries_connection_errors(send):
+    request, sleep = send(requests.exceptions.ConnectionError("reset"), make_response(200))
+    session = RetrySession()
+
+    with request, sleep:
+        assert session.delete(URL).status_code == 200
+    assert session.retry_stats["retries:ConnectionError"] == 1
+
+
+def test_does_not_retry_post(send):
+    request, sleep = send(make_response(503), make_response(200))
+
+    with request as _request, sleep:
+        assert RetrySession().post(URL).status_code == 503
+    assert _request.call_count == 1
+
+
+def test_gives_up_after_total(send):
+    request, sleep = send(*[make_response(503)] * 3)
+
+    with request as _request, sleep:
+        assert RetrySession(RetryPolicy(total=2)).get(URL).status_code == 503
+    assert _request.call_count == 3
+
+
+def test_gives_up_at_deadline(send):
+    request, sleep = send(make_response(503, {"Retry-After": "600"}), make_response(200))
+    session = RetrySession(RetryPolicy(deadline=60))
+
+    with request, sleep as _sleep:
+        assert session.get(URL).status_code == 503
+    _sleep.assert_not_called()
+    assert session.retry_stats["deadline_exceeded"] == 1
+
+
+def test_retry_after_http_date():
+    resp = make_response(503, {"Retry-After": formatdate(time() + 30, usegmt=True)})
+    assert 28 <= retry_after(resp) <= 30
+
+
+def test_policy_from_settings():
+    policy = RetryPolicy.from_settings(Settings(retry_total=5, retry_deadline=10))
+    assert (policy.total, policy.deadline) == (5, 10)
+    assert policy.backoff_factor == RetryPolicy().backoff_factor
@@ -0,0 +1,92 @@
+import collections
+import datetime
+import os
+from unittest.mock import patch
+
+import click
+import pytest
+
+from proxygen_cli.lib import spec, spec_cache
+from proxygen_cli.lib.settings import Settings
+
+
+@pytest.fixture(name="spec_tree")
+def spec_tree_fixture(tmp_path):
+    root = tmp_path / "spec.yaml"
+    root.write_text(
+        "openapi: 3.0.0\ninfo:\n  $ref: info.yaml\nx-drop:\n  $ref: info.yaml\n"
+    )
+    (tmp_path / "info.yaml").write_text("title: Cached\nreleased: 2024-01-02\n")
+    # Old enough for the cache to trust unchanged sizes and mtimes
+    for path in tmp_path.glob("*.yaml"):
+        os.utime(path, (1_000_000_000, 1_000_000_000))
+    with patch.object(spec, "SETTINGS", Settings(spec_cache=True)):
+        yield root
+
+
+def _resolve(root, pop_keys=None):
+    stats = collections.Counter()
+    return spec.resolve(root, pop_keys=pop_keys, stats=stats), stats
+
+
+def test_unchanged_tree_is_cached(spec_tree):
+    first, stats = _resolve(spec_tree)
+    assert stats == {"spec_cache_misses": 1, "files_read": 1, "cache_hits": 1}
+
+    second, stats = _resolve(spec_tree)
+    assert stats == {"spec_cache_hits": 1}
+    info = {"title": "Cached", "released": datetime.date(2024, 1, 2)}
+    assert second == first == {"openapi": "3.0.0", "info": info, "x-drop": info}
+    assert second is not first
+
+
+def test_pop_keys_are_part_of_the_key(spec_tree):
+    _resolve(spec_tree)
+    resolved, stats = _resolve(spec_tree, pop_keys=["x-drop"])
+    assert "x-drop" not in resolved
+    assert stats["spec_cache_misses"] == 1
+
+
+def test_changed_ref_file_is_reread(spec_tree):
+    _resolve(spec_tree)
+    (spec_tree.parent / "info.yaml").write_text("title: Changed\n")
+
+    resolved, stats = _resolve(spec_tree)
+
+    assert resolved["info"] == {"title": "Changed"}
+    assert stats["spec_cache_misses"] == 1
+
+
+def test_same_size_rewrite_is_detected(spec_tree):
+    _resolve(spec_tree)
+    info = spec_tree.parent / "info.yaml"
+    info.write_text(info.read_text().replace("Cached", "Edited"))
+
+    resolved, _ = _resolve(spec_tree)
+
+    assert resolved["info"]["title"] == "Edited"
+
+
+def test_touched_file_is_hashed_not_reread(spec_tree):
+    _resolve(spec_tree)
+    os.utime(spec_tree.parent / "info.yaml")
+
+    _, stats = _resolve(spec_tree)
+
+    assert stats == {"spec_cache_hits": 1}
+
+
+def test_deleted_ref_file(spec_tree):
+    _resolve(spec_tree)
+    (spec_tree.parent / "info.yaml").unlink()
+
+    with pytest.raises(click.ClickException, match="Unable to resolve"):
+        _resolve(spec_tree)
+
+
+def test_only_yaml_types_are_unpickled(tmp_path):
+    cache = spec_cache.SpecCache(Settings())
+    cache.store("key", collections.OrderedDict(a=1), [])
+    assert cache.lookup("key") is None
+    cache.store("key", {"a": datetime.datetime(2024, 1, 2, 3, 4)}, [])
+    assert cache.lookup("key") == {"a": datetime.datetime(2024, 1, 2, 3, 4)}
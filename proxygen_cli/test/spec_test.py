@@ -0,0 +1,323 @@
+import collections
+
+import click
+import pytest
+import yaml
+
+from proxygen_cli.lib import spec
+
+
+@pytest.fixture(name="spec_files")
+def spec_files_fixture(tmp_path):
+    """Write {name: document} as YAML files, returning the first one's path."""
+
+    def write(files):
+        for name, document in files.items():
+            path = tmp_path / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(yaml.safe_dump(document))
+        return tmp_path / next(iter(files))
+
+    return write
+
+
+def test_resolve_nested_refs(spec_files):
+    root = spec_files(
+        {
+            "spec.yaml": {
+                "openapi": "3.0.0",
+                "paths": {"/a": {"$ref": "paths/a.yaml"}},
+                "tags": [{"$ref": "tag.yaml"}, {"name": "inline"}],
+                "components": {"schemas": {"B": {"$ref": "#/components/schemas/C"}}},
+            },
+            # Refs in referenced files are relative to the root spec
+            "paths/a.yaml": {"get": {"responses": {"200": {"$ref": "ok.yaml"}}}},
+            "ok.yaml": {"description": "OK", "extra": "x"},
+            "tag.yaml": {"name": "from-file"},
+        }
+    )
+
+    assert spec.resolve(root) == {
+        "openapi": "3.0.0",
+        "paths": {
+            "/a": {"get": {"responses": {"200": {"description": "OK", "extra": "x"}}}}
+        },
+        "tags": [{"name": "from-file"}, {"name": "inline"}],
+        "components": {"schemas": {"B": {"$ref": "#/components/schemas/C"}}},
+    }
+
+
+def test_resolve_replaces_whole_object(spec_files):
+    root = spec_files(
+        {
+            "spec.yaml": {"info": {"$ref": "info.yaml", "ignored": True}},
+            "info.yaml": {"$ref": "real-info.yaml"},
+            "real-info.yaml": {"title": "Real"},
+        }
+    )
+    assert spec.resolve(root) == {"info": {"title": "Real"}}
+
+
+def test_resolve_leaves_remote_refs(spec_files):
+    root = spec_files({"spec.yaml": {"a": {"$ref": "https://example.org/a.yaml"}}})
+    assert spec.resolve(root) == {"a": {"$ref": "https://example.org/a.yaml"}}
+
+
+def test_resolve_pop_keys(spec_files):
+    root = spec_files({"spec.yaml": {"keep": 1, "x-drop": {"$ref": "missing.yaml"}}})
+    assert spec.resolve(root, pop_keys=["x-drop"]) == {"keep": 1}
+
+
+def test_resolve_missing_ref(spec_files):
+    root = spec_files({"spec.yaml": {"paths": {"/a": {"$ref": "missing.yaml"}}}})
+    with pytest.raises(click.ClickException) as e:
+        spec.resolve(root)
+    assert "Unable to resolve $ref" in e.value.message
+    assert "at ['paths', '/a', '$ref']" in e.value.message
+
+
+def test_resolve_circular_ref(spec_files):
+    root = spec_files(
+        {
+            "spec.yaml": {"a": {"$ref": "a.yaml"}},
+            "a.yaml": {"b": {"$ref": "b.yaml"}},
+            "b.yaml": {"a": [{"$ref": "a.yaml"}]},
+        }
+    )
+    with pytest.raises(click.ClickException) as e:
+        spec.resolve(root)
+    assert "Circular $ref" in e.value.message
+    assert "a.yaml at ['a', 'b', 'a', 0, '$ref']" in e.value.message
+
+
+def test_resolve_same_file_twice_is_not_circular(spec_files):
+    root = spec_files(
+        {
+            "spec.yaml": {"a": {"$ref": "s.yaml"}, "b": [{"$ref": "s.yaml"}]},
+            "s.yaml": {"type": "string"},
+        }
+    )
+    resolved = spec.resolve(root)
+    assert resolved == {"a": {"type": "string"}, "b": [{"type": "string"}]}
+    assert resolved["a"] is not resolved["b"][0]
+
+
+def test_resolve_reads_each_file_once(spec_files):
+    root = spec_files(
+        {
+            "spec.yaml": {
+                "paths": {
+                    f"/p{i}": {"get": {"responses": {"400": {"$ref": "error.yaml"}}}}
+                    for i in range(5)
+                },
+                "alias": {"$ref": "alias.yaml"},
+            },
+            "alias.yaml": {"$ref": "error.yaml"},
+            "error.yaml": {"schema": {"$ref": "schema.yaml"}},
+            "schema.yaml": {"type": "object"},
+        }
+    )
+    stats = collections.Counter()
+
+    resolved = spec.resolve(root, stats=stats)
+
+    error = {"schema": {"type": "object"}}
+    assert resolved["alias"] == error
+    assert all(
+        path["get"]["responses"]["400"] == error for path in resolved["paths"].values()
+    )
+    assert stats == {"files_read": 3, "cache_hits": 5}
+
+    # Every ref gets its own copy
+    resolved["paths"]["/p1"]["get"]["responses"]["400"]["schema"]["type"] = "string"
+    assert resolved["paths"]["/p2"]["get"]["responses"]["400"] == error
+
+
+def test_resolve_yaml_anchors(tmp_path):
+    (tmp_path / "s.yaml").write_text("type: string\n")
+    root = tmp_path / "spec.yaml"
+    root.write_text("a: &shared\n  x:\n    $ref: s.yaml\nb: *shared\n")
+    assert spec.resolve(root) == {
+        "a": {"x": {"type": "string"}},
+        "b": {"x": {"type": "string"}},
+    }
+
+
+def test_resolve_long_chain_of_files(spec_files):
+    depth = 300
+    root = spec_files(
+        {
+            "spec.yaml": {"next": {"$ref": "level-0.yaml"}},
+            **{
+                f"level-{i}.yaml": {"level": i, "next": {"$ref": f"level-{i + 1}.yaml"}}
+                for i in range(depth)
+            },
+            f"level-{depth}.yaml": {"level": depth},
+        }
+    )
+
+    resolved = spec.resolve(root)
+
+    for i in range(depth + 1):
+        resolved = resolved["next"]
+        assert resolved["level"] == i
+
+
+def test_resolve_json_ref(spec_files, tmp_path):
+    root = spec_files({"spec.yaml": {"a": {"$ref": "a.json"}, "b": {"$ref": "b.json"}}})
+    # YAML 1.1 reads 1e3 as a string, JSON as a number
+    (tmp_path / "a.json").write_text('{"n": 1e3, "s": "caf\\u00e9"}')
+    # Not JSON, but still valid YAML
+    (tmp_path / "b.json").write_text("# a comment\n{n: 1}\n")
+
+    assert spec.resolve(root) == {"a": {"n": 1000.0, "s": "café"}, "b": {"n": 1}}
+
+
+def test_resolve_invalid_yaml(tmp_path):
+    root = tmp_path / "spec.yaml"
+    root.write_text("paths: [1,\nb")
+
+    with pytest.raises(click.ClickException) as e:
+        spec.resolve(root)
+    assert "expected ',' or ']'" in e.value.message
+    assert "Hint: Spec file is most likely not valid YAML" in e.value.message
+
+
+def test_resolve_pointer_refs(spec_files, tmp_path):
+    root = spec_files(
+        {
+            "spec.yaml": {
+                "paths": {
+                    "/patient": {"$ref": "paths.yaml#/~1patient"},
+                    "/error": {"$ref": "components.yaml#/responses/400"},
+                },
+                "tag": {"$ref": "components.yaml#/tags/1"},
+                "all": {"$ref": "components.yaml#/schemas/a~0b%20c"},
+            },
+            "paths.yaml": {
+                "/patient": {
+                    "get": {"schema": {"$ref": "components.yaml#/schemas/Patient"}}
+                }
+            },
+            "components.yaml": {
+                "schemas": {
+                    "Patient": {
+                        "properties": {
+                            "name": {"$ref": "components.yaml#/schemas/Name"}
+                        }
+                    },
+                    "Name": {"type": "string"},
+                    "a~b c": {"$ref": "paths.yaml"},
+                },
+                "tags": [{"name": "zero"}, {"name": "one"}],
+            },
+        }
+    )
+    # An unquoted YAML key is read as an int
+    with (tmp_path / "components.yaml").open("a") as f:
+        f.write("responses:\n  400:\n    description: Bad request\n")
+    stats = collections.Counter()
+
+    resolved = spec.resolve(root, stats=stats)
+
+    patient = {"properties": {"name": {"type": "string"}}}
+    assert resolved["paths"] == {
+        "/patient": {"get": {"schema": patient}},
+        "/error": {"description": "Bad request"},
+    }
+    assert resolved["tag"] == {"name": "one"}
+    assert resolved["all"] == {"/patient": {"get": {"schema": patient}}}
+    assert stats == {"files_read": 2, "cache_hits": 6}
+
+
+def test_resolve_sibling_refs_relative_to_root(spec_files):
+    root = spec_files(
+        {
+            "spec.yaml": {
+                "paths": {"/a": {"$ref": "schemas/a.yaml"}},
+                "components": {"schemas": {"B": {"type": "string"}}},
+            },
+            # Refers to its sibling by its path from the root spec
+            "schemas/a.yaml": {
+                "sibling": {"$ref": "schemas/b.yaml#/B"},
+                # Left as it is, so refers to the root spec's components
+                "internal": {"$ref": "#/components/schemas/B"},
+            },
+            "schemas/b.yaml": {"B": {"type": "integer"}},
+        }
+    )
+
+    assert spec.resolve(root)["paths"] == {
+        "/a": {
+            "sibling": {"type": "integer"},
+            "internal": {"$ref": "#/components/schemas/B"},
+        }
+    }
+
+
+def test_resolve_sibling_ref_relative_to_referencing_file(spec_files):
+    root = spec_files(
+        {
+            "spec.yaml": {"paths": {"/a": {"$ref": "schemas/a.yaml"}}},
+            "schemas/a.yaml": {"sibling": {"$ref": "b.yaml"}},
+            "schemas/b.yaml": {"type": "integer"},
+        }
+    )
+
+    with pytest.raises(click.ClickException) as e:
+        spec.resolve(root)
+    assert "Unable to resolve $ref" in e.value.message
+    assert "at ['paths', '/a', 'sibling', '$ref']" in e.value.message
+
+
+def test_resolve_missing_pointer(spec_files):
+    root = spec_files(
+        {
+            "spec.yaml": {"a": {"$ref": "c.yaml#/schemas/Missing"}},
+            "c.yaml": {"schemas": {"Name": {"type": "string"}}},
+        }
+    )
+    with pytest.raises(click.ClickException) as e:
+        spec.resolve(root)
+    assert "Unable to resolve $ref" in e.value.message
+    assert "c.yaml#/schemas/Missing at ['a', '$ref']" in e.value.message
+
+
+def test_resolve_invalid_pointer(spec_files):
+    root = spec_files(
+        {"spec.yaml": {"a": {"$ref": "c.yaml#Name"}}, "c.yaml": {"Name": {}}}
+    )
+    with pytest.raises(click.ClickException) as e:
+        spec.resolve(root)
+    message = e.value.message
+    assert "Not a JSON pointer: #Name in $ref c.yaml at ['a', '$ref']" in message
+
+
+@pytest.mark.parametrize(
+    "ref, keys",
+    [
+        # Refers to itself
+        ("c.yaml#/schemas/A", "['a', 'properties', 'self', '$ref']"),
+        # Refers to an object containing it
+        ("c.yaml#/schemas", "['a', 'properties', 'self', '$ref']"),
+        ("c.yaml", "['a', 'properties', 'self', '$ref']"),
+        # Refers to another part of the file, which refers back
+        ("c.yaml#/schemas/B", "['a', 'properties', 'self', 'back', '$ref']"),
+    ],
+)
+def test_resolve_circular_pointer(spec_files, ref, keys):
+    root = spec_files(
+        {
+            "spec.yaml": {"a": {"$ref": "c.yaml#/schemas/A"}},
+            "c.yaml": {
+                "schemas": {
+                    "A": {"properties": {"self": {"$ref": ref}}},
+                    "B": {"back": {"$ref": "c.yaml#/schemas/A"}},
+                }
+            },
+        }
+    )
+    with pytest.raises(click.ClickException) as e:
+        spec.resolve(root)
+    assert "Circular $ref" in e.value.message
+    assert f"at {keys}" in e.value.message
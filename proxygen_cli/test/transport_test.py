@@ -0,0 +1,73 @@
+"""
+Tests around connection pooling, timeouts and the command deadline.
+"""
+from unittest.mock import patch
+
+import pytest
+
+from proxygen_cli.lib import transport
+from proxygen_cli.lib.proxygen_api import ProxygenSession
+from proxygen_cli.lib.settings import Settings
+
+
+@pytest.fixture(autouse=True)
+def reset_deadline():
+    yield
+    transport.set_deadline(None)
+
+
+def test_default_timeouts(patch_request):
+    with patch_request(200, {}) as request:
+        transport.TimeoutSession().get("https://mock-proxygen.nhs.uk/_status")
+
+    assert request.call_args.kwargs["timeout"] == (10, 300)
+
+
+def test_configured_timeouts_and_pool_size(patch_request):
+    settings = Settings(connect_timeout=2, read_timeout=30, http_pool_size=32)
+    session = ProxygenSession(settings=settings)
+
+    with patch_request(200, {}) as request:
+        session.get("/_status")
+
+    assert request.call_args.kwargs["timeout"] == (2, 30)
+    assert session.get_adapter("https://mock-proxygen.nhs.uk")._pool_maxsize == 32
+
+
+def test_explicit_timeout_wins(patch_request):
+    with patch_request(200, {}) as request:
+        transport.TimeoutSession().get("https://mock-proxygen.nhs.uk", timeout=1)
+
+    assert request.call_args.kwargs["timeout"] == 1
+
+
+def test_command_deadline_caps_timeouts(patch_request):
+    transport.set_deadline(5)
+
+    with patch_request(200, {}) as request:
+        transport.TimeoutSession().get("https://mock-proxygen.nhs.uk/_status")
+
+    connect, read = request.call_args.kwargs["timeout"]
+    assert 4 < connect <= 5 and 4 < read <= 5
+
+
+def test_command_deadline_exceeded(patch_request):
+    transport.set_deadline(0)
+
+    with patch_request(200, {}) as request, pytest.raises(
+        transport.CommandDeadlineExceeded
+    ):
+        transport.TimeoutSession().get("https://mock-proxygen.nhs.uk/_status")
+
+    request.assert_not_called()
+
+
+def test_keycloak_requests_have_timeouts(user_credentials, mock_response):
+    with patch(
+        "requests.Session.request", return_value=mock_response("text", {}, 400)
+    ) as request:
+        from proxygen_cli.lib import auth
+
+        auth._get_token_data_from_refresh_token("refresh-token")
+
+    assert request.call_args.kwargs["timeout"] == (10, 300)
@@ -1,6 +1,10 @@
+from unittest.mock import patch
+
+import click
 import pytest
+from click.testing import CliRunner
 
-from proxygen_cli.lib.version import validate_cli_version
+from proxygen_cli.lib.version import NO_VERSION_CACHE_ENV_VAR, validate_cli_version
 
 
 def test_validate_cli_version_success(patch_request):
@@ -23,3 +27,52 @@ def test_validate_cli_version_failure(patch_request):
             str(e.value)
             == "This version proxygen-cli is out-of-date. Please update to 4.0.0"
         )
+
+
+def test_min_version_cached_between_commands(patch_request):
+    mocked_response = {"proxygen_cli": {"min_version": "2.0.5"}}
+    with patch_request(200, mocked_response) as request:
+        validate_cli_version()
+        validate_cli_version()
+
+    assert request.call_count == 1
+
+
+def test_min_version_cache_expires(patch_request):
+    mocked_response = {"proxygen_cli": {"min_version": "2.0.5"}}
+    with patch_request(200, mocked_response) as request, patch(
+        "proxygen_cli.lib.version.SETTINGS.version_check_ttl", 0
+    ):
+        validate_cli_version()
+        validate_cli_version()
+
+    assert request.call_count == 2
+
+
+def test_min_version_cache_opt_out(patch_request, monkeypatch):
+    monkeypatch.setenv(NO_VERSION_CACHE_ENV_VAR, "1")
+    mocked_response = {"proxygen_cli": {"min_version": "2.0.5"}}
+    with patch_request(200, mocked_response) as request:
+        validate_cli_version()
+        validate_cli_version()
+
+    assert request.call_count == 2
+
+
+def test_concurrent_version_check_fails_after_command(patch_request):
+    calls = []
+
+    @click.command()
+    def command():
+        validate_cli_version()
+        calls.append("command ran")
+
+    mocked_response = {"proxygen_cli": {"min_version": "4.0.0"}}
+    with patch_request(200, mocked_response), patch(
+        "proxygen_cli.lib.version.SETTINGS.version_check_mode", "concurrent"
+    ):
+        result = CliRunner().invoke(command)
+
+    assert calls == ["command ran"]
+    assert isinstance(result.exception, RuntimeError)
+    assert "Please update to 4.0.0" in str(result.exception)
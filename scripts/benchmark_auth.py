@@ -0,0 +1,110 @@
+"""
+Time the token flows in lib/auth.py against the local mock Keycloak
+server: user logins, refreshes, machine logins with a client assertion,
+and access_token() served from the in-process memo and the token cache.
+
+    python scripts/benchmark_auth.py [--latency 0.02] [--logins 20]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+# Keep the token cache out of the real ~/.proxygen
+os.environ["HOME"] = tempfile.mkdtemp()
+
+import yaml  # noqa: E402
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+
+from proxygen_cli.lib import auth, dot_proxygen  # noqa: E402
+from proxygen_cli.lib.credentials import Credentials  # noqa: E402
+from proxygen_cli.lib.mock_keycloak import (  # noqa: E402
+    MockKeycloakConfig,
+    MockKeycloakServer,
+)
+
+
+def timed(name, n, func):
+    started = time.perf_counter()
+    for _ in range(n):
+        func()
+    seconds = time.perf_counter() - started
+    print(f"{name:<32} {seconds / n * 1000:8.2f} ms  {n / seconds:10.1f} /s")
+
+
+def machine_credentials(base_url, key):
+    key_file = dot_proxygen.directory() / "benchmark.key"
+    key_file.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return Credentials(
+        base_url=base_url,
+        client_id="benchmark-machine",
+        private_key_path=str(key_file),
+        key_id="benchmark-kid",
+    )
+
+
+def main(latency, n):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    config = MockKeycloakConfig(
+        latency=latency,
+        users={"benchmark-user": "benchmark-password"},
+        client_keys={"benchmark-machine": key.public_key()},
+    )
+    with MockKeycloakServer(config=config) as server:
+        server.start()
+        user = {
+            "base_url": server.realm_url,
+            "client_id": "benchmark-client",
+            "client_secret": "benchmark-secret",
+            "username": "benchmark-user",
+            "password": "benchmark-password",
+        }
+        credentials = Credentials(**user)
+        refresh_token = auth._get_token_data_from_user_login(credentials)[
+            "refresh_token"
+        ]
+        machine = machine_credentials(server.realm_url, key)
+
+        timed(
+            "user login",
+            n,
+            lambda: auth._get_token_data_from_user_login(credentials),
+        )
+        timed(
+            "refresh",
+            n,
+            lambda: auth._get_token_data_from_refresh_token(
+                refresh_token, credentials
+            ),
+        )
+        timed(
+            "machine login",
+            n,
+            lambda: auth._get_token_data_from_machine_user(machine),
+        )
+
+        dot_proxygen.credentials_file().write_text(yaml.safe_dump(user))
+        auth.access_token()  # log in once and fill the token cache
+        timed("access_token, memo", n * 100, auth.access_token)
+
+        def from_token_cache():
+            auth.clear_token_memo()
+            auth.access_token()
+
+        timed("access_token, token cache", n * 10, from_token_cache)
+        print(f"server stats: {server.stats_snapshot()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--logins", type=int, default=20)
+    args = parser.parse_args()
+    main(args.latency, args.logins)
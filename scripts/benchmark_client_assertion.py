@@ -0,0 +1,67 @@
+"""
+Compare the cost of signing a machine user client assertion when the
+private key PEM is re-read and re-parsed for every login (the old
+behaviour) against reusing the parsed key object.
+
+    python scripts/benchmark_client_assertion.py [--key-size 4096] [--logins 20]
+"""
+import argparse
+import pathlib
+import tempfile
+import timeit
+import uuid
+from time import time
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from proxygen_cli.lib.credentials import load_private_key
+
+
+def _claims():
+    return {
+        "sub": "benchmark-client",
+        "iss": "benchmark-client",
+        "jti": str(uuid.uuid4()),
+        "aud": "https://identity.example/realms/api-producers",
+        "exp": int(time()) + 300,
+    }
+
+
+def sign_from_pem(key_file: pathlib.Path):
+    with key_file.open() as f:
+        pem = f.read()
+    return jwt.encode(_claims(), pem, algorithm="RS512", headers={"kid": "kid"})
+
+
+def sign_from_cached_key(key_file: pathlib.Path):
+    key = load_private_key(key_file)
+    return jwt.encode(_claims(), key, algorithm="RS512", headers={"kid": "kid"})
+
+
+def main(key_size, logins):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        key_file = pathlib.Path(tmp_dir, "private_key.pem")
+        key_file.write_bytes(pem)
+
+        for name, func in [
+            ("re-parse PEM per login", sign_from_pem),
+            ("cached key object", sign_from_cached_key),
+        ]:
+            seconds = timeit.timeit(lambda: func(key_file), number=logins)
+            print(f"{name:<24} {seconds / logins * 1000:8.2f} ms per assertion")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--key-size", type=int, default=4096)
+    parser.add_argument("--logins", type=int, default=20)
+    args = parser.parse_args()
+    main(args.key_size, args.logins)
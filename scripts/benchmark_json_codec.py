@@ -0,0 +1,92 @@
+"""
+Compare the JSON backends in proxygen_cli.lib.codec on generated specs
+shaped like resolved proxygen specs: many paths, each with parameters,
+inline schemas and examples.
+
+    python scripts/benchmark_json_codec.py [--paths 200 2000] [--repeat 5]
+"""
+import argparse
+import datetime
+import timeit
+
+from proxygen_cli.lib import codec
+
+
+def make_spec(n_paths):
+    schema = {
+        "type": "object",
+        "required": ["id", "status"],
+        "properties": {
+            "id": {"type": "string", "format": "uuid"},
+            "status": {"type": "string", "enum": ["active", "inactive"]},
+            "created": {"type": "string", "format": "date-time"},
+            "items": {
+                "type": "array",
+                "items": {"type": "object", "properties": {"n": {"type": "integer"}}},
+            },
+        },
+    }
+    paths = {}
+    for i in range(n_paths):
+        paths[f"/resource-{i}/{{id}}"] = {
+            "get": {
+                "operationId": f"get-resource-{i}",
+                "summary": f"Get resource {i}",
+                "parameters": [
+                    {
+                        "name": "id",
+                        "in": "path",
+                        "required": True,
+                        "schema": {"type": "string"},
+                    }
+                ],
+                "responses": {
+                    "200": {
+                        "description": "OK",
+                        "content": {
+                            "application/json": {
+                                "schema": schema,
+                                "example": {
+                                    "id": "b1c2d3",
+                                    "status": "active",
+                                    "created": datetime.datetime(2023, 1, 2, 3, 4, 5),
+                                    "items": [{"n": n} for n in range(10)],
+                                },
+                            }
+                        },
+                    }
+                },
+            }
+        }
+    return {
+        "openapi": "3.0.0",
+        "info": {"title": "Benchmark", "version": "1.0.0"},
+        "x-nhsd-apim": {"target": {"url": "https://example.org", "rate": 1.5}},
+        "paths": paths,
+    }
+
+
+def main(sizes, repeat):
+    for n_paths in sizes:
+        spec = make_spec(n_paths)
+        text = codec.dumps(spec, backend="json")
+        print(f"{n_paths} paths, {len(text) / 1024:.0f}KiB compact")
+        for backend in ["json", "orjson"]:
+            if backend == "orjson" and codec.orjson is None:
+                print("  orjson not installed")
+                continue
+            for name, func in [
+                ("dumps", lambda: codec.dumps(spec, backend=backend)),
+                ("dumps indent", lambda: codec.dumps(spec, True, backend)),
+                ("loads", lambda: codec.loads(text, backend=backend)),
+            ]:
+                seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+                print(f"  {backend:<7} {name:<13} {seconds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--paths", type=int, nargs="+", default=[200, 2000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.paths, args.repeat)
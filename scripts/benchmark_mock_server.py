@@ -0,0 +1,82 @@
+"""
+Time proxygen_api end to end against the local mock proxygen server:
+sequential requests, concurrent requests through AsyncProxygenClient, and
+repeated reads through the ETag response cache.
+
+    python scripts/benchmark_mock_server.py [--latency 0.05] [--requests 50]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# Keep the response cache out of the real ~/.proxygen
+os.environ["HOME"] = tempfile.mkdtemp()
+
+from proxygen_cli.lib import proxygen_api  # noqa: E402
+from proxygen_cli.lib.mock_server import (  # noqa: E402
+    MockProxygenServer,
+    MockServerConfig,
+)
+from proxygen_cli.lib.proxygen_api_async import AsyncProxygenClient  # noqa: E402
+from proxygen_cli.lib.settings import Settings  # noqa: E402
+
+API = "benchmark-api"
+ENV = "internal-dev"
+SPEC = {"openapi": "3.0.0", "paths": {f"/p{i}": {"get": {}} for i in range(2000)}}
+
+
+def use_settings(url, **settings):
+    proxygen_api.SETTINGS = Settings(endpoint_url=url, **settings)
+    proxygen_api._PROXYGEN_SESSION = None
+
+
+def timed(name, n, func):
+    started = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - started
+    print(f"{name:<32} {seconds:7.2f}s  {n / seconds:8.1f} req/s")
+
+
+async def concurrent_gets(n, connections):
+    async with AsyncProxygenClient(max_connections=connections) as client:
+        await asyncio.gather(
+            *(client.get_instance(API, ENV, f"instance-{i % 10}") for i in range(n))
+        )
+
+
+def main(latency, n):
+    proxygen_api.access_token = lambda: "benchmark-token"
+    proxygen_api.cache_key = lambda: "benchmark-credentials"
+    config = MockServerConfig(latency=latency)
+    with MockProxygenServer(config=config) as server:
+        server.start()
+        use_settings(server.url)
+        for i in range(10):
+            proxygen_api.put_instance(API, ENV, f"instance-{i}", SPEC)
+
+        def sequential():
+            for i in range(n):
+                proxygen_api.get_instance(API, ENV, f"instance-{i % 10}")
+
+        timed("sequential", n, sequential)
+        for connections in (5, 20):
+            timed(
+                f"async, {connections} connections",
+                n,
+                lambda: asyncio.run(concurrent_gets(n, connections)),
+            )
+
+        use_settings(server.url, http_cache=True)
+        sequential()  # fill the cache
+        timed("sequential, ETag cache", n, sequential)
+        print(f"server stats: {dict(server.stats)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    main(args.latency, args.requests)
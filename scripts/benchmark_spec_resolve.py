@@ -0,0 +1,249 @@
+"""
+Compare spec.resolve against the resolver it replaced, which rescanned
+the whole spec for file $refs until none were left, re-walked from the
+root to substitute each one, and parsed a file again for every ref to
+it. Specs are generated on disk in two shapes: wide (many paths, each
+referencing a few schema files) and deep (chains of files referencing
+the next). "refs only" times the walk and substitution with every file
+already parsed, since YAML parsing otherwise dominates. "spec cache hit" resolves an unchanged tree through
+the spec_cache setting. "schemas" compares the same schemas as one file
+per schema and as one shared components file with file#/pointer refs,
+which the legacy resolver cannot follow.
+
+    python scripts/benchmark_spec_resolve.py [--paths 200 1000] [--depth 50 200]
+        [--schemas 200 1000]
+"""
+import argparse
+import collections
+import copy
+import os
+import pathlib
+import tempfile
+import timeit
+from urllib.parse import urlparse
+
+# Keep the spec cache out of the real ~/.proxygen
+os.environ["HOME"] = tempfile.mkdtemp()
+
+import yaml  # noqa: E402
+
+from proxygen_cli.lib import spec  # noqa: E402
+from proxygen_cli.lib.settings import Settings  # noqa: E402
+
+
+def legacy_inline(resolved, load):
+    def find_file_refs(obj, obj_loc=None):
+        if obj_loc is None:
+            obj_loc = []
+        if isinstance(obj, dict):
+            refs = []
+            for key, value in obj.items():
+                refs = refs + find_file_refs(value, obj_loc + [key])
+            return refs
+        elif isinstance(obj, list):
+            refs = []
+            for index, item in enumerate(obj):
+                refs = refs + find_file_refs(item, obj_loc + [index])
+            return refs
+        elif isinstance(obj, str) and obj_loc and obj_loc[-1] == "$ref":
+            internal_ref = len(obj) > 0 and obj[0] == "#"
+            remote_ref = True if urlparse(obj).scheme else False
+            if not remote_ref and not internal_ref:
+                return [(obj_loc, obj)]
+        return []
+
+    def update_obj(obj, keys, sub_obj):
+        if len(keys) > 1:
+            obj[keys[0]] = update_obj(obj[keys[0]], keys[1:], sub_obj)
+            return obj
+        return sub_obj
+
+    while file_refs := find_file_refs(resolved):
+        for keys, file_ref in file_refs:
+            resolved = update_obj(resolved, keys, load(file_ref))
+    return resolved
+
+
+def _load_file(directory):
+    def load(file_ref):
+        with (directory / file_ref).open() as f:
+            return yaml.safe_load(f.read())
+
+    return load
+
+
+def legacy_resolve(root):
+    load = _load_file(root.parent)
+    return legacy_inline(load(root.name), load)
+
+
+def _preloaded(root):
+    """Loaders returning copies of already parsed files, to time the walk alone."""
+    documents = {
+        path.name: yaml.safe_load(path.read_text())
+        for path in root.parent.glob("*.yaml")
+    }
+
+    def legacy():
+        return legacy_inline(copy.deepcopy(documents[root.name]), load)
+
+    def load(file_ref):
+        return copy.deepcopy(documents[file_ref])
+
+    def single_pass():
+        return spec._inline_file_refs(
+            copy.deepcopy(documents[root.name]), lambda ref, _: ref, load
+        )
+
+    return legacy, single_pass
+
+
+def _write(directory, name, document):
+    (directory / name).write_text(yaml.safe_dump(document))
+
+
+def make_wide(directory, n_paths):
+    for i in range(10):
+        _write(
+            directory,
+            f"schema-{i}.yaml",
+            {
+                "type": "object",
+                "properties": {
+                    f"field{j}": {"type": "string", "maxLength": j} for j in range(20)
+                },
+            },
+        )
+    paths = {
+        f"/resource-{i}": {
+            "get": {
+                "responses": {
+                    str(status): {
+                        "description": "response",
+                        "content": {
+                            "application/json": {
+                                "schema": {"$ref": f"schema-{(i + status) % 10}.yaml"}
+                            }
+                        },
+                    }
+                    for status in (200, 400, 404)
+                }
+            }
+        }
+        for i in range(n_paths)
+    }
+    _write(directory, "spec.yaml", {"openapi": "3.0.0", "paths": paths})
+    return directory / "spec.yaml"
+
+
+def make_deep(directory, depth):
+    for i in range(depth):
+        _write(
+            directory,
+            f"level-{i}.yaml",
+            {
+                "description": f"level {i}",
+                "properties": {f"p{j}": {"type": "integer"} for j in range(10)},
+                "next": {"$ref": f"level-{i + 1}.yaml"} if i + 1 < depth else None,
+            },
+        )
+    _write(directory, "spec.yaml", {"root": {"$ref": "level-0.yaml"}})
+    return directory / "spec.yaml"
+
+
+def _schema(i, ref):
+    properties = {f"field{j}": {"type": "string", "maxLength": j} for j in range(10)}
+    if i:
+        properties["parent"] = {"$ref": ref(i // 2)}
+    return {"type": "object", "properties": properties}
+
+
+def _schema_paths(n_schemas, ref):
+    return {
+        f"/resource-{i}": {"get": {"responses": {"200": {"$ref": ref(i)}}}}
+        for i in range(n_schemas)
+    }
+
+
+def make_split_schemas(directory, n_schemas):
+    def ref(i):
+        return f"schema-{i}.yaml"
+
+    for i in range(n_schemas):
+        _write(directory, ref(i), _schema(i, ref))
+    _write(directory, "spec.yaml", {"paths": _schema_paths(n_schemas, ref)})
+    return directory / "spec.yaml"
+
+
+def make_shared_schemas(directory, n_schemas):
+    def ref(i):
+        return f"components.yaml#/components/schemas/Schema{i}"
+
+    schemas = {f"Schema{i}": _schema(i, ref) for i in range(n_schemas)}
+    _write(directory, "components.yaml", {"components": {"schemas": schemas}})
+    _write(directory, "spec.yaml", {"paths": _schema_paths(n_schemas, ref)})
+    return directory / "spec.yaml"
+
+
+def _time(name, label, func, repeat):
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    print(f"  {name:<12} {label:<24} {seconds * 1000:9.1f} ms")
+
+
+def compare(name, root, repeat):
+    stats = collections.Counter()
+    assert spec.resolve(root, stats=stats) == legacy_resolve(root)
+    print(f"  {name:<12} {stats['files_read']} files read, {stats['cache_hits']} reused")
+    _time(name, "legacy", lambda: legacy_resolve(root), repeat)
+    _time(name, "single pass", lambda: spec.resolve(root), repeat)
+    settings, spec.SETTINGS = spec.SETTINGS, Settings(spec_cache=True)
+    try:
+        spec.resolve(root)  # fill the cache
+        _time(name, "spec cache hit", lambda: spec.resolve(root), repeat)
+    finally:
+        spec.SETTINGS = settings
+    legacy, single_pass = _preloaded(root)
+    _time(name, "legacy, refs only", legacy, repeat)
+    _time(name, "single pass, refs only", single_pass, repeat)
+
+
+def compare_schemas(directory, n_schemas, repeat):
+    (split := directory / f"split-{n_schemas}").mkdir()
+    (shared := directory / f"shared-{n_schemas}").mkdir()
+    split_root = make_split_schemas(split, n_schemas)
+    shared_root = make_shared_schemas(shared, n_schemas)
+    name = f"schemas {n_schemas}"
+    layouts = {"one file each": split_root, "shared file": shared_root}
+    for label, root in layouts.items():
+        stats = collections.Counter()
+        spec.resolve(root, stats=stats)
+        print(
+            f"  {name:<12} {label}: {stats['files_read']} files read, "
+            f"{stats['cache_hits']} reused"
+        )
+    assert spec.resolve(split_root) == spec.resolve(shared_root)
+    _time(name, "one file each", lambda: spec.resolve(split_root), repeat)
+    _time(name, "shared file", lambda: spec.resolve(shared_root), repeat)
+
+
+def main(path_counts, depths, schema_counts, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        for n_paths in path_counts:
+            (wide := directory / f"wide-{n_paths}").mkdir()
+            compare(f"wide {n_paths}", make_wide(wide, n_paths), repeat)
+        for depth in depths:
+            (deep := directory / f"deep-{depth}").mkdir()
+            compare(f"deep {depth}", make_deep(deep, depth), repeat)
+        for n_schemas in schema_counts:
+            compare_schemas(directory, n_schemas, repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--paths", type=int, nargs="+", default=[200, 1000])
+    parser.add_argument("--depth", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--schemas", type=int, nargs="+", default=[200, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.paths, args.depth, args.schemas, args.repeat)
@@ -0,0 +1,97 @@
+"""
+Time large spec uploads: encoding the body with iterencode, as JsonBody
+once did, in one go with json.dumps, and with JsonBody, which encodes a
+path item at a time, with the peak memory each takes beyond the spec
+itself, and put_spec end to end against the local mock proxygen server,
+uncompressed and gzipped.
+
+    python scripts/benchmark_upload.py [--paths 2000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import tempfile
+import timeit
+import tracemalloc
+
+# Keep caches out of the real ~/.proxygen
+os.environ["HOME"] = tempfile.mkdtemp()
+
+from benchmark_json_codec import make_spec  # noqa: E402
+from proxygen_cli.lib import proxygen_api  # noqa: E402
+from proxygen_cli.lib.mock_server import MockProxygenServer  # noqa: E402
+from proxygen_cli.lib.settings import Settings  # noqa: E402
+from proxygen_cli.lib.streaming import CHUNK_SIZE, JsonBody  # noqa: E402
+
+
+def iterencode_chunks(content):
+    """The body as JsonBody produced it at first, encoding piece by piece."""
+    pending, size = [], 0
+    for piece in json.JSONEncoder(default=str).iterencode(content):
+        pending.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield "".join(pending).encode()
+            pending, size = [], 0
+    if pending:
+        yield "".join(pending).encode()
+
+
+def _peak(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _time(name, func, repeat, peak=True):
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    line = f"  {name:<28} {seconds * 1000:9.1f} ms"
+    if peak:
+        line += f" {_peak(func) / 1024 / 1024:9.2f}MiB peak"
+    print(line)
+
+
+def _send(chunks):
+    for _ in chunks:
+        pass
+
+
+def main(n_paths, repeat):
+    document = make_spec(n_paths)
+    size = sum(len(chunk) for chunk in JsonBody(document))
+    print(f"{n_paths} paths, {size / 1024 / 1024:.2f}MiB of JSON")
+    _time("encode, iterencode", lambda: _send(iterencode_chunks(document)), repeat)
+    _time(
+        "encode, json.dumps",
+        lambda: json.dumps(document, default=str).encode(),
+        repeat,
+    )
+    _time("encode, JsonBody", lambda: _send(JsonBody(document)), repeat)
+    _time("gzip, JsonBody", lambda: _send(JsonBody(document, compress=True)), repeat)
+
+    proxygen_api.access_token = lambda: "benchmark-token"
+    proxygen_api.cache_key = lambda: "benchmark-credentials"
+    with MockProxygenServer() as server:
+        server.start()
+        for compress in (False, True):
+            proxygen_api.SETTINGS = Settings(
+                endpoint_url=server.url, compress_uploads=compress
+            )
+            proxygen_api._PROXYGEN_SESSION = None
+            _time(
+                f"put_spec, {'gzipped' if compress else 'uncompressed'}",
+                lambda: proxygen_api.put_spec("benchmark-api", document),
+                repeat,
+                peak=False,
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--paths", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.paths, args.repeat)
@@ -0,0 +1,48 @@
+"""
+Compare PyYAML's pure Python loader and dumper with the libyaml-backed
+ones spec.py and output.py use when PyYAML is built with libyaml, on
+generated specs shaped like resolved proxygen specs.
+
+    python scripts/benchmark_yaml.py [--paths 200 2000] [--repeat 5]
+"""
+import argparse
+import timeit
+
+import yaml
+
+from benchmark_json_codec import make_spec
+from proxygen_cli.lib import output, spec
+
+
+class PythonDumper(yaml.SafeDumper):
+    pass
+
+
+PythonDumper.add_representer(str, output.yaml_multiline_string_pipe)
+
+
+def main(sizes, repeat):
+    print(f"libyaml: {yaml.__with_libyaml__}")
+    for n_paths in sizes:
+        document = make_spec(n_paths)
+        text = output.to_yaml(document)
+        print(f"{n_paths} paths, {len(text) / 1024:.0f}KiB of YAML")
+        for name, func in [
+            ("load, SafeLoader", lambda: yaml.load(text, Loader=yaml.SafeLoader)),
+            (f"load, {spec.YAML_LOADER.__name__}", lambda: spec.load_yaml(text)),
+            ("dump, SafeDumper", lambda: yaml.dump(document, Dumper=PythonDumper)),
+            (
+                f"dump, {output.SpecDumper.__bases__[0].__name__}",
+                lambda: output.to_yaml(document),
+            ),
+        ]:
+            seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+            print(f"  {name:<20} {seconds * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--paths", type=int, nargs="+", default=[200, 2000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.paths, args.repeat)